@@ -0,0 +1,78 @@
+"""
+Cold start benchmark for the geneticML CLI.
+
+Imports `main` under `python -X importtime` and fails if the cumulative import
+time exceeds the budget or if any of the heavy model dependencies were loaded
+eagerly.
+
+Usage:
+    python benchmarks/startup_time.py [--budget-ms 300] [--runs 5]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "geneticML")
+
+# Modules that must only be imported when the first model call or token count happens
+LAZY_MODULES = ("taxonomyml", "tiktoken", "numba", "openai")
+
+
+def measure_import(module: str = "main") -> dict:
+    """
+    Import a module in a fresh interpreter and parse the -X importtime report.
+
+    Returns:
+    dict: Top-level module name to cumulative import time in microseconds.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SOURCE_DIR,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr}")
+
+    timings = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[12:].split("|")]
+        timings[name] = int(cumulative)
+    return timings
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=300.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = []
+    eager = set()
+    for _ in range(args.runs):
+        timings = measure_import()
+        samples.append(timings["main"] / 1000)
+        eager.update(
+            name for name in timings if name.split(".")[0] in LAZY_MODULES
+        )
+
+    best = min(samples)
+    print(f"main import: best {best:.1f} ms over {args.runs} runs (budget {args.budget_ms:.1f} ms)")
+
+    failed = False
+    if eager:
+        print(f"Heavy modules imported at startup: {', '.join(sorted(eager))}")
+        failed = True
+    if best > args.budget_ms:
+        print("Cold start exceeds the budget.")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
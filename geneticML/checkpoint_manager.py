@@ -0,0 +1,218 @@
+"""
+List, diff and restore the checkpoints of the session.
+
+Every evaluated state of the dynamic folder is stored as a checkpoint with
+its score and outcome, see `code_manager.objective_is_met`.
+
+    python geneticML/checkpoint_manager.py list
+    python geneticML/checkpoint_manager.py diff 12        # checkpoint 12 against the current files
+    python geneticML/checkpoint_manager.py diff 12 15
+    python geneticML/checkpoint_manager.py restore 12
+"""
+import sys
+import argparse
+from loguru import logger
+from typing import Dict, List, Tuple, Union
+
+from session_manager import (
+    get_session,
+    get_session_suite,
+    get_session_performance,
+    get_checkpoints,
+    get_checkpoint,
+    get_checkpoint_files,
+    read_session_config,
+    update_change_log,
+    update_dynamic_files,
+    update_session_fields,
+    flush_session,
+)
+from code_manager import evaluate_files
+from utils.blob_store import content_hash
+from utils.patching import make_diff
+from utils.workspace import get_workspace
+
+REVERT_NOTE = (
+    "The last {count} changes did not improve on checkpoint {checkpoint} "
+    "(score {score:.3f}), so the code was reverted to it. The last program "
+    "result is that checkpoint's. Take a different approach than the reverted changes."
+)
+
+
+def load_checkpoint(checkpoint_id: int) -> Tuple[Dict, Dict[str, str]]:
+    """
+    Return a checkpoint and its files.
+
+    Raises:
+    KeyError: If there is no such checkpoint.
+    """
+    checkpoint = get_checkpoint(checkpoint_id)
+    if not checkpoint:
+        raise KeyError(f"No checkpoint {checkpoint_id}.")
+    return checkpoint, get_checkpoint_files(checkpoint)
+
+
+def is_current(checkpoint: Dict) -> bool:
+    """
+    Whether the dynamic folder holds exactly the files of a checkpoint.
+    """
+    workspace = get_workspace()
+    return checkpoint["files"] == {
+        file_path: workspace.get(file_path).hash for file_path in workspace.paths()
+    }
+
+
+def restore_checkpoint(checkpoint_id: int, reason: str = "restore") -> Dict[str, str]:
+    """
+    Replace the files of the dynamic folder with those of a checkpoint and
+    record the changes in the change log.
+
+    Returns:
+    Dict[str, str]: The restored files.
+    """
+    checkpoint, files = load_checkpoint(checkpoint_id)
+    workspace = get_workspace()
+    current = workspace.contents()
+    functionality = f"{reason}: checkpoint {checkpoint_id}"
+
+    for file_path in current:
+        if file_path not in files:
+            update_change_log(file_path, None, action="delete", functionality=functionality)
+    for file_path, code in files.items():
+        if current.get(file_path) != code:
+            update_change_log(
+                file_path,
+                code,
+                action="edit" if file_path in current else "create",
+                functionality=functionality,
+                diff=make_diff(current.get(file_path, ""), code, file_path),
+            )
+
+    workspace.replace(files)
+    workspace.materialize()
+    update_dynamic_files()
+    update_session_fields(stale_iterations=0)
+    logger.info(
+        f"Restored checkpoint {checkpoint_id} (score {checkpoint.get('score', 0.0):.3f})."
+    )
+    return files
+
+
+def revert_to_best_checkpoint(
+    revert_after: int,
+) -> Union[Tuple[bool, Union[str, None], Union[str, None]], None]:
+    """
+    Revert to the best-scoring checkpoint once `revert_after` iterations in a
+    row have not improved on it, so the next change builds on the best code
+    instead of on a regression.
+
+    Returns:
+    Tuple containing whether the objective is met, the result and the error
+    of the restored checkpoint, like `objective_is_met`, or None when nothing
+    was reverted.
+    """
+    config_data = read_session_config()
+    stale = config_data.get("stale_iterations", 0)
+    best_id = config_data.get("best_checkpoint")
+    if not revert_after or stale < revert_after or best_id is None:
+        return None
+
+    checkpoint = get_checkpoint(best_id)
+    if not checkpoint or is_current(checkpoint):
+        update_session_fields(stale_iterations=0)
+        return None
+
+    logger.warning(
+        f"No improvement in {stale} iterations. Reverting to checkpoint {best_id}."
+    )
+    files = restore_checkpoint(best_id, reason="revert to best")
+
+    # The evaluation of the checkpoint is served from the evaluation cache
+    _, expected_result, _ = get_session()
+    _, _, (met, output, error, score) = evaluate_files(
+        files,
+        expected_result,
+        get_session_suite(),
+        performance=get_session_performance(),
+    )
+    note = REVERT_NOTE.format(count=stale, checkpoint=best_id, score=score)
+    return met, output, f"{error}\n\n{note}" if error else note
+
+
+def format_checkpoints(checkpoints: List[Dict]) -> str:
+    """
+    Describe checkpoints one per line, marking the best and the current one.
+    """
+    if not checkpoints:
+        return "No checkpoints yet."
+
+    best_id = read_session_config().get("best_checkpoint")
+    lines = [f"{'id':>5}  {'time':19}  {'score':>6}  {'outcome':12}  files"]
+    for checkpoint in checkpoints:
+        marks = []
+        if checkpoint["id"] == best_id:
+            marks.append("best")
+        if is_current(checkpoint):
+            marks.append("current")
+        lines.append(
+            f"{checkpoint['id']:>5}  {checkpoint['timestamp']:19}  "
+            f"{checkpoint.get('score', 0.0):>6.3f}  {checkpoint.get('outcome', ''):12}  "
+            f"{len(checkpoint['files'])}"
+            + (f"  ({', '.join(marks)})" if marks else "")
+        )
+    return "\n".join(lines)
+
+
+def diff_checkpoints(old_id: int, new_id: int = None) -> str:
+    """
+    Return a unified diff from one checkpoint to another, or to the current
+    files of the dynamic folder.
+    """
+    _, old_files = load_checkpoint(old_id)
+    if new_id is None:
+        new_files = get_workspace().contents()
+    else:
+        _, new_files = load_checkpoint(new_id)
+
+    diffs = []
+    for file_path in sorted(set(old_files) | set(new_files)):
+        old_code = old_files.get(file_path, "")
+        new_code = new_files.get(file_path, "")
+        if content_hash(old_code) != content_hash(new_code):
+            diffs.append(make_diff(old_code, new_code, file_path))
+    return "".join(diffs)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="List, diff and restore checkpoints.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the checkpoints with their scores.")
+    diff_parser = commands.add_parser("diff", help="Show the changes between checkpoints.")
+    diff_parser.add_argument("old", type=int)
+    diff_parser.add_argument(
+        "new", type=int, nargs="?", help="Defaults to the current files of the dynamic folder."
+    )
+    restore_parser = commands.add_parser("restore", help="Restore the files of a checkpoint.")
+    restore_parser.add_argument("id", type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            print(format_checkpoints(get_checkpoints()))
+        elif args.command == "diff":
+            changes = diff_checkpoints(args.old, args.new)
+            if changes:
+                print(changes, end="")
+            else:
+                print("No differences.")
+        else:
+            restore_checkpoint(args.id)
+            flush_session()
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
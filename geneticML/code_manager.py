@@ -1,38 +1,158 @@
 import os
+import re
+import ast
 import json
-import subprocess
+import time
+import asyncio
+import hashlib
 from loguru import logger
-from typing import Union, Tuple
+from typing import Callable, Dict, Set, Union, Tuple
 
 from session_manager import (
     update_dynamic_files,
     read_session_config,
     get_session,
+    get_session_suite,
+    get_session_performance,
     get_last_run_log_entry,
     get_last_change_log_entry,
     update_run_log,
     update_change_log,
+    pin_best_code,
+    update_session_fields,
+    record_checkpoint,
+)
+from taxonomyml_interface import get_code, get_code_async
+from fitness import score_run
+from suite_manager import run_suite, grade_suite, suite_hash, case_inputs
+from performance import (
+    BENCHMARK_HARNESS,
+    benchmark_config,
+    benchmark_limits,
+    parse_benchmark,
+    performance_score,
+    format_benchmark,
+)
+from environment_manager import candidate_python, get_session_environment
+from dependency_manager import (
+    check_and_install_dependencies,
+    get_code_dependencies,
+    local_module_names,
 )
-from taxonomyml_interface import get_code
-from dependency_manager import check_and_install_dependencies, get_code_dependencies
 from utils.file_operations import (
-    read_file,
-    write_file,
     make_directory,
     delete_directory,
-    list_files,
-    delete_file,
+    create_scratch_workspace,
+)
+from utils.workspace import get_workspace
+from utils.metrics import instrument, add_to_span
+
+from utils.patching import PatchError, apply_patch, make_diff
+from utils.fingerprint import workspace_fingerprint
+from utils.evaluation_cache import EvaluationCache
+from utils.worker_pool import WorkerPool, WorkerError, fork_supported
+from utils.sandbox import RunGroup, run_sandboxed, candidate_command
+from utils.constants import (
+    DYNAMIC_FOLDER,
+    DYNAMIC_MAIN,
+    STATE_FOLDER,
+    EVALUATION_CACHE,
+    EVALUATION_CACHE_TTL,
+    EDIT_MODE,
+    PATCH_FUZZY_THRESHOLD,
+    WARM_WORKER_COUNT,
+    RUN_LIMITS,
 )
-
-from utils.constants import DYNAMIC_FOLDER, DYNAMIC_MAIN
 from utils.prompts import (
     OUTLINE_PROMPT,
     FILE_PROMPT,
     IMPROVE_PROMPT,
+    PATCH_PROMPT,
     CREATE_PROMPT,
     build_action_selection_prompt,
+    format_prompt,
+    format_score,
+    render_repo_map,
+    SELECT_AND_EDIT_INSTRUCTIONS,
 )
 
+REPEATED_ATTEMPT_NOTE = (
+    "This code is equivalent to an earlier attempt (ignoring formatting, comments "
+    "and docstrings) and produced the same outcome. Take a different approach."
+)
+
+# Runs that fail on a missing module are not cached, the module may be installed next
+IMPORT_ERROR_PATTERN = re.compile(r"\b(?:ModuleNotFoundError|ImportError)\b")
+
+# Run candidates in forks of pre-warmed interpreters ("on") or in cold processes ("off")
+WARM_WORKERS = os.environ.get("GENETICML_WARM_WORKERS", "on").lower() != "off"
+
+_evaluation_cache = None
+_worker_pool = None
+
+
+def get_evaluation_cache() -> EvaluationCache:
+    """
+    Return the evaluation cache, opening it on first use.
+    """
+    global _evaluation_cache
+    if _evaluation_cache is None:
+        _evaluation_cache = EvaluationCache(
+            os.path.join(STATE_FOLDER, EVALUATION_CACHE), EVALUATION_CACHE_TTL
+        )
+    return _evaluation_cache
+
+
+def get_worker_pool() -> Union[WorkerPool, None]:
+    """
+    Return the warm worker pool, or None when warm workers are off or the
+    platform cannot fork.
+    """
+    global _worker_pool
+    if _worker_pool is None and WARM_WORKERS and fork_supported():
+        _worker_pool = WorkerPool(WARM_WORKER_COUNT, candidate_python())
+    return _worker_pool
+
+
+def evaluation_key(files: Dict[str, str], *parts: str) -> str:
+    """
+    Key of a run of a workspace in the evaluation cache.
+
+    Besides the workspace fingerprint, the key covers the interpreter and
+    installed packages of the session environment, the run limits and
+    `parts`, such as the suite or the benchmark configuration.
+    """
+    digest = hashlib.sha256(get_session_environment().fingerprint().encode("utf-8"))
+    for part in (json.dumps(RUN_LIMITS, sort_keys=True), *parts):
+        digest.update(b"\0")
+        digest.update(part.encode("utf-8"))
+    return f"{workspace_fingerprint(files)}:{digest.hexdigest()}"
+
+
+def is_cacheable(evaluation: Dict) -> bool:
+    """
+    Whether a run, or every case of a suite run, may be answered from the
+    evaluation cache. Runs stopped by a limit depend on the load of the
+    machine, and runs that failed to import a module on what is installed.
+    """
+    runs = evaluation["cases"] if "cases" in evaluation else [evaluation]
+    return not any(
+        run.get("limit") or IMPORT_ERROR_PATTERN.search(run.get("error") or "")
+        for run in runs
+    )
+
+
+def workspace_dependencies(files: Dict[str, str]) -> Set[str]:
+    """
+    Return the third-party and standard library modules a workspace imports.
+    """
+    local = local_module_names(files)
+    dependencies = set()
+    for file_path, code in files.items():
+        if file_path.endswith(".py"):
+            dependencies.update(get_code_dependencies(code, local, include_stdlib=True))
+    return dependencies
+
 
 def ensure_dynamic_directory() -> None:
     """
@@ -45,7 +165,7 @@ def delete_dynamic_directory() -> None:
     """
     Delete the dynamic directory if it exists.
     """
-    delete_directory(DYNAMIC_FOLDER)
+    get_workspace().clear()
 
 
 def create_outline_and_files(objective: str) -> None:
@@ -55,7 +175,7 @@ def create_outline_and_files(objective: str) -> None:
     """
 
     # Generate a prompt to ask the language model for the necessary files and functionalities
-    prompt = OUTLINE_PROMPT.format(objective=objective, DYNAMIC_MAIN=DYNAMIC_MAIN)
+    prompt = format_prompt(OUTLINE_PROMPT, objective=objective, DYNAMIC_MAIN=DYNAMIC_MAIN)
 
     # Get the outline response from the language model
     outline_response = get_code(prompt, response_type="json")
@@ -74,7 +194,7 @@ def create_outline_and_files(objective: str) -> None:
 
     for filename, functionality in code_outline.items():
         # Generate a prompt to ask the language model to generate code for each file
-        prompt = FILE_PROMPT.format(filename=filename, functionality=functionality)
+        prompt = format_prompt(FILE_PROMPT, filename=filename, functionality=functionality)
 
         # Get the code from the language model
         code_response = get_code(prompt, response_type="json")
@@ -88,14 +208,16 @@ def create_outline_and_files(objective: str) -> None:
             )
             continue
 
-        dependencies = get_code_dependencies(generated_code)
+        dependencies = get_code_dependencies(
+            generated_code, local_module_names(code_outline)
+        )
 
         if dependencies:
             check_and_install_dependencies(dependencies)
 
         # Save the generated code to the dynamic folder
         file_path = os.path.join(DYNAMIC_FOLDER, filename)
-        write_file(file_path, generated_code)
+        get_workspace().write(file_path, generated_code)
         update_change_log(
             file_path, generated_code, action="create", functionality=functionality
         )
@@ -114,7 +236,7 @@ def initialize_dynamic_main():
 
     dynamic_main_path = os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN)
 
-    if not os.path.exists(dynamic_main_path):
+    if not get_workspace().exists(dynamic_main_path):
         file_contents = """def main():
             try:
                 return "Hello from dynamic_main.py"
@@ -123,7 +245,7 @@ def initialize_dynamic_main():
 
         if __name__ == '__main__':
             main()"""
-        write_file(dynamic_main_path, file_contents)
+        get_workspace().write(dynamic_main_path, file_contents)
         logger.info(f"Initialized {dynamic_main_path}")
     else:
         logger.info(f"Found {dynamic_main_path}")
@@ -135,18 +257,19 @@ def get_code_content_and_main_file():
     """
     ensure_dynamic_directory()  # Ensure the directory exists
 
-    code_files = list_files(DYNAMIC_FOLDER)
+    workspace = get_workspace()
 
-    if len(code_files) == 0:
+    if len(workspace.paths()) == 0:
         return None, None  # No Python files found
 
     main_file_path = os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN)
 
-    code_content = read_file(main_file_path)
+    code_content = workspace.read(main_file_path)
 
     return code_content, main_file_path
 
 
+@instrument("fetch_code_for_improvement")
 def fetch_code_for_improvement(
     objective: str, expected_result: str, result: str, error: str
 ) -> (Union[str, None], Union[str, None], Union[str, None], Union[str, None]):
@@ -161,10 +284,17 @@ def fetch_code_for_improvement(
     """
 
     last_change = get_last_change_log_entry()
+    last_run = get_last_run_log_entry()
 
     # Generate a prompt to ask the language model for the file and action to take on it
     file_prompt = build_action_selection_prompt(
-        objective, error, result, expected_result, last_change
+        objective,
+        error,
+        result,
+        expected_result,
+        last_change,
+        last_run.get("score"),
+        performance=format_benchmark(last_run.get("benchmark")),
     )
 
     # Get the code from the language model
@@ -179,7 +309,7 @@ def fetch_code_for_improvement(
         code_content = None
 
         if action == "edit":
-            code_content = read_file(file_path)
+            code_content = get_workspace().read(file_path)
 
         return file_path, action, code_content, functionality
 
@@ -189,8 +319,64 @@ def fetch_code_for_improvement(
     return None, None, None, None
 
 
+def build_improvement_prompt(
+    action: str,
+    objective: str,
+    expected_result: str,
+    result: str,
+    error: str,
+    file_path: str,
+    code_content: Union[str, None],
+    functionality: str,
+    edit_mode: str = "full",
+) -> str:
+    """
+    Build the prompt asking for the new code of a file to edit or create.
+
+    With `edit_mode="patch"`, an edit prompt asks for SEARCH/REPLACE blocks
+    instead of the whole file.
+    """
+    repo_map = render_repo_map(focus=file_path)
+    last_run = get_last_run_log_entry()
+    score = format_score(last_run.get("score"))
+
+    if action == "edit":
+        return format_prompt(
+            PATCH_PROMPT if edit_mode == "patch" else IMPROVE_PROMPT,
+            objective=objective,
+            expected_result=expected_result,
+            result=result,
+            score=score,
+            error=error,
+            performance=format_benchmark(last_run.get("benchmark")),
+            code_content=code_content,
+            repo_map=repo_map,
+            file_path=file_path,
+            functionality=functionality,
+        )
+
+    if action == "create":
+        return format_prompt(
+            CREATE_PROMPT,
+            objective=objective,
+            expected_result=expected_result,
+            result=result,
+            score=score,
+            error=error,
+            repo_map=repo_map,
+            file_path=file_path,
+            functionality=functionality,
+        )
+
+    raise ValueError(f"Unknown action: {action}")
+
+
 def make_improvements(
-    objective: str, expected_result: str, result: str, error: str
+    objective: str,
+    expected_result: str,
+    result: str,
+    error: str,
+    edit_mode: str = EDIT_MODE,
 ) -> None:
     # Feth the code that needs improvement
     file_path, action, code_content, functionality = fetch_code_for_improvement(
@@ -207,55 +393,299 @@ def make_improvements(
     logger.info(f"File: {file_path}, Action: {action}")
 
     improved_code = None
-    all_files = str(list_files(DYNAMIC_FOLDER))
+
+    # Ask for a patch first, falling back to a full rewrite if it does not apply
+    if action == "edit" and edit_mode == "patch":
+        prompt = build_improvement_prompt(
+            action,
+            objective,
+            expected_result,
+            result,
+            error,
+            file_path,
+            code_content,
+            functionality,
+            edit_mode="patch",
+        )
+        improved_code = request_patched_code(prompt, code_content)
 
     # create, edit, or delete.
-    if action == "edit":
-        prompt = IMPROVE_PROMPT.format(
-            objective=objective,
-            expected_result=expected_result,
-            result=result,
-            error=error,
-            code_content=code_content,
-            all_files=all_files,
-            file_path=file_path,
-            functionality=functionality,
+    if action in ("edit", "create") and improved_code is None:
+        prompt = build_improvement_prompt(
+            action,
+            objective,
+            expected_result,
+            result,
+            error,
+            file_path,
+            code_content,
+            functionality,
         )
         improved_code = get_code(prompt, response_type="code")
 
-    elif action == "create":
-        prompt = CREATE_PROMPT.format(
-            objective=objective,
-            expected_result=expected_result,
-            result=result,
-            error=error,
-            all_files=all_files,
-            file_path=file_path,
-            functionality=functionality,
-        )
+    elif action not in ("edit", "create", "delete"):
+        raise ValueError(f"Unknown action: {action}")
 
-        improved_code = get_code(prompt, response_type="code")
+    apply_improvement(file_path, action, improved_code, functionality)
 
-    elif action == "delete":
-        delete_file(file_path)
-        update_change_log(file_path, None, action="delete", functionality=functionality)
 
-    else:
-        raise ValueError(f"Unknown action: {action}")
+def request_patched_code(prompt: str, code_content: str) -> Union[str, None]:
+    """
+    Ask for a patch and apply it to the current code.
+
+    Returns:
+    str: The patched code, or None if the patch did not apply or the result
+    does not parse.
+    """
+    patch = get_code(prompt, response_type="patch")
+
+    try:
+        patched_code = apply_patch(code_content, patch, PATCH_FUZZY_THRESHOLD)
+        ast.parse(patched_code)
+    except (PatchError, SyntaxError) as e:
+        logger.warning(f"Patch did not apply, requesting a full rewrite: {e}")
+        return None
+
+    return patched_code
+
+
+def apply_improvement(
+    file_path: str, action: str, improved_code: Union[str, None], functionality: str
+) -> None:
+    """
+    Apply a create, edit or delete action to the dynamic folder and record it.
+    """
+    workspace = get_workspace()
+    if action == "delete":
+        workspace.delete(file_path)
+        update_change_log(file_path, None, action="delete", functionality=functionality)
+        update_dynamic_files()
+        return
 
     if improved_code:
-        dependencies = get_code_dependencies(improved_code)
+        dependencies = get_code_dependencies(
+            improved_code, local_module_names([*workspace.paths(), file_path])
+        )
 
         if dependencies:
             check_and_install_dependencies(dependencies)
 
+        previous_code = workspace.read(file_path) if workspace.exists(file_path) else ""
+
         # Update codebase with the improved code
         update_code(improved_code, file_path)
         update_change_log(
-            file_path, improved_code, action=action, functionality=functionality
+            file_path,
+            improved_code,
+            action=action,
+            functionality=functionality,
+            diff=make_diff(previous_code, improved_code, file_path),
+        )
+
+
+def parse_select_and_edit_response(
+    response: str,
+) -> Union[Tuple[str, str, Union[str, None], str], None]:
+    """
+    Parse and validate a combined select-and-edit response.
+
+    Returns:
+    Tuple containing the file path, action, new code (None for delete) and
+    functionality, or None if the response fails validation.
+    """
+    try:
+        parsed_response = json.loads(response)
+        file_path = parsed_response["file"]
+        action = parsed_response["action"]
+        functionality = parsed_response["functionality"]
+        code = parsed_response.get("code") or None
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+    if not isinstance(file_path, str) or DYNAMIC_FOLDER not in file_path:
+        return None
+
+    if action == "delete":
+        return file_path, action, None, functionality
+
+    if action not in ("edit", "create") or not isinstance(code, str):
+        return None
+
+    try:
+        ast.parse(code)
+    except SyntaxError:
+        return None
+
+    return file_path, action, code, functionality
+
+
+def make_improvements_combined(
+    objective: str, expected_result: str, result: str, error: str
+) -> None:
+    """
+    Select the file, the action and the new code in a single model call.
+
+    Falls back to the two-step `make_improvements` flow when the combined
+    response does not validate. The code section of the prompt is fitted to
+    its token budget, so a rewrite of a file the model only saw part of is
+    discarded and the change is requested as a SEARCH/REPLACE patch instead.
+    """
+    prompt = build_action_selection_prompt(
+        objective,
+        error,
+        result,
+        expected_result,
+        get_last_change_log_entry(),
+        get_last_run_log_entry().get("score"),
+        instructions=SELECT_AND_EDIT_INSTRUCTIONS,
+        include_all_code=True,
+        performance=format_benchmark(get_last_run_log_entry().get("benchmark")),
+    )
+    parsed = parse_select_and_edit_response(get_code(prompt, response_type="json"))
+
+    if parsed is None:
+        logger.warning(
+            "Combined select-and-edit response failed validation. Using the two-step flow."
         )
+        return make_improvements(objective, expected_result, result, error)
+
+    file_path, action, improved_code, functionality = parsed
+    logger.info(f"File: {file_path}, Action: {action} (combined)")
+
+    workspace = get_workspace()
+    if action != "delete" and workspace.exists(file_path):
+        code_content = workspace.read(file_path)
+        if code_content not in prompt:
+            logger.warning(
+                f"{file_path} was truncated in the prompt. Requesting a patch instead of the rewrite."
+            )
+            prompt = build_improvement_prompt(
+                "edit",
+                objective,
+                expected_result,
+                result,
+                error,
+                file_path,
+                code_content,
+                functionality,
+                edit_mode="patch",
+            )
+            improved_code = request_patched_code(prompt, code_content)
+            if improved_code is None:
+                logger.warning(f"Leaving {file_path} unchanged.")
+                return
+            action = "edit"
+
+    apply_improvement(file_path, action, improved_code, functionality)
 
 
+def make_improvements_speculative(
+    objective: str, expected_result: str, result: str, error: str, k: int
+) -> None:
+    """
+    Hedged version of `make_improvements` that races `k` candidate edits.
+
+    The file and action are selected once. The `k` edits are requested
+    concurrently and each is evaluated in its own scratch copy of the
+    workspace as soon as it arrives. The first edit that meets the objective
+    is committed and every outstanding request and evaluation is cancelled. If
+    none meets it, the best-scoring edit is committed.
+    """
+    file_path, action, code_content, functionality = fetch_code_for_improvement(
+        objective, expected_result, result, error
+    )
+
+    if not file_path or DYNAMIC_FOLDER not in file_path:
+        logger.error(
+            "Code to improve not in dynamic folder. Exiting program for safety."
+        )
+        logger.error(json.dumps(get_last_run_log_entry(), indent=4))
+        return False
+
+    logger.info(f"File: {file_path}, Action: {action}, Speculative candidates: {k}")
+
+    if action not in ("edit", "create"):
+        if action == "delete":
+            apply_improvement(file_path, action, None, functionality)
+            return
+        raise ValueError(f"Unknown action: {action}")
+
+    prompt = build_improvement_prompt(
+        action,
+        objective,
+        expected_result,
+        result,
+        error,
+        file_path,
+        code_content,
+        functionality,
+    )
+    winner = asyncio.run(race_candidates(prompt, file_path, expected_result, k))
+
+    if winner:
+        update_code(winner, file_path)
+        update_change_log(
+            file_path,
+            winner,
+            action=action,
+            functionality=functionality,
+            diff=make_diff(code_content or "", winner, file_path),
+        )
+
+
+async def race_candidates(
+    prompt: str, file_path: str, expected_result: str, k: int
+) -> Union[str, None]:
+    """
+    Request `k` versions of a file concurrently and evaluate each in isolation.
+
+    Returns:
+    str: The first version that meets the objective, otherwise the best-scoring one.
+    """
+    workspace = get_workspace().contents()
+    suite = get_session_suite()
+    performance = get_session_performance()
+    local_modules = local_module_names([*workspace, file_path])
+    install_lock = asyncio.Lock()
+
+    async def attempt(index: int) -> Tuple[float, Union[str, None]]:
+        code = await get_code_async(prompt, response_type="code", use_cache=False)
+        if not code:
+            return 0.0, None
+
+        dependencies = get_code_dependencies(code, local_modules)
+        if dependencies:
+            async with install_lock:
+                await asyncio.to_thread(check_and_install_dependencies, dependencies)
+
+        _, _, (met, _, _, score) = await evaluate_files_async(
+            {**workspace, file_path: code}, expected_result, suite, performance
+        )
+        logger.info(f"Speculative candidate {index}: met={met}, score={score:.3f}")
+        return score, code
+
+    tasks = [asyncio.create_task(attempt(index)) for index in range(k)]
+    best_score, best_code = -1.0, None
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                score, code = await finished
+            except Exception as e:
+                logger.warning(f"Speculative candidate failed: {e}")
+                continue
+            if code is not None and score > best_score:
+                best_score, best_code = score, code
+            if score >= 1.0:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return best_code
+
+
+@instrument("update_code")
 def update_code(new_code: str, file_path: str) -> None:
     """
     Update the codebase with the new code received.
@@ -264,12 +694,380 @@ def update_code(new_code: str, file_path: str) -> None:
     new_code (str): The new code to replace the old one.
     file_path (str): The path to the file to update.
     """
-    write_file(file_path, new_code)
+    get_workspace().write(file_path, new_code)
 
     # Update the session state with the new code files
     update_dynamic_files()
 
 
+def run_candidate(
+    root: str = ".",
+    on_start: Callable[[int], None] = None,
+    inputs: Dict = None,
+    script: str = None,
+    limits: Dict = None,
+) -> Dict:
+    """
+    Run the dynamic main file of the workspace under `root` in a separate,
+    resource-limited process.
+
+    Parameters:
+    root (str): Directory containing the DYNAMIC_FOLDER to run, used as the working directory.
+    on_start (Callable[[int], None]): Called with the pid of the run, e.g. to kill it.
+    inputs (Dict): Test case inputs: "argv", "stdin", or "args" to call main() with.
+    script (str): Run this script instead of the dynamic main file, e.g. the benchmark harness.
+    limits (Dict): Resource limits of the run. Defaults to RUN_LIMITS.
+
+    Returns:
+    Dict: The process output, error trace, return code, duration in seconds,
+    the limit that stopped the run, if any, and the run metrics.
+    """
+    file_path = script or os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN)
+    limits = limits or RUN_LIMITS
+    started = time.perf_counter()
+
+    evaluation = None
+    pool = get_worker_pool()
+    if pool is not None:
+        try:
+            evaluation = pool.run(file_path, root, limits, on_start, inputs)
+        except WorkerError as e:
+            logger.warning(f"Warm worker failed, running in a new process: {e}")
+
+    if evaluation is None:
+        evaluation = run_sandboxed(
+            candidate_command(candidate_python(), file_path, inputs),
+            root,
+            limits,
+            on_start,
+            stdin=(inputs or {}).get("stdin"),
+        )
+
+    evaluation["duration"] = time.perf_counter() - started
+    add_to_span(
+        subprocesses=1,
+        cpu_time=evaluation["metrics"].get("cpu_time"),
+        max_rss=evaluation["metrics"].get("max_rss"),
+    )
+    if evaluation["limit"]:
+        logger.warning(
+            f"Run stopped by the {evaluation['limit']} limit: {evaluation['metrics']}"
+        )
+    return evaluation
+
+
+def run_candidate_cached(
+    files: Dict[str, str], isolated: bool = False, runs: RunGroup = None
+) -> Tuple[Dict, bool]:
+    """
+    Run a workspace, answering repeats of an earlier attempt from the evaluation cache.
+
+    Parameters:
+    files (Dict[str, str]): The workspace files, used for the fingerprint.
+    isolated (bool): Run the files in a scratch copy instead of the working directory.
+    runs (RunGroup): Tracks the run so it can be killed. Killed runs are not cached.
+
+    Returns:
+    Tuple containing the run and whether it was served from the cache.
+    """
+    key = evaluation_key(files)
+    cached = get_evaluation_cache().get(key)
+    if cached is not None:
+        return cached, True
+
+    runs = runs or RunGroup()
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.preload(workspace_dependencies(files))
+
+    if isolated:
+        root = create_scratch_workspace(files)
+        try:
+            evaluation = run_candidate(root, runs.track())
+        finally:
+            delete_directory(root)
+    else:
+        get_workspace().materialize()
+        evaluation = run_candidate(on_start=runs.track())
+
+    if is_cacheable(evaluation) and not runs.cancelled.is_set():
+        get_evaluation_cache().put(key, evaluation)
+    return evaluation, False
+
+
+def run_suite_cached(
+    files: Dict[str, str], suite: Dict, isolated: bool = False, runs: RunGroup = None
+) -> Tuple[Dict, bool]:
+    """
+    Run every case of a test suite against a workspace, answering repeats of
+    an earlier attempt from the evaluation cache.
+
+    Parameters:
+    files (Dict[str, str]): The workspace files, used for the fingerprint.
+    suite (Dict): The test suite.
+    isolated (bool): Run the files in a scratch copy instead of the working directory.
+    runs (RunGroup): Tracks the case runs so they can be killed. Killed suites are not cached.
+
+    Returns:
+    Tuple containing the suite run and whether it was served from the cache.
+    """
+    key = evaluation_key(files, "suite", suite_hash(suite))
+    cached = get_evaluation_cache().get(key)
+    if cached is not None:
+        return cached, True
+
+    runs = runs or RunGroup()
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.preload(workspace_dependencies(files))
+
+    if isolated:
+        root = create_scratch_workspace(files)
+    else:
+        root = "."
+        get_workspace().materialize()
+    try:
+        evaluation = run_suite(
+            suite,
+            lambda inputs, on_start: run_candidate(root, runs.track(on_start), inputs),
+        )
+    finally:
+        if isolated:
+            delete_directory(root)
+
+    if is_cacheable(evaluation) and not runs.cancelled.is_set():
+        get_evaluation_cache().put(key, evaluation)
+    return evaluation, False
+
+
+def run_benchmark_cached(
+    files: Dict[str, str],
+    targets: Dict,
+    inputs: Dict = None,
+    isolated: bool = False,
+    runs: RunGroup = None,
+) -> Dict:
+    """
+    Benchmark the main() of a workspace with the benchmark harness, answering
+    repeats of an earlier attempt from the evaluation cache.
+
+    Parameters:
+    files (Dict[str, str]): The workspace files, used for the fingerprint.
+    targets (Dict): The performance targets.
+    inputs (Dict): The argv or args main() is benchmarked with.
+    isolated (bool): Run the files in a scratch copy instead of the working directory.
+    runs (RunGroup): Tracks the run so it can be killed. Killed runs are not cached.
+
+    Returns:
+    Dict: The benchmark, see `performance.parse_benchmark`.
+    """
+    config = benchmark_config(targets, inputs)
+    limits = benchmark_limits(RUN_LIMITS)
+    key = evaluation_key(
+        files, "benchmark", json.dumps({"config": config, "limits": limits}, sort_keys=True)
+    )
+    cached = get_evaluation_cache().get(key)
+    if cached is not None:
+        return dict(cached, targets=targets)
+
+    runs = runs or RunGroup()
+    if isolated:
+        root = create_scratch_workspace(files)
+    else:
+        root = "."
+        get_workspace().materialize()
+    try:
+        evaluation = run_candidate(
+            root,
+            runs.track(),
+            inputs={
+                "argv": [os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN), json.dumps(config)]
+            },
+            script=BENCHMARK_HARNESS,
+            limits=limits,
+        )
+    finally:
+        if isolated:
+            delete_directory(root)
+
+    benchmark = parse_benchmark(evaluation, targets)
+    if is_cacheable(evaluation) and not runs.cancelled.is_set():
+        get_evaluation_cache().put(key, benchmark)
+    return benchmark
+
+
+def evaluate_files(
+    files: Dict[str, str],
+    expected_result: str,
+    suite: Dict = None,
+    isolated: bool = False,
+    performance: Dict = None,
+    runs: RunGroup = None,
+) -> Tuple[Dict, bool, Tuple[bool, Union[str, None], Union[str, None], float]]:
+    """
+    Run and grade a workspace against the expected result, or against every
+    case of a test suite.
+
+    With `performance` targets, a correct workspace is then benchmarked and
+    only meets the objective once it reaches the targets. Scores are scaled
+    so that correct programs rank above incorrect ones: correctness fills the
+    lower half of the score and speed and memory the upper half.
+
+    Every run is tracked in `runs`, if given, so the evaluation can be killed
+    from another thread with `runs.cancel()`.
+
+    Returns:
+    Tuple containing the run, whether it was served from the cache, and the
+    grade: whether the objective is met, the output, the error trace and the score.
+    """
+    if suite:
+        evaluation, repeated = run_suite_cached(files, suite, isolated, runs)
+        grade = grade_suite(suite, evaluation)
+    else:
+        evaluation, repeated = run_candidate_cached(files, isolated, runs)
+        grade = grade_result(evaluation, expected_result)
+
+    if not performance:
+        return evaluation, repeated, grade
+
+    met, output, error, score = grade
+    if not met:
+        return evaluation, repeated, (False, output, error, score * 0.5)
+
+    inputs = case_inputs(suite["cases"][0]) if suite else None
+    benchmark = run_benchmark_cached(files, performance, inputs, isolated, runs)
+    evaluation = dict(evaluation, benchmark=benchmark)
+    speed = performance_score(benchmark)
+    if "error" not in benchmark:
+        logger.info(
+            f"Benchmark: median {benchmark['median']:.6f}s, "
+            f"peak memory {benchmark['peak_memory']} bytes"
+        )
+
+    if "error" in benchmark:
+        return evaluation, repeated, (False, None, format_benchmark(benchmark), 0.5)
+    if speed >= 1.0:
+        return evaluation, repeated, (True, output, None, 1.0)
+    return evaluation, repeated, (False, output, None, 0.5 + 0.5 * min(speed, 0.999999))
+
+
+def run_details(evaluation: Dict) -> Dict:
+    """
+    The run log details of a run: its limit and metrics, or the per-case
+    results of a suite run.
+    """
+    if "cases" in evaluation:
+        return {
+            "cases": [
+                {
+                    "name": case["name"],
+                    "passed": case["passed"],
+                    "score": case["score"],
+                    "skipped": case["skipped"],
+                    "limit": case["limit"],
+                    "metrics": case["metrics"],
+                }
+                for case in evaluation["cases"]
+            ],
+            "stopped_early": evaluation["stopped_early"],
+            "benchmark": evaluation.get("benchmark"),
+        }
+    return {
+        "limit": evaluation.get("limit"),
+        "metrics": evaluation.get("metrics"),
+        "benchmark": evaluation.get("benchmark"),
+    }
+
+
+async def evaluate_files_async(
+    files: Dict[str, str],
+    expected_result: str,
+    suite: Dict = None,
+    performance: Dict = None,
+) -> Tuple[Dict, bool, Tuple[bool, Union[str, None], Union[str, None], float]]:
+    """
+    Asynchronous version of `evaluate_files` in a scratch copy of the files.
+    Cancelling it kills every run of the evaluation: the candidate, its suite
+    cases and its benchmark.
+    """
+    runs = RunGroup()
+    try:
+        return await asyncio.to_thread(
+            evaluate_files, files, expected_result, suite, True, performance, runs
+        )
+    except asyncio.CancelledError:
+        runs.cancel()
+        raise
+
+
+def grade_result(
+    evaluation: Dict, expected_result: str
+) -> Tuple[bool, Union[str, None], Union[str, None], float]:
+    """
+    Grade a candidate run against the expected result.
+
+    Returns:
+    Tuple containing whether the objective is met, the stripped output, the
+    error trace and the fitness score in [0, 1].
+    """
+    if evaluation["returncode"] != 0:
+        return False, None, evaluation["error"], 0.0
+
+    output = str(evaluation["output"].strip())
+    score = score_run(output, None, str(expected_result))
+    return score >= 1.0, output, None, score
+
+
+def check_result(
+    evaluation: Dict, expected_result: str
+) -> Tuple[bool, Union[str, None], Union[str, None]]:
+    """
+    Compare a candidate run with the expected result.
+
+    Returns:
+    Tuple containing whether the objective is met, the stripped output and the error trace.
+    """
+    met, output, error_trace, _ = grade_result(evaluation, expected_result)
+    return met, output, error_trace
+
+
+def with_repeat_note(error: Union[str, None]) -> str:
+    """
+    Append the repeated-attempt note to an error for the next prompt.
+    """
+    return f"{error}\n\n{REPEATED_ATTEMPT_NOTE}" if error else REPEATED_ATTEMPT_NOTE
+
+
+def record_best_score(score: float, checkpoint_id: int = None) -> None:
+    """
+    Pin the current code as the best version when it beats the best score so far.
+
+    Iterations that do not beat it are counted in "stale_iterations", which
+    the revert policy of `checkpoint_manager` reads.
+    """
+    config_data = read_session_config()
+    if score > config_data.get("best_score", -1.0):
+        update_session_fields(
+            best_score=score, best_checkpoint=checkpoint_id, stale_iterations=0
+        )
+        pin_best_code()
+    else:
+        update_session_fields(stale_iterations=config_data.get("stale_iterations", 0) + 1)
+
+
+def checkpoint_outcome(met: bool, error_trace: Union[str, None], evaluation: Dict) -> str:
+    """
+    Summarize an evaluation for its checkpoint: "met", the limit that stopped
+    the run, "error" or "failed".
+    """
+    if met:
+        return "met"
+    if error_trace is not None:
+        return evaluation.get("limit") or "error"
+    return "failed"
+
+
+@instrument("objective_is_met")
 def objective_is_met() -> Tuple[bool, Union[str, None], Union[str, None]]:
     config_data = read_session_config()
 
@@ -279,34 +1077,74 @@ def objective_is_met() -> Tuple[bool, Union[str, None], Union[str, None]]:
         if not code:
             raise ValueError("No code found in the dynamic main file.")
 
-        # Run Python script in a separate process
-        file_path = os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN)
-        process = subprocess.Popen(
-            ["python", file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+        # Run Python script in a separate process, unless an equivalent
+        # workspace has already been evaluated
+        _, expected_result, _ = get_session()
+        files = get_workspace().contents()
+        evaluation, repeated, grade = evaluate_files(
+            files,
+            expected_result,
+            get_session_suite(),
+            performance=get_session_performance(),
+        )
+        if repeated:
+            logger.info("Code matches an earlier attempt. Reusing its evaluation.")
+            add_to_span(cache_hits=1)
+
+        met, output, error_trace, score = grade
+        checkpoint_id = record_checkpoint(
+            files,
+            score=score,
+            met=met,
+            outcome=checkpoint_outcome(met, error_trace, evaluation),
         )
-        output, error_trace = process.communicate()
+        record_best_score(score, checkpoint_id)
 
-        if process.returncode != 0:
-            update_run_log(config_data, "objective_is_not_met_error", None, error_trace)
+        if error_trace is not None:
+            update_run_log(
+                config_data,
+                "objective_is_not_met_error",
+                None,
+                error_trace,
+                repeated=repeated,
+                score=score,
+                **run_details(evaluation),
+            )
+            if repeated:
+                error_trace = with_repeat_note(error_trace)
             return False, None, error_trace
 
-        _, expected_result, _ = get_session()
-
-        logger.info("Objective Result:", output, "Expected Results:", expected_result)
+        logger.info(
+            f"Objective Result: {output} Expected Results: {expected_result} "
+            f"Score: {score:.3f}"
+        )
 
-        if str(output.strip()) == str(expected_result.strip()):
-            update_run_log(config_data, "objective_is_met", str(output.strip()), None)
-            return True, str(output.strip()), None
+        if met:
+            update_run_log(
+                config_data,
+                "objective_is_met",
+                output,
+                None,
+                repeated=repeated,
+                score=score,
+                **run_details(evaluation),
+            )
+            return True, output, None
         else:
             update_run_log(
-                config_data, "objective_is_not_met", str(output.strip()), None
+                config_data,
+                "objective_is_not_met",
+                output,
+                None,
+                repeated=repeated,
+                score=score,
+                **run_details(evaluation),
             )
-            return False, str(output.strip()), None
+            return False, output, with_repeat_note(None) if repeated else None
 
     except Exception as e:
         error_trace = str(e)
-        update_run_log(config_data, "objective_is_not_met_error", None, error_trace)
+        update_run_log(
+            config_data, "objective_is_not_met_error", None, error_trace, score=0.0
+        )
         return False, None, error_trace
@@ -1,68 +1,331 @@
+import os
 import re
+import ast
+import sys
+import json
 import subprocess
+import importlib.util
 from loguru import logger
-from typing import List, Set
+from typing import Dict, Iterable, List, Set, Union
 from interaction_manager import ask_user_for_permission
+from environment_manager import get_session_environment
+from utils.metrics import instrument
+from utils.constants import STATE_FOLDER, MODULE_CACHE
 
+# Import names whose distribution on PyPI has a different name. Installed
+# distributions are looked up from their metadata as well, see `distribution_for`.
+IMPORT_TO_DISTRIBUTION = {
+    "attr": "attrs",
+    "Bio": "biopython",
+    "bs4": "beautifulsoup4",
+    "bson": "pymongo",
+    "Crypto": "pycryptodome",
+    "cv2": "opencv-python",
+    "dateutil": "python-dateutil",
+    "docx": "python-docx",
+    "dotenv": "python-dotenv",
+    "fitz": "PyMuPDF",
+    "gi": "PyGObject",
+    "googleapiclient": "google-api-python-client",
+    "jose": "python-jose",
+    "jwt": "PyJWT",
+    "kafka": "kafka-python",
+    "Levenshtein": "python-Levenshtein",
+    "magic": "python-magic",
+    "MySQLdb": "mysqlclient",
+    "OpenSSL": "pyOpenSSL",
+    "PIL": "Pillow",
+    "pptx": "python-pptx",
+    "psycopg2": "psycopg2-binary",
+    "serial": "pyserial",
+    "skimage": "scikit-image",
+    "sklearn": "scikit-learn",
+    "slugify": "python-slugify",
+    "socks": "PySocks",
+    "telegram": "python-telegram-bot",
+    "usb": "pyusb",
+    "win32api": "pywin32",
+    "wx": "wxPython",
+    "yaml": "PyYAML",
+    "zmq": "pyzmq",
+}
 
-def get_code_dependencies(code: str) -> Set[str]:
+STDLIB_MODULES = frozenset(
+    getattr(sys, "stdlib_module_names", ()) or ()
+) | frozenset(sys.builtin_module_names) | {"__future__"}
+
+# Looks up module names in another interpreter, printing their origins as JSON
+FIND_SPECS = """
+import sys, json, importlib.util
+origins = {}
+for name in json.loads(sys.argv[1]):
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    origins[name] = False if spec is None else spec.origin
+print(json.dumps(origins))
+"""
+
+# Fallback for code that does not parse
+IMPORT_PATTERN = re.compile(
+    r"^\s*(?:import\s+([\w.]+(?:\s*,\s*[\w.]+)*)|from\s+(\w[\w.]*)\s+import)", re.MULTILINE
+)
+
+
+def is_stdlib_module(name: str) -> bool:
+    return name in STDLIB_MODULES
+
+
+def local_module_names(file_paths: Iterable[str]) -> Set[str]:
+    """
+    Return the names the workspace's own files can be imported by.
+    """
+    names = set()
+    for file_path in file_paths:
+        base, extension = os.path.splitext(os.path.basename(file_path))
+        if extension == ".py":
+            names.add(base)
+        if base == "__init__":
+            names.add(os.path.basename(os.path.dirname(file_path)))
+    return names
+
+
+def get_code_dependencies(
+    code: str, local_modules: Iterable[str] = (), include_stdlib: bool = False
+) -> Set[str]:
     """
     Scans the Python code for import statements and returns a set of dependencies.
 
+    Every import is found, including `import a, b`, indented and conditional
+    imports. Relative imports, workspace-local modules and, unless
+    `include_stdlib`, standard library modules are skipped.
+
     Parameters:
     code (str): Python code to scan for import statements.
+    local_modules (Iterable[str]): Module names of the workspace's own files.
+    include_stdlib (bool): Keep standard library modules.
 
     Returns:
-    Set[str]: A set of unique dependencies.
+    Set[str]: A set of unique top-level module names.
     """
-    # Regular expressions for matching import statements
-    import_patterns = [
-        r"^import (\w+)",
-        r"^from (\w+) import",
-    ]
+    names = set()
+    try:
+        for node in ast.walk(ast.parse(code)):
+            if isinstance(node, ast.Import):
+                names.update(alias.name.split(".")[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names.add(node.module.split(".")[0])
+    except SyntaxError:
+        for imports, module in IMPORT_PATTERN.findall(code):
+            for name in (imports.split(",") if imports else [module]):
+                names.add(name.strip().split(".")[0])
 
-    dependencies = set()
+    local = set(local_modules)
+    return {
+        name
+        for name in names
+        if name
+        and name not in local
+        and (include_stdlib or not is_stdlib_module(name))
+    }
+
+
+class ModuleResolver:
+    """
+    Resolves top-level module names with `importlib.util.find_spec`.
+
+    Names are resolved in-process for this interpreter, and in one batched
+    subprocess for another one, such as the session environment. Found
+    modules are cached in a JSON file per interpreter, keyed by the
+    interpreter's path and version, and re-checked only when their file
+    disappears. Missing modules are only remembered for the current process,
+    so something installed outside of geneticML is picked up next session.
+    """
+
+    def __init__(self, path: str = None, python: str = None) -> None:
+        self.path = path
+        self.python = python or sys.executable
+        self.interpreter = f"{self.python} {sys.version.split()[0]}"
+        self.found: Dict[str, Union[str, None]] = {}
+        self.missing: Set[str] = set()
+        self._all: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                self._all = json.load(f)
+        except (OSError, ValueError):
+            self._all = {}
+        self.found = {
+            name: origin
+            for name, origin in self._all.get(self.interpreter, {}).items()
+            if origin is None or os.path.exists(origin)
+        }
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._all[self.interpreter] = self.found
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._all, f)
+        os.replace(temp_path, self.path)
+
+    def _find_specs(self, names: List[str]) -> Dict[str, Union[str, None, bool]]:
+        """
+        Return the origin of each name, None for a module without a file and
+        False for a missing one.
+        """
+        if self.python != sys.executable:
+            completed = subprocess.run(
+                [self.python, "-c", FIND_SPECS, json.dumps(names)],
+                capture_output=True,
+                text=True,
+            )
+            try:
+                return json.loads(completed.stdout)
+            except ValueError:
+                logger.warning(
+                    f"Could not resolve modules in {self.python}: {completed.stderr}"
+                )
+                return {name: False for name in names}
+
+        origins = {}
+        for name in names:
+            try:
+                spec = importlib.util.find_spec(name)
+            except (ImportError, ValueError):
+                spec = None
+            origins[name] = False if spec is None else spec.origin
+        return origins
+
+    def resolve(self, names: Iterable[str]) -> Set[str]:
+        """
+        Resolve module names and return the ones that are not installed.
+        """
+        names = set(names)
+        unknown = sorted(
+            name
+            for name in names
+            if name not in self.found
+            and name not in self.missing
+            and not is_stdlib_module(name)
+        )
+        if unknown:
+            for name, origin in self._find_specs(unknown).items():
+                if origin is False:
+                    self.missing.add(name)
+                else:
+                    # Namespace packages have no origin; cache them without a file to check
+                    self.found[name] = origin if origin and os.path.exists(origin) else None
+            if any(name in self.found for name in unknown):
+                self._save()
+        return {name for name in names if name in self.missing}
+
+    def is_installed(self, name: str) -> bool:
+        return not self.resolve([name])
 
-    for pattern in import_patterns:
-        for match in re.findall(pattern, code):
-            dependencies.add(match)
+    def forget_missing(self) -> None:
+        """
+        Re-check missing modules on their next lookup, e.g. after an install.
+        """
+        importlib.invalidate_caches()
+        self.missing.clear()
 
-    return dependencies
 
+_resolver = None
 
-def check_and_install_dependencies(dependencies: List[str]) -> None:
+
+def get_module_resolver() -> ModuleResolver:
+    """
+    Return the module resolver of the interpreter candidates run in, loading
+    its cache on first use.
+    """
+    global _resolver
+    python = get_session_environment().python
+    if _resolver is None or _resolver.python != python:
+        _resolver = ModuleResolver(os.path.join(STATE_FOLDER, MODULE_CACHE), python)
+    return _resolver
+
+
+def distribution_for(name: str) -> str:
+    """
+    Return the distribution that provides an import name.
+    """
+    if name in IMPORT_TO_DISTRIBUTION:
+        return IMPORT_TO_DISTRIBUTION[name]
+    try:
+        from importlib.metadata import packages_distributions
+
+        distributions = packages_distributions().get(name)
+        if distributions:
+            return distributions[0]
+    except ImportError:
+        pass
+    return name
+
+
+@instrument("check_and_install_dependencies")
+def check_and_install_dependencies(dependencies: Iterable[str]) -> None:
     """
     Checks whether the specified Python libraries are installed. If they are not,
     prompts the user for permission to install them.
 
+    Modules are resolved in the session environment and cached, so installed
+    dependencies are not checked again. Approved distributions are installed
+    into the session environment in one batch, see `SessionEnvironment.install`.
+
     Parameters:
-    dependencies (List[str]): List of library names to check for.
+    dependencies (Iterable[str]): Top-level module names to check for.
 
     Returns:
     None
     """
+    resolver = get_module_resolver()
+    missing = sorted(resolver.resolve(dependencies))
 
-    # Loop through each dependency to check if it's installed
-    for dependency in dependencies:
-        try:
-            # Attempt to import the library
-            subprocess.run(
-                ["python", "-c", f"import {dependency}"],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-        except subprocess.CalledProcessError:
-            # If the import failed, ask the user if they want to install the dependency
-            user_response = ask_user_for_permission(
-                f"The {dependency} library is not installed. Would you like to install it? (y/n)"
-            )
+    approved: List[str] = []
+    for name in missing:
+        distribution = distribution_for(name)
+        label = name if distribution == name else f"{name} ({distribution})"
+        user_response = ask_user_for_permission(
+            f"The {label} library is not installed. Would you like to install it? (y/n)"
+        )
+        if user_response:
+            approved.append(distribution)
+        else:
+            logger.warning(f"Skipping the installation of {label}.")
+
+    if not approved:
+        return
+
+    get_session_environment().install(approved)
+    resolver.forget_missing()
+
+
+def install_workspace_dependencies(files: Dict[str, str]) -> None:
+    """
+    Check the imports of every workspace file and install the missing ones in
+    one batch, e.g. when a session with existing code gets a new environment.
+    Files that are never edited would otherwise never have their imports checked.
 
-            if user_response:
-                # If the user agrees, install the package
-                try:
-                    subprocess.run(["pip", "install", dependency], check=True)
-                except subprocess.CalledProcessError:
-                    logger.error(f"Failed to install {dependency}.")
-            else:
-                logger.warning(f"Skipping the installation of {dependency}.")
+    Parameters:
+    files (Dict[str, str]): File path to contents of every workspace file.
+
+    Returns:
+    None
+    """
+    local_modules = local_module_names(files)
+    dependencies = set()
+    for file_path, code in files.items():
+        if file_path.endswith(".py"):
+            dependencies |= get_code_dependencies(code, local_modules)
+    if dependencies:
+        check_and_install_dependencies(dependencies)
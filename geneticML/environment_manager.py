@@ -0,0 +1,196 @@
+import os
+import sys
+import venv
+import hashlib
+import threading
+import subprocess
+from loguru import logger
+from typing import Iterable, List, Union
+
+from utils.constants import (
+    STATE_FOLDER,
+    SESSION_ENVIRONMENT,
+    ENVIRONMENT_LOCKFILE,
+    WHEEL_CACHE,
+)
+from utils.file_operations import delete_directory, delete_file, make_directory
+
+# Run candidates in a virtualenv of the session ("on") or in this interpreter ("off")
+SESSION_ENV = os.environ.get("GENETICML_SESSION_ENV", "on").lower() != "off"
+# Install only from the wheel cache, never from the package index
+OFFLINE = os.environ.get("GENETICML_OFFLINE", "off").lower() == "on"
+
+
+class SessionEnvironment:
+    """
+    The interpreter candidates run in, with its own packages.
+
+    Packages are installed from a local wheel cache shared by every session.
+    Wheels missing from the cache are built into it first with `pip wheel`,
+    so later sessions, and CI runs given the same cache, install offline.
+    After each install the environment is frozen into a lockfile, which a
+    recreated environment is synced from.
+
+    Parameters:
+    path (str): Directory of the virtualenv, or None to use this interpreter.
+    wheel_cache (str): Directory of cached wheels, used as a local index.
+    lockfile (str): File the installed packages are pinned in.
+    """
+
+    def __init__(self, path: Union[str, None], wheel_cache: str, lockfile: str) -> None:
+        self.path = path
+        self.wheel_cache = os.path.expanduser(wheel_cache)
+        self.lockfile = lockfile
+        self.created = False
+
+    @property
+    def python(self) -> str:
+        if self.path is None:
+            return sys.executable
+        if os.name == "nt":
+            return os.path.join(self.path, "Scripts", "python.exe")
+        return os.path.join(self.path, "bin", "python")
+
+    def exists(self) -> bool:
+        return self.path is None or os.path.exists(self.python)
+
+    def needs_sync(self) -> bool:
+        """
+        Whether the environment was just created or has no lockfile, so the
+        packages the existing code imports may be missing.
+        """
+        return self.created or not os.path.exists(self.lockfile)
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the interpreter and the packages pinned in the lockfile, which
+        changes whenever packages are installed.
+        """
+        digest = hashlib.sha256(self.python.encode("utf-8"))
+        if os.path.exists(self.lockfile):
+            with open(self.lockfile, "rb") as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    def create(self) -> None:
+        """
+        Create the virtualenv and install the packages pinned in the lockfile.
+        """
+        logger.info(f"Creating the session environment in {self.path}.")
+        venv.EnvBuilder(with_pip=True, clear=True, symlinks=os.name != "nt").create(
+            self.path
+        )
+        if os.path.exists(self.lockfile):
+            self._install(["-r", self.lockfile])
+        self.created = True
+
+    def _pip(self, *args: str, quiet: bool = False) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [self.python, "-m", "pip", "--disable-pip-version-check", *args],
+            capture_output=quiet,
+            text=True,
+        )
+
+    def _install(self, requirements: List[str]) -> bool:
+        make_directory(self.wheel_cache)
+        offline = ["install", "--no-index", "--find-links", self.wheel_cache, *requirements]
+        if self._pip(*offline, quiet=True).returncode == 0:
+            return True
+        if OFFLINE:
+            logger.error(f"Not every package of {requirements} is in {self.wheel_cache}.")
+            return False
+
+        # Fill the cache with the missing wheels and their dependencies, then
+        # install from the cache alone so the lockfile matches what is cached
+        built = self._pip(
+            "wheel",
+            "--wheel-dir",
+            self.wheel_cache,
+            "--find-links",
+            self.wheel_cache,
+            *requirements,
+        )
+        return built.returncode == 0 and self._pip(*offline).returncode == 0
+
+    def install(self, distributions: Iterable[str]) -> bool:
+        """
+        Install distributions in one batch and update the lockfile.
+
+        Returns:
+        bool: Whether every distribution was installed.
+        """
+        requirements = sorted(set(distributions))
+        if not requirements:
+            return True
+        installed = self._install(requirements)
+        if not installed:
+            logger.error(f"Failed to install {', '.join(requirements)}.")
+        self.lock()
+        return installed
+
+    def lock(self) -> None:
+        """
+        Pin the installed packages in the lockfile.
+        """
+        frozen = self._pip("freeze", quiet=True)
+        if frozen.returncode != 0:
+            logger.warning(f"Could not freeze the session environment: {frozen.stderr}")
+            return
+        make_directory(os.path.dirname(self.lockfile))
+        temp_path = f"{self.lockfile}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(f"# Packages installed for the candidates, by {self.python}\n")
+            f.write(frozen.stdout)
+        os.replace(temp_path, self.lockfile)
+
+
+_environment = None
+_environment_lock = threading.Lock()
+
+
+def get_session_environment() -> SessionEnvironment:
+    """
+    Return the session environment, creating its virtualenv on first use.
+
+    Falls back to this interpreter when session environments are off or the
+    virtualenv cannot be created, e.g. without ensurepip.
+    """
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            _environment = _open_session_environment()
+    return _environment
+
+
+def _open_session_environment() -> SessionEnvironment:
+    wheel_cache = os.environ.get("GENETICML_WHEEL_CACHE", WHEEL_CACHE)
+    lockfile = os.path.join(STATE_FOLDER, ENVIRONMENT_LOCKFILE)
+    path = os.path.abspath(os.path.join(STATE_FOLDER, SESSION_ENVIRONMENT))
+    environment = SessionEnvironment(path if SESSION_ENV else None, wheel_cache, lockfile)
+    if not environment.exists():
+        try:
+            environment.create()
+        except (OSError, subprocess.CalledProcessError) as e:
+            logger.warning(
+                f"Could not create the session environment, using {sys.executable}: {e}"
+            )
+            environment = SessionEnvironment(None, wheel_cache, lockfile)
+    return environment
+
+
+def candidate_python() -> str:
+    """
+    Return the interpreter that candidates run and install packages in.
+    """
+    return get_session_environment().python
+
+
+def reset_session_environment() -> None:
+    """
+    Discard the session's virtualenv and lockfile. The wheel cache is kept.
+    """
+    global _environment
+    with _environment_lock:
+        _environment = None
+    delete_directory(os.path.join(STATE_FOLDER, SESSION_ENVIRONMENT))
+    delete_file(os.path.join(STATE_FOLDER, ENVIRONMENT_LOCKFILE))
@@ -0,0 +1,244 @@
+import re
+import json
+import math
+from collections import Counter
+from typing import Any, Callable, Dict, Union
+
+from utils.constants import (
+    FITNESS_NUMERIC_TOLERANCE,
+    FITNESS_NUMERIC_SCALE,
+    FITNESS_RUN_FLOOR,
+    FITNESS_EDIT_DISTANCE_LIMIT,
+)
+
+# Scorers compare a program output with the expected result and return a
+# similarity in [0, 1], or None when they do not apply to the expected result.
+SCORERS: Dict[str, Callable[[str, str], Union[float, None]]] = {}
+# Scorers whose 1.0 is a match within tolerance; the others only measure
+# similarity, so `score_output` keeps them below 1.0.
+EXACT_SCORERS = set()
+
+# Expected results starting with one of these prefixes are matched by the
+# named matcher alone, e.g. "regex:^\d+\.\d{2}$" or "predicate:float(output) > 100".
+MATCHER_PREFIXES = ("regex:", "predicate:")
+
+NUMBER_PATTERN = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def register_scorer(name: str, exact: bool = False):
+    """
+    Register a scorer under a name so it takes part in `score_output`.
+    With `exact`, a score of 1.0 counts as a match.
+    """
+
+    def decorator(function: Callable[[str, str], Union[float, None]]):
+        SCORERS[name] = function
+        if exact:
+            EXACT_SCORERS.add(name)
+        return function
+
+    return decorator
+
+
+def _to_number(text: str) -> Union[float, None]:
+    try:
+        value = float(text.replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def number_similarity(value: float, expected: float) -> float:
+    """
+    Similarity of two numbers: 1.0 within FITNESS_NUMERIC_TOLERANCE relative
+    error, decaying smoothly towards 0 as the relative error grows.
+    """
+    relative_error = abs(value - expected) / max(abs(expected), 1e-12)
+    if relative_error <= FITNESS_NUMERIC_TOLERANCE:
+        return 1.0
+    return min(1.0 / (1.0 + relative_error * FITNESS_NUMERIC_SCALE), 0.999999)
+
+
+@register_scorer("numeric", exact=True)
+def numeric_score(output: str, expected: str) -> Union[float, None]:
+    """
+    Compare the number closest to the expected number found in the output.
+    """
+    expected_value = _to_number(expected)
+    if expected_value is None:
+        return None
+
+    values = [_to_number(match) for match in NUMBER_PATTERN.findall(output)]
+    values = [value for value in values if value is not None]
+    if not values:
+        return 0.0
+
+    best = max(number_similarity(value, expected_value) for value in values)
+    # Extra text around the number keeps the score just below a full match
+    return best if _to_number(output) is not None else min(best, 0.95)
+
+
+@register_scorer("edit_distance")
+def edit_distance_score(output: str, expected: str) -> float:
+    """
+    One minus the Levenshtein distance normalized by the longer string.
+    Both strings are cut to FITNESS_EDIT_DISTANCE_LIMIT characters; strings
+    that only differ after the cut score just below 1.0.
+    """
+    a = output[:FITNESS_EDIT_DISTANCE_LIMIT]
+    b = expected[:FITNESS_EDIT_DISTANCE_LIMIT]
+    if not a and not b:
+        return 1.0
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        previous = current
+
+    score = 1.0 - previous[-1] / max(len(a), len(b))
+    return score if output == expected else min(score, 0.999999)
+
+
+@register_scorer("tokens")
+def token_score(output: str, expected: str) -> float:
+    """
+    Multiset Jaccard similarity of the whitespace-separated tokens.
+    """
+    a = Counter(output.split())
+    b = Counter(expected.split())
+    union = sum((a | b).values())
+    return sum((a & b).values()) / union if union else 1.0
+
+
+def structural_similarity(value: Any, expected: Any) -> float:
+    """
+    Recursive similarity of two decoded JSON values.
+    """
+    if isinstance(expected, dict):
+        if not isinstance(value, dict):
+            return 0.0
+        keys = set(expected) | set(value)
+        if not keys:
+            return 1.0
+        return sum(
+            structural_similarity(value[key], expected[key])
+            if key in value and key in expected
+            else 0.0
+            for key in keys
+        ) / len(keys)
+
+    if isinstance(expected, list):
+        if not isinstance(value, list):
+            return 0.0
+        length = max(len(expected), len(value))
+        if not length:
+            return 1.0
+        return sum(
+            structural_similarity(item, other) for item, other in zip(value, expected)
+        ) / length
+
+    if isinstance(expected, bool) or isinstance(value, bool):
+        return 1.0 if value == expected else 0.0
+
+    if isinstance(expected, (int, float)) and isinstance(value, (int, float)):
+        return number_similarity(float(value), float(expected))
+
+    return 1.0 if value == expected else 0.0
+
+
+@register_scorer("json", exact=True)
+def json_score(output: str, expected: str) -> Union[float, None]:
+    """
+    Structural similarity when the expected result is a JSON object or array.
+    """
+    try:
+        expected_value = json.loads(expected)
+    except ValueError:
+        return None
+    if not isinstance(expected_value, (dict, list)):
+        return None
+
+    try:
+        value = json.loads(output)
+    except ValueError:
+        return 0.0
+    return structural_similarity(value, expected_value)
+
+
+def match_expected(output: str, expected: str) -> Union[float, None]:
+    """
+    Apply a regex or predicate matcher when the expected result names one.
+
+    Returns:
+    float: 1.0 or 0.0 for a prefixed expected result, otherwise None.
+    """
+    if expected.startswith("regex:"):
+        return 1.0 if re.fullmatch(expected[len("regex:") :].strip(), output) else 0.0
+
+    if expected.startswith("predicate:"):
+        try:
+            passed = eval(expected[len("predicate:") :].strip(), {}, {"output": output})
+        except Exception:
+            return 0.0
+        return 1.0 if passed else 0.0
+
+    return None
+
+
+def normalize_lines(text: str) -> str:
+    """
+    Normalize line endings and trailing whitespace on each line.
+    """
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def score_output(output: str, expected: str) -> float:
+    """
+    Score a program output against the expected result.
+
+    Returns:
+    float: 1.0 for a match: equal outputs, up to line endings and trailing
+    whitespace, a regex or predicate match, or a numeric or JSON match within
+    tolerance. Otherwise the best similarity of the registered scorers,
+    kept below 1.0.
+    """
+    output = output.strip()
+    expected = expected.strip()
+
+    matched = match_expected(output, expected)
+    if matched is not None:
+        return matched
+
+    if normalize_lines(output) == normalize_lines(expected):
+        return 1.0
+
+    best = 0.0
+    for name, scorer in SCORERS.items():
+        score = scorer(output, expected)
+        if score is None:
+            continue
+        best = max(best, score if name in EXACT_SCORERS else min(score, 0.999999))
+    return best
+
+
+def score_run(output: Union[str, None], error: Union[str, None], expected: str) -> float:
+    """
+    Score a candidate run in [0, 1].
+
+    A run that failed scores 0.0. A run that finished scores at least
+    FITNESS_RUN_FLOOR, scaled up by how close its output is to the expected result.
+    """
+    if error is not None or output is None:
+        return 0.0
+    similarity = score_output(output, expected)
+    if similarity >= 1.0:
+        return 1.0
+    return FITNESS_RUN_FLOOR + (1.0 - FITNESS_RUN_FLOOR) * similarity
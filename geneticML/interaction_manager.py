@@ -2,18 +2,25 @@ import sys
 from loguru import logger
 
 
-def ask_user_for_objective() -> tuple:
+def ask_user_for_objective(ask_expected_result: bool = True) -> tuple:
     """
     Collects objective and expected result from the user.
 
+    Parameters:
+    - ask_expected_result (bool): Whether to ask for the expected result, e.g.
+      not when a test suite defines it.
+
     Returns:
     Tuple containing:
     - objective (str): The objective specified by the user.
-    - expected_result (str): The expected result specified by the user.
+    - expected_result (str): The expected result specified by the user, or None.
     """
     print("🤖:", "Please specify the objective:")
     objective = input()
 
+    if not ask_expected_result:
+        return objective, None
+
     print(
         "🤖:",
         "Please specify the expected result for this objective:",
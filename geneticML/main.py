@@ -1,17 +1,51 @@
+import os
+import argparse
 from loguru import logger
 
-from session_manager import get_session, set_session, create_session_config
+from session_manager import (
+    get_session,
+    get_session_suite,
+    get_session_performance,
+    set_session,
+    create_session_config,
+    flush_session,
+)
 from code_manager import (
     make_improvements,
+    make_improvements_speculative,
+    make_improvements_combined,
     objective_is_met,
     ensure_dynamic_directory,
     initialize_dynamic_main,
     delete_dynamic_directory,
 )
+from environment_manager import get_session_environment, reset_session_environment
+from dependency_manager import install_workspace_dependencies
+from checkpoint_manager import revert_to_best_checkpoint
+from population_manager import run_population_search
+from suite_manager import load_suite, suite_expected_result
+from performance import performance_targets
 from interaction_manager import ask_user_for_objective, ask_user_for_permission
+from utils.workspace import get_workspace
+from taxonomyml_interface import flush_interaction_log, response_cache_stats
+from utils.metrics import get_metrics
 
 
-from utils.constants import DYNAMIC_FOLDER
+from utils.constants import (
+    DYNAMIC_FOLDER,
+    POPULATION_SIZE,
+    POPULATION_GENERATIONS,
+    POPULATION_ELITISM,
+    POPULATION_WORKERS,
+    POPULATION_SELECTION,
+    SPECULATIVE_CANDIDATES,
+    COMBINED_EDIT_MODE,
+    EDIT_MODE,
+    BENCHMARK_PROFILE,
+    CHECKPOINT_REVERT_AFTER,
+    STATE_FOLDER,
+    METRICS_FILE,
+)
 
 
 def initialize_dynamic(objective: str):
@@ -34,14 +68,123 @@ def maybe_restart_config():
     if user_permission:
         delete_dynamic_directory()
         create_session_config()
+        reset_session_environment()
         return True
     return False
 
 
-def main_loop():
+def report_metrics() -> None:
+    """
+    Write the metrics of the run in the Prometheus text format and log the
+    time, tokens and cache hits of each phase, and the response cache's hit
+    rate.
+    """
+    # Response tokens are reported by the interaction log's writer thread
+    flush_interaction_log()
+    metrics = get_metrics()
+    metrics.write_prometheus(os.path.join(STATE_FOLDER, METRICS_FILE))
+    logger.info(f"Phases of this run:\n{metrics.format_summary()}")
+
+    stats = response_cache_stats()
+    if stats:
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups else 0.0
+        logger.info(
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({hit_rate:.0%}), {stats['entries']} entries, {stats['bytes']} bytes."
+        )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """
+    Parse the command line options.
+    """
+    parser = argparse.ArgumentParser(
+        description="Automatically refine Python code to meet a specified objective."
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["hill_climb", "population"],
+        default="hill_climb",
+        help="Improve a single lineage, or evolve a population of candidate programs.",
+    )
+    parser.add_argument("--population-size", type=int, default=POPULATION_SIZE)
+    parser.add_argument("--generations", type=int, default=POPULATION_GENERATIONS)
+    parser.add_argument("--elitism", type=int, default=POPULATION_ELITISM)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=POPULATION_WORKERS,
+        help="Maximum number of candidates evaluated in parallel.",
+    )
+    parser.add_argument(
+        "--selection",
+        choices=["tournament", "roulette", "truncation"],
+        default=POPULATION_SELECTION,
+    )
+    parser.add_argument(
+        "--revert-after",
+        type=int,
+        default=CHECKPOINT_REVERT_AFTER,
+        metavar="K",
+        help="Revert to the best checkpoint after K iterations without improvement; 0 never reverts.",
+    )
+    parser.add_argument(
+        "--speculative",
+        type=int,
+        default=SPECULATIVE_CANDIDATES,
+        metavar="K",
+        help="Race K concurrent edits per iteration and keep the first that meets the objective.",
+    )
+    parser.add_argument(
+        "--combined",
+        action=argparse.BooleanOptionalAction,
+        default=COMBINED_EDIT_MODE,
+        help="Select the file and generate its code in one model call per iteration.",
+    )
+    parser.add_argument(
+        "--edit-mode",
+        choices=["full", "patch"],
+        default=EDIT_MODE,
+        help="Ask for whole files, or for SEARCH/REPLACE patches with a full-rewrite fallback.",
+    )
+    parser.add_argument(
+        "--suite",
+        metavar="PATH",
+        help="JSON file of test cases to meet instead of a single expected result.",
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        help="Stop a suite run after this many failing cases (0 runs every case).",
+    )
+    parser.add_argument(
+        "--target-latency",
+        type=float,
+        metavar="SECONDS",
+        help="Once the output is correct, optimize until main() runs this fast (median).",
+    )
+    parser.add_argument(
+        "--target-memory",
+        type=float,
+        metavar="MB",
+        help="Once the output is correct, optimize until main() allocates at most this much memory.",
+    )
+    parser.add_argument(
+        "--profile",
+        action=argparse.BooleanOptionalAction,
+        default=BENCHMARK_PROFILE,
+        help="Profile main() when benchmarking and show its hot spots to the model.",
+    )
+    return parser.parse_args(argv)
+
+
+def main_loop(args: argparse.Namespace = None):
     """
     Orchestrates the entire program logic.
     """
+    args = args or parse_args([])
+
     # Get session data
     objective, expected_result, code_files = get_session()
     met = False
@@ -52,26 +195,83 @@ def main_loop():
         if maybe_restart_config():
             objective, expected_result, code_files = get_session()
 
+    if args.suite:
+        suite = load_suite(args.suite)
+        if args.max_failures is not None:
+            suite["max_failures"] = args.max_failures
+        objective = objective or suite["objective"]
+        if not objective:
+            objective, _ = ask_user_for_objective(ask_expected_result=False)
+        expected_result = suite_expected_result(suite)
+        set_session(objective, expected_result, suite, get_session_performance())
+    elif args.max_failures is not None and get_session_suite():
+        suite = dict(get_session_suite(), max_failures=args.max_failures)
+        set_session(objective, expected_result, suite, get_session_performance())
+
     if not objective:
         objective, expected_result = ask_user_for_objective()
         set_session(objective, expected_result)
 
+    performance = performance_targets(
+        args.target_latency,
+        int(args.target_memory * 1024 * 1024) if args.target_memory else None,
+        args.profile,
+    )
+    if performance:
+        set_session(objective, expected_result, get_session_suite(), performance)
+
     if not code_files:
         initialize_dynamic(objective)
+    elif get_session_environment().needs_sync():
+        # A new environment has none of the packages the existing code imports
+        install_workspace_dependencies(get_workspace().contents())
 
     met, result, error = objective_is_met()
     if met:
         logger.success("Objective met. Exiting program.")
         return True
 
+    if args.mode == "population":
+        run_population_search(
+            objective,
+            expected_result,
+            population_size=args.population_size,
+            generations=args.generations,
+            elitism=args.elitism,
+            workers=args.workers,
+            selection=args.selection,
+        )
+        met, result, error = objective_is_met()
+        flush_session()
+        if met:
+            logger.success("Objective met. Exiting program.")
+        else:
+            logger.info("Objective not met after the population search.")
+        return met
+
     # Main processing loop
     while True:
+        # Pick up files edited outside of geneticML; unchanged files are not read again
+        get_workspace().refresh()
+
         # Make code improvements
-        make_improvements(objective, expected_result, result, error)
+        if args.speculative > 1:
+            make_improvements_speculative(
+                objective, expected_result, result, error, args.speculative
+            )
+        elif args.combined:
+            make_improvements_combined(objective, expected_result, result, error)
+        else:
+            make_improvements(
+                objective, expected_result, result, error, edit_mode=args.edit_mode
+            )
 
         # Check if the objective is met
         met, result, error = objective_is_met()
 
+        # Persist this iteration's session changes in one write
+        flush_session()
+
         logger.info(f"Got the following result: {result}")
         logger.info(f"Got the following error: {error}")
         if met:
@@ -80,6 +280,15 @@ def main_loop():
         else:
             logger.info("Objective not met. Making improvements.")
 
+        # Build on the best code so far instead of on a run of regressions
+        reverted = revert_to_best_checkpoint(args.revert_after)
+        if reverted is not None:
+            met, result, error = reverted
+            flush_session()
+
 
 if __name__ == "__main__":
-    main_loop()
+    try:
+        main_loop(parse_args())
+    finally:
+        report_metrics()
@@ -0,0 +1,195 @@
+import os
+import json
+import statistics
+from typing import Dict, List, Tuple, Union
+
+from utils.constants import (
+    BENCHMARK_WARMUP,
+    BENCHMARK_REPEATS,
+    BENCHMARK_MAX_TIME,
+    BENCHMARK_HOTSPOTS,
+    BENCHMARK_TIME_BUDGET,
+    BENCHMARK_WALL_HEADROOM,
+)
+
+BENCHMARK_HARNESS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "utils", "benchmark_harness.py"
+)
+# Must match RESULT_MARKER in utils/benchmark_harness.py
+RESULT_MARKER = "__geneticml_benchmark__"
+
+
+def performance_targets(
+    latency: float = None, memory: int = None, profile: bool = True
+) -> Union[Dict, None]:
+    """
+    Build the performance targets of an objective.
+
+    Parameters:
+    latency (float): Target median run time of main(), in seconds.
+    memory (int): Target peak memory allocated by main(), in bytes.
+    profile (bool): Whether to capture the hot spots of main() with cProfile.
+
+    Returns:
+    Dict: The targets, or None when neither target is set.
+    """
+    if latency is None and memory is None:
+        return None
+    return {"latency": latency, "memory": memory, "profile": profile}
+
+
+def benchmark_config(targets: Dict, inputs: Dict = None) -> Dict:
+    """
+    Build the harness configuration for a benchmark run.
+    """
+    inputs = inputs or {}
+    return {
+        "warmup": BENCHMARK_WARMUP,
+        "repeats": BENCHMARK_REPEATS,
+        "max_time": BENCHMARK_MAX_TIME,
+        "hotspots": BENCHMARK_HOTSPOTS,
+        "budget": BENCHMARK_TIME_BUDGET,
+        "profile": targets.get("profile", True),
+        "argv": inputs.get("argv") or [],
+        "args": inputs.get("args"),
+    }
+
+
+def benchmark_limits(limits: Dict) -> Dict:
+    """
+    The sandbox limits of a benchmark run: the candidate's run limits, with
+    the wall and CPU time raised to the benchmark's time budget plus headroom.
+    """
+    seconds = BENCHMARK_TIME_BUDGET + BENCHMARK_WALL_HEADROOM
+    return {
+        **limits,
+        "wall_time": max(limits.get("wall_time") or 0, seconds),
+        "cpu_time": max(limits.get("cpu_time") or 0, seconds),
+    }
+
+
+def reject_outliers(times: List[float]) -> Tuple[List[float], int]:
+    """
+    Drop run times outside 1.5 interquartile ranges of the quartiles.
+
+    Returns:
+    Tuple containing the kept times and the number rejected.
+    """
+    if len(times) < 4:
+        return list(times), 0
+    q1, _, q3 = statistics.quantiles(times, n=4)
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    kept = [value for value in times if low <= value <= high]
+    return kept, len(times) - len(kept)
+
+
+def parse_benchmark(evaluation: Dict, targets: Dict) -> Dict:
+    """
+    Turn a harness run into benchmark statistics.
+
+    Returns:
+    Dict: The median, mean, minimum and standard deviation of the kept run
+    times, the number of runs and outliers, the peak memory of main(), the
+    peak RSS of the process, the hot spots and the targets, or an "error".
+    """
+    line = next(
+        (
+            line
+            for line in reversed(evaluation["output"].splitlines())
+            if line.startswith(RESULT_MARKER)
+        ),
+        None,
+    )
+    if evaluation["returncode"] != 0 or line is None:
+        return {
+            "error": evaluation["error"] or "The benchmark produced no result.",
+            "targets": targets,
+        }
+
+    result = json.loads(line[len(RESULT_MARKER) :])
+    kept, outliers = reject_outliers(result["times"])
+    return {
+        "median": statistics.median(kept),
+        "mean": statistics.fmean(kept),
+        "min": min(kept),
+        "stdev": statistics.stdev(kept) if len(kept) > 1 else 0.0,
+        "runs": len(result["times"]),
+        "outliers": outliers,
+        "peak_memory": result["peak_memory"],
+        "max_rss": (evaluation.get("metrics") or {}).get("max_rss"),
+        "hotspots": result["hotspots"],
+        "targets": targets,
+    }
+
+
+def performance_score(benchmark: Dict) -> float:
+    """
+    Score how close a benchmark is to its targets, in [0, 1].
+    1.0 means every target is reached.
+    """
+    if "error" in benchmark:
+        return 0.0
+    targets = benchmark["targets"]
+    score = 1.0
+    if targets.get("latency"):
+        score *= min(targets["latency"] / max(benchmark["median"], 1e-9), 1.0)
+    if targets.get("memory"):
+        if benchmark["peak_memory"] is None:
+            # The tracemalloc pass did not fit the time budget
+            return min(score, 0.999999)
+        score *= min(targets["memory"] / max(benchmark["peak_memory"], 1), 1.0)
+    return score
+
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.2f} ms" if seconds < 1 else f"{seconds:.3f} s"
+
+
+def format_memory(size: Union[int, None]) -> str:
+    return "unknown" if size is None else f"{size / (1024 * 1024):.2f} MB"
+
+
+def format_benchmark(benchmark: Union[Dict, None]) -> str:
+    """
+    Describe a benchmark and its hot spots for a prompt.
+    """
+    if not benchmark:
+        return ""
+    if "error" in benchmark:
+        return (
+            "The output is correct, but benchmarking main() failed:\n"
+            f"{benchmark['error'][-1500:]}"
+        )
+
+    targets = benchmark["targets"]
+    met = performance_score(benchmark) >= 1.0
+    lines = [
+        "The output is correct and the performance targets are met."
+        if met
+        else "The output is correct, but the performance targets are not met yet. "
+        "Make the program faster or use less memory without changing its output."
+    ]
+
+    latency = f"- Median run time of main(): {format_duration(benchmark['median'])}"
+    latency += f" over {benchmark['runs']} runs"
+    if benchmark["outliers"]:
+        latency += f" ({benchmark['outliers']} outliers rejected)"
+    if targets.get("latency"):
+        latency += f", target {format_duration(targets['latency'])}"
+    lines.append(latency)
+
+    memory = f"- Peak memory allocated by main(): {format_memory(benchmark['peak_memory'])}"
+    if targets.get("memory"):
+        memory += f", target {format_memory(targets['memory'])}"
+    lines.append(memory)
+    lines.append(f"- Peak process memory: {format_memory(benchmark['max_rss'])}")
+
+    if benchmark["hotspots"]:
+        lines.append("- Hot spots (own time, total time, calls):")
+        for spot in benchmark["hotspots"]:
+            lines.append(
+                f"  {spot['file']}:{spot['line']} {spot['function']}: "
+                f"{format_duration(spot['own_time'])}, "
+                f"{format_duration(spot['total_time'])}, {spot['calls']}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,370 @@
+import os
+import re
+import random
+import asyncio
+from loguru import logger
+from typing import Dict, List
+
+from session_manager import (
+    update_change_log,
+    update_dynamic_files,
+    get_session_suite,
+    get_session_performance,
+)
+from taxonomyml_interface import get_code_async
+from code_manager import evaluate_files
+from performance import format_benchmark
+from dependency_manager import (
+    check_and_install_dependencies,
+    get_code_dependencies,
+    local_module_names,
+)
+from utils.patching import make_diff
+from utils.workspace import get_workspace
+from utils.constants import (
+    POPULATION_SIZE,
+    POPULATION_GENERATIONS,
+    POPULATION_ELITISM,
+    POPULATION_WORKERS,
+    POPULATION_SELECTION,
+    POPULATION_TOURNAMENT_SIZE,
+    POPULATION_CROSSOVER_RATE,
+    POPULATION_TRACEBACK_WEIGHT,
+)
+from utils.prompts import (
+    IMPROVE_PROMPT,
+    CROSSOVER_PROMPT,
+    format_prompt,
+    format_score,
+    render_repo_map,
+)
+
+# Files in the frames of a Python traceback
+TRACEBACK_FILE_PATTERN = re.compile(r'File "([^"]+)", line \d+')
+
+MUTATION_FUNCTIONALITY = (
+    "Fix the last program error, or change the code so its result matches the "
+    "expected program result."
+)
+
+
+def new_candidate(files: Dict[str, str], origin: str) -> Dict:
+    """
+    Create an unevaluated candidate program.
+
+    Parameters:
+    files (Dict[str, str]): File path to code for every file in the workspace.
+    origin (str): How the candidate was produced: seed, mutation, crossover or elite.
+
+    Returns:
+    Dict: The candidate.
+    """
+    return {
+        "files": files,
+        "origin": origin,
+        "evaluated": False,
+        "met": False,
+        "score": 0.0,
+        "result": None,
+        "error": None,
+        "benchmark": None,
+    }
+
+
+def pick_file(candidate: Dict) -> str:
+    """
+    Pick the file of a candidate to change.
+
+    Python files are picked at random, weighted by their number of lines, so
+    helper modules are mutated as well as the main file. Files in the
+    traceback of the candidate's error are POPULATION_TRACEBACK_WEIGHT times
+    as likely to be picked.
+    """
+    file_paths = sorted(
+        file_path for file_path in candidate["files"] if file_path.endswith(".py")
+    ) or sorted(candidate["files"])
+
+    in_traceback = {
+        os.path.normpath(frame)
+        for frame in TRACEBACK_FILE_PATTERN.findall(candidate.get("error") or "")
+    }
+    weights = []
+    for file_path in file_paths:
+        weight = max(candidate["files"][file_path].count("\n"), 1)
+        if any(frame.endswith(os.sep + os.path.normpath(file_path)) for frame in in_traceback):
+            weight *= POPULATION_TRACEBACK_WEIGHT
+        weights.append(weight)
+    return random.choices(file_paths, weights)[0]
+
+
+async def mutate(candidate: Dict, objective: str, expected_result: str) -> Dict:
+    """
+    Ask the language model for an improved version of one file of a candidate.
+    """
+    file_path = pick_file(candidate)
+    prompt = format_prompt(
+        IMPROVE_PROMPT,
+        objective=objective,
+        expected_result=expected_result,
+        result=candidate["result"],
+        score=format_score(candidate["score"]),
+        error=candidate["error"],
+        performance=format_benchmark(candidate["benchmark"]),
+        code_content=candidate["files"][file_path],
+        repo_map=render_repo_map(focus=file_path, files=candidate["files"]),
+        file_path=file_path,
+        functionality=MUTATION_FUNCTIONALITY,
+    )
+    code = await get_code_async(prompt, response_type="code", use_cache=False)
+
+    files = dict(candidate["files"])
+    if code:
+        files[file_path] = code
+    return new_candidate(files, "mutation")
+
+
+async def crossover(
+    parent: Dict, other: Dict, objective: str, expected_result: str
+) -> Dict:
+    """
+    Ask the language model to combine the differing files of two parents.
+    Files that only one parent has are inherited from it unchanged.
+    """
+    files = {**other["files"], **parent["files"]}
+    differing = [
+        file_path
+        for file_path in parent["files"]
+        if file_path in other["files"]
+        and parent["files"][file_path] != other["files"][file_path]
+    ]
+
+    async def merge(file_path: str) -> None:
+        prompt = format_prompt(
+            CROSSOVER_PROMPT,
+            objective=objective,
+            expected_result=expected_result,
+            file_path=file_path,
+            result=parent["result"],
+            score=format_score(parent["score"]),
+            error=parent["error"],
+            code_content=parent["files"][file_path],
+            other_result=other["result"],
+            other_score=format_score(other["score"]),
+            other_error=other["error"],
+            other_code_content=other["files"][file_path],
+        )
+        code = await get_code_async(prompt, response_type="code", use_cache=False)
+        if code:
+            files[file_path] = code
+
+    await asyncio.gather(*[merge(file_path) for file_path in differing])
+    return new_candidate(files, "crossover")
+
+
+async def evaluate(
+    candidate: Dict, expected_result: str, semaphore: asyncio.Semaphore
+) -> Dict:
+    """
+    Run a candidate in an isolated copy of the workspace and record its fitness.
+    """
+    async with semaphore:
+        evaluation, _, (met, result, error, score) = await asyncio.to_thread(
+            evaluate_files,
+            candidate["files"],
+            expected_result,
+            get_session_suite(),
+            True,
+            get_session_performance(),
+        )
+
+    candidate.update(
+        evaluated=True,
+        met=met,
+        result=result,
+        error=error,
+        score=score,
+        benchmark=evaluation.get("benchmark"),
+    )
+    return candidate
+
+
+def select_parent(
+    population: List[Dict], selection: str = POPULATION_SELECTION
+) -> Dict:
+    """
+    Select a parent from an evaluated population.
+
+    Parameters:
+    population (List[Dict]): Evaluated candidates.
+    selection (str): "tournament", "roulette" or "truncation".
+
+    Returns:
+    Dict: The selected candidate.
+    """
+    if selection == "tournament":
+        contestants = random.sample(
+            population, min(POPULATION_TOURNAMENT_SIZE, len(population))
+        )
+        return max(contestants, key=lambda candidate: candidate["score"])
+
+    if selection == "roulette":
+        weights = [candidate["score"] + 0.01 for candidate in population]
+        return random.choices(population, weights=weights, k=1)[0]
+
+    if selection == "truncation":
+        ranked = sorted(population, key=lambda candidate: candidate["score"], reverse=True)
+        return random.choice(ranked[: max(1, len(ranked) // 2)])
+
+    raise ValueError(f"Unknown selection: {selection}")
+
+
+def install_candidate_dependencies(candidates: List[Dict]) -> None:
+    """
+    Check the dependencies of new candidates once, before they are evaluated.
+    """
+    dependencies = set()
+    for candidate in candidates:
+        local = local_module_names(candidate["files"])
+        for code in candidate["files"].values():
+            dependencies.update(get_code_dependencies(code, local))
+    if dependencies:
+        check_and_install_dependencies(sorted(dependencies))
+
+
+async def breed(
+    population: List[Dict],
+    count: int,
+    objective: str,
+    expected_result: str,
+    selection: str,
+) -> List[Dict]:
+    """
+    Produce `count` children from an evaluated population.
+    """
+    tasks = []
+    for _ in range(count):
+        parent = select_parent(population, selection)
+        other = select_parent(population, selection)
+        if (
+            random.random() < POPULATION_CROSSOVER_RATE
+            and other["files"] != parent["files"]
+        ):
+            tasks.append(crossover(parent, other, objective, expected_result))
+        else:
+            tasks.append(mutate(parent, objective, expected_result))
+    return list(await asyncio.gather(*tasks))
+
+
+async def evolve(
+    objective: str,
+    expected_result: str,
+    population_size: int = POPULATION_SIZE,
+    generations: int = POPULATION_GENERATIONS,
+    elitism: int = POPULATION_ELITISM,
+    workers: int = POPULATION_WORKERS,
+    selection: str = POPULATION_SELECTION,
+) -> Dict:
+    """
+    Run a population-based search starting from the current dynamic workspace.
+
+    Every generation, all new candidates are evaluated in parallel in isolated
+    copies of the workspace. The `elitism` best candidates carry over
+    unchanged, and the rest of the next generation is bred from the current
+    one through mutation and crossover.
+
+    Returns:
+    Dict: The best candidate found.
+    """
+    semaphore = asyncio.Semaphore(workers)
+    seed = new_candidate(get_workspace().contents(), "seed")
+    population = [await evaluate(seed, expected_result, semaphore)]
+    best = seed
+
+    for generation in range(generations + 1):
+        if len(population) < population_size:
+            children = await breed(
+                [candidate for candidate in population if candidate["evaluated"]],
+                population_size - len(population),
+                objective,
+                expected_result,
+                selection,
+            )
+            install_candidate_dependencies(children)
+            population.extend(children)
+
+        await asyncio.gather(
+            *[
+                evaluate(candidate, expected_result, semaphore)
+                for candidate in population
+                if not candidate["evaluated"]
+            ]
+        )
+
+        population.sort(key=lambda candidate: candidate["score"], reverse=True)
+        best = population[0]
+        logger.info(
+            f"Generation {generation}: best score {best['score']:.2f} "
+            f"({best['origin']}), scores {[round(c['score'], 2) for c in population]}"
+        )
+
+        if best["met"] or generation == generations:
+            break
+
+        elites = [dict(candidate, origin="elite") for candidate in population[:elitism]]
+        parents = population
+        population = elites
+        population.extend(
+            await breed(
+                parents,
+                population_size - len(population),
+                objective,
+                expected_result,
+                selection,
+            )
+        )
+        install_candidate_dependencies(population[len(elites) :])
+
+    return best
+
+
+def adopt_candidate(candidate: Dict) -> None:
+    """
+    Write a candidate's files into the dynamic folder and record the changes.
+    """
+    workspace = get_workspace()
+    current = workspace.contents()
+
+    for file_path in current:
+        if file_path not in candidate["files"]:
+            workspace.delete(file_path)
+            update_change_log(file_path, None, action="delete", functionality="population search")
+
+    for file_path, code in candidate["files"].items():
+        if current.get(file_path) != code:
+            workspace.write(file_path, code)
+            update_change_log(
+                file_path,
+                code,
+                action="edit" if file_path in current else "create",
+                functionality=f"population search ({candidate['origin']})",
+                diff=make_diff(current.get(file_path, ""), code, file_path),
+            )
+
+    update_dynamic_files()
+
+
+def run_population_search(objective: str, expected_result: str, **options) -> bool:
+    """
+    Evolve the dynamic workspace with a population search and keep the best program.
+
+    Parameters:
+    objective (str): The program objective.
+    expected_result (str): The expected program output.
+    options: Overrides for `evolve` (population_size, generations, elitism, workers, selection).
+
+    Returns:
+    bool: True if the best candidate meets the objective.
+    """
+    best = asyncio.run(evolve(objective, expected_result, **options))
+    adopt_candidate(best)
+    return best["met"]
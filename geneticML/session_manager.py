@@ -1,87 +1,451 @@
+import os
+import sys
+import time
+import atexit
+import signal
+import threading
 from datetime import datetime
 from typing import Tuple, List, Dict, Any, Union
 
-from utils.file_operations import read_config, write_config, create_config, list_files
-from utils.constants import DYNAMIC_FOLDER
+from utils.file_operations import (
+    read_config,
+    write_config,
+    create_config,
+    delete_directory,
+)
+from utils.workspace import get_workspace
+from utils.session_journal import SessionJournal
+from utils.blob_store import BlobStore
+from utils.constants import (
+    STATE_FOLDER,
+    SESSION_JOURNAL,
+    SESSION_FLUSH_INTERVAL,
+    CODE_STORE,
+    CODE_HISTORY_KEEP,
+    CODE_HISTORY_COMPACT_EVERY,
+)
+
+JOURNALED_LOGS = ("run_log", "change_log")
+# Checkpoints are written to the journal at once, so their ids are known
+CHECKPOINT_LOG = "checkpoints"
+
+
+class SessionStore:
+    """
+    In-memory session state with dirty tracking and batched write-behind.
+
+    config.json is read once. Field changes and journal appends are held in
+    memory and written out together by `flush`, which runs at iteration
+    boundaries, when `flush_interval` seconds have passed since the last
+    flush, and on interpreter exit or SIGTERM.
+    """
+
+    def __init__(self, flush_interval: float = SESSION_FLUSH_INTERVAL) -> None:
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._data = None
+        self._journal = None
+        self._blobs = None
+        self._changes_since_compaction = 0
+        self._dirty = set()
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    @property
+    def journal(self) -> SessionJournal:
+        if self._journal is None:
+            self._journal = SessionJournal(os.path.join(STATE_FOLDER, SESSION_JOURNAL))
+        return self._journal
+
+    @property
+    def blobs(self) -> BlobStore:
+        if self._blobs is None:
+            self._blobs = BlobStore(os.path.join(STATE_FOLDER, CODE_STORE))
+        return self._blobs
+
+    @property
+    def data(self) -> Dict:
+        with self._lock:
+            if self._data is None:
+                self._load()
+            return self._data
+
+    def _load(self) -> None:
+        self._data = read_config()
+        if self._migrate(self._data):
+            write_config(self._data)
+        self._dirty.clear()
+
+    def _migrate(self, config_data: Dict) -> bool:
+        """
+        Move run and change logs embedded in an older config.json into the journal,
+        moving any inline code snapshots into the blob store on the way.
+
+        Returns:
+        bool: True if the config data was changed and needs to be written back.
+        """
+        migrated = False
+        for log in JOURNALED_LOGS:
+            if log in config_data:
+                entries = config_data.pop(log) or []
+                if log == "change_log":
+                    heads = config_data.setdefault("code_heads", {})
+                    entries = [self._store_code(entry, heads) for entry in entries]
+                if entries:
+                    self.journal.extend(log, entries)
+                migrated = True
+        return migrated
+
+    def _store_code(self, entry: Dict, heads: Dict[str, str]) -> Dict:
+        """
+        Replace the inline code of a change log entry with its blob hash.
+        """
+        entry = dict(entry)
+        code = entry.pop("code", None)
+        file_path = entry.get("file_path")
+        if code is not None:
+            entry["code_hash"] = self.blobs.put(code, heads.get(file_path))
+            heads[file_path] = entry["code_hash"]
+        else:
+            entry["code_hash"] = None
+            heads.pop(file_path, None)
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def update(self, **fields) -> None:
+        """
+        Set one or more session fields, marking the changed ones dirty.
+        """
+        with self._lock:
+            data = self.data
+            for key, value in fields.items():
+                if data.get(key) != value:
+                    data[key] = value
+                    self._dirty.add(key)
+        self.maybe_flush()
+
+    def replace(self, data: Dict) -> None:
+        """
+        Replace the whole session state.
+        """
+        with self._lock:
+            self._data = data
+            self._dirty.update(data.keys())
+        self.maybe_flush()
+
+    def append(self, log: str, entry: Dict) -> None:
+        """
+        Queue an entry for the run or change log.
+        """
+        with self._lock:
+            self._pending.append((log, entry))
+        self.maybe_flush()
+
+    def record_change(self, entry: Dict) -> None:
+        """
+        Store the code of a change log entry as a blob and queue the entry.
+        """
+        with self._lock:
+            heads = dict(self.get("code_heads", {}))
+            entry = self._store_code(entry, heads)
+            self.update(code_heads=heads)
+            self.append("change_log", entry)
+            self._changes_since_compaction += 1
+            if self._changes_since_compaction >= CODE_HISTORY_COMPACT_EVERY:
+                self.compact_code_history()
+
+    def compact_code_history(self, keep_recent: int = CODE_HISTORY_KEEP) -> int:
+        """
+        Prune intermediate code snapshots, keeping the `keep_recent` most recent
+        versions of every file, the current version and anything pinned.
+
+        Returns:
+        int: The number of snapshots deleted.
+        """
+        history = {}
+        for entry in self.since("change_log"):
+            if entry.get("code_hash"):
+                versions = history.setdefault(entry["file_path"], [])
+                if entry["code_hash"] in versions:
+                    versions.remove(entry["code_hash"])
+                versions.append(entry["code_hash"])
+
+        keep = set(self.get("code_heads", {}).values())
+        for versions in history.values():
+            keep.update(versions[-keep_recent:])
+        for checkpoint in self.journal.since(CHECKPOINT_LOG):
+            keep.update(checkpoint["files"].values())
+
+        self._changes_since_compaction = 0
+        return self.blobs.prune(keep)
+
+    def record_checkpoint(self, files: Dict[str, str], **details) -> int:
+        """
+        Store a snapshot of the whole workspace with its evaluation outcome.
+
+        File contents go to the blob store, as deltas against the current
+        version of each file, so a checkpoint costs little more than a journal
+        row. A workspace identical to the last checkpoint is not stored again.
+
+        Returns:
+        int: The id of the checkpoint.
+        """
+        with self._lock:
+            heads = self.get("code_heads", {})
+            hashes = {
+                file_path: self.blobs.put(code, heads.get(file_path))
+                for file_path, code in sorted(files.items())
+            }
+            last = self.journal.last(CHECKPOINT_LOG)
+            if last and last["files"] == hashes:
+                return last["id"]
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            return self.journal.append(
+                CHECKPOINT_LOG, {"files": hashes, "timestamp": timestamp, **details}
+            )
+
+    def checkpoint_files(self, checkpoint: Dict) -> Dict[str, str]:
+        """
+        Return the files of a checkpoint keyed by path.
+        """
+        return {
+            file_path: self.blobs.get(blob_hash)
+            for file_path, blob_hash in checkpoint["files"].items()
+        }
+
+    def pin_current_code(self, label: str = "best") -> None:
+        """
+        Protect the current version of every file from compaction.
+        """
+        self.blobs.pin(self.get("code_heads", {}).values(), label)
+
+    def last(self, log: str) -> Dict:
+        """
+        Return the most recent log entry, including entries not yet flushed.
+        """
+        with self._lock:
+            for pending_log, entry in reversed(self._pending):
+                if pending_log == log:
+                    return dict(entry)
+        return self.journal.last(log)
+
+    def since(self, log: str, entry_id: int = 0) -> List[Dict]:
+        """
+        Return the log entries after `entry_id`. Pending entries are flushed first
+        so that every returned entry carries its id.
+        """
+        self.flush()
+        return self.journal.since(log, entry_id)
+
+    def reset(self) -> None:
+        """
+        Discard the session and recreate config.json, the journal and the code store.
+        """
+        with self._lock:
+            self._pending.clear()
+            self._dirty.clear()
+            create_config()
+            self.journal.clear()
+            self._blobs = None
+            delete_directory(os.path.join(STATE_FOLDER, CODE_STORE))
+            self._load()
+            self._last_flush = time.monotonic()
+
+    def maybe_flush(self) -> None:
+        if (
+            self.flush_interval
+            and time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write dirty fields to config.json in one atomic write and commit queued
+        log entries to the journal in one transaction.
+        """
+        with self._lock:
+            if self._dirty and self._data is not None:
+                write_config(self._data)
+                self._dirty.clear()
+
+            if self._pending:
+                for log in JOURNALED_LOGS:
+                    entries = [entry for name, entry in self._pending if name == log]
+                    if entries:
+                        self.journal.extend(log, entries)
+                self._pending.clear()
+
+            self._last_flush = time.monotonic()
+
+
+_store = None
+
+
+def _handle_termination(signum, frame) -> None:
+    if _store is not None:
+        _store.flush()
+    sys.exit(128 + signum)
+
+
+def get_session_store() -> SessionStore:
+    """
+    Return the process-wide session store, creating it on first use and
+    registering the exit and SIGTERM flush hooks.
+    """
+    global _store
+    if _store is None:
+        _store = SessionStore()
+        atexit.register(_store.flush)
+        if threading.current_thread() is threading.main_thread():
+            if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+                signal.signal(signal.SIGTERM, _handle_termination)
+    return _store
+
+
+def flush_session() -> None:
+    get_session_store().flush()
 
 
 def read_session_config() -> Dict:
-    return read_config()
+    return get_session_store().data
 
 
 def write_session_config(data: Dict) -> None:
-    write_config(data)
+    get_session_store().replace(data)
 
 
 def create_session_config() -> None:
-    create_config()
+    get_session_store().reset()
 
 
 def get_session() -> Tuple[str, str, List[str]]:
-    config_data = read_session_config()
+    store = get_session_store()
     return (
-        config_data.get("last_known_objective", ""),
-        config_data.get("last_known_expected_result", ""),
-        config_data.get("code_files", []),
+        store.get("last_known_objective", ""),
+        store.get("last_known_expected_result", ""),
+        store.get("code_files", []),
+    )
+
+
+def set_session(
+    objective: str,
+    expected_result: str,
+    suite: Dict = None,
+    performance: Dict = None,
+) -> None:
+    store = get_session_store()
+    store.update(
+        last_known_objective=objective,
+        last_known_expected_result=expected_result,
+        last_known_suite=suite,
+        last_known_performance=performance,
+        code_files=get_workspace().paths(),
     )
+    store.flush()
+
+
+def get_session_suite() -> Union[Dict, None]:
+    """
+    Return the test suite of the session, or None for a single expected result.
+    """
+    return get_session_store().get("last_known_suite")
 
 
-def set_session(objective: str, expected_result: str) -> None:
-    config_data = read_session_config()
-    config_data["last_known_objective"] = objective
-    config_data["last_known_expected_result"] = expected_result
-    config_data["code_files"] = list_files(DYNAMIC_FOLDER)
-    write_session_config(config_data)
+def get_session_performance() -> Union[Dict, None]:
+    """
+    Return the performance targets of the session, or None when only the
+    output is checked.
+    """
+    return get_session_store().get("last_known_performance")
 
 
 def update_change_log(
-    file_path: str, code: str, action: str = None, functionality: str = None
+    file_path: str,
+    code: str,
+    action: str = None,
+    functionality: str = None,
+    diff: str = None,
 ) -> None:
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    config_data = read_session_config()
-    change_log = config_data.get("change_log", [])
-    change_log.append(
-        {
-            "file_path": file_path,
-            "action": action,
-            "functionality": functionality,
-            "code": code,
-            "timestamp": timestamp,
-        }
-    )
-    config_data["change_log"] = change_log
-    write_session_config(config_data)
+    entry = {
+        "file_path": file_path,
+        "action": action,
+        "functionality": functionality,
+        "code": code,
+        "timestamp": timestamp,
+    }
+    if diff is not None:
+        entry["diff"] = diff
+    get_session_store().record_change(entry)
+
+
+def get_change_code(entry: Dict) -> Union[str, None]:
+    """
+    Return the code snapshot of a change log entry, or None if the entry was a
+    delete or its snapshot has been compacted away.
+    """
+    if entry.get("code_hash"):
+        return get_session_store().blobs.get(entry["code_hash"])
+    return entry.get("code")
+
+
+def pin_best_code() -> None:
+    get_session_store().pin_current_code("best")
+
+
+def record_checkpoint(files: Dict[str, str], **details) -> int:
+    return get_session_store().record_checkpoint(files, **details)
+
+
+def get_checkpoints() -> List[Dict]:
+    return get_session_store().journal.since(CHECKPOINT_LOG)
+
+
+def get_checkpoint(checkpoint_id: int) -> Dict:
+    return get_session_store().journal.get(CHECKPOINT_LOG, checkpoint_id)
+
+
+def get_checkpoint_files(checkpoint: Dict) -> Dict[str, str]:
+    return get_session_store().checkpoint_files(checkpoint)
 
 
 def get_last_run_log_entry() -> Dict:
-    config_data = read_session_config()
-    run_log = config_data.get("run_log", [])
-    if len(run_log) > 0:
-        return run_log[-1]
-    return {}
+    return get_session_store().last("run_log")
 
 
 def get_last_change_log_entry() -> Dict:
-    config_data = read_session_config()
-    change_log = config_data.get("change_log", [])
-    if len(change_log) > 0:
-        return change_log[-1]
-    return {}
+    return get_session_store().last("change_log")
+
+
+def get_run_log_entries(since_id: int = 0) -> List[Dict]:
+    return get_session_store().since("run_log", since_id)
+
+
+def get_change_log_entries(since_id: int = 0) -> List[Dict]:
+    return get_session_store().since("change_log", since_id)
 
 
 def update_run_log(
-    config_data: Dict, test: str, result: Any, error: Union[str, None]
+    config_data: Dict, test: str, result: Any, error: Union[str, None], **details
 ) -> None:
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    run_log = config_data.get("run_log", [])
-    run_log.append(
-        {"test": test, "timestamp": timestamp, "result": result, "error": error}
+    get_session_store().append(
+        "run_log",
+        {
+            "test": test,
+            "timestamp": timestamp,
+            "result": result,
+            "error": error,
+            **details,
+        },
     )
-    config_data["run_log"] = run_log
-    write_session_config(config_data)
+
+
+def update_session_fields(**fields) -> None:
+    get_session_store().update(**fields)
 
 
 def update_dynamic_files() -> None:
-    config_data = read_session_config()
-    config_data["code_files"] = list_files(DYNAMIC_FOLDER)
-    write_session_config(config_data)
+    get_session_store().update(code_files=get_workspace().paths())
@@ -0,0 +1,282 @@
+import json
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Tuple, Union
+
+from fitness import score_run
+from utils.constants import SUITE_WORKERS, SUITE_MAX_FAILURES, SUITE_FAILURES_SHOWN
+from utils.sandbox import kill_group
+
+# Characters of output, expected result and error shown per failing case
+CASE_TEXT_LIMIT = 400
+
+
+def load_suite(path: str) -> Dict:
+    """
+    Load a test suite from a JSON file.
+
+    The file holds a list of cases, or an object with an optional "objective",
+    an optional "max_failures" and a "cases" list. Each case has an "expected"
+    result, which may use the "regex:" and "predicate:" matchers, and at most
+    one way of passing input besides stdin:
+
+        {"name": "sum", "argv": ["2", "3"], "stdin": "...", "expected": "5"}
+        {"name": "call", "args": [2, 3], "expected": "5"}
+
+    With "args", main(*args) is called and its return value is printed.
+
+    Returns:
+    Dict: {"objective": str or None, "max_failures": int, "cases": [...]},
+    with every case named.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        data = {"cases": data}
+    if not isinstance(data, dict) or not isinstance(data.get("cases"), list):
+        raise ValueError(f"{path}: expected a list of cases or an object with 'cases'.")
+    if not data["cases"]:
+        raise ValueError(f"{path}: the suite has no cases.")
+
+    cases = []
+    for index, case in enumerate(data["cases"], 1):
+        if not isinstance(case, dict) or "expected" not in case:
+            raise ValueError(f"{path}: case {index} needs an 'expected' result.")
+        if "argv" in case and "args" in case:
+            raise ValueError(f"{path}: case {index} cannot have both 'argv' and 'args'.")
+        if not isinstance(case.get("argv", []), list) or not isinstance(
+            case.get("args", []), list
+        ):
+            raise ValueError(f"{path}: 'argv' and 'args' of case {index} must be lists.")
+        cases.append(
+            {
+                "name": str(case.get("name", f"case {index}")),
+                "argv": [str(arg) for arg in case.get("argv", [])],
+                "stdin": case.get("stdin"),
+                "args": case.get("args"),
+                "expected": str(case["expected"]),
+            }
+        )
+
+    return {
+        "objective": data.get("objective"),
+        "max_failures": int(data.get("max_failures", SUITE_MAX_FAILURES)),
+        "cases": cases,
+    }
+
+
+def suite_hash(suite: Dict) -> str:
+    """
+    Return a stable hash of a suite's cases and early-stop setting, for cache keys.
+    """
+    return hashlib.sha256(
+        json.dumps(
+            [suite["cases"], suite.get("max_failures", SUITE_MAX_FAILURES)],
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def case_inputs(case: Dict) -> Dict:
+    return {"argv": case["argv"], "stdin": case["stdin"], "args": case["args"]}
+
+
+def describe_case(case: Dict) -> str:
+    """
+    Describe a case's inputs in one line.
+    """
+    parts = []
+    if case["args"] is not None:
+        parts.append(f"main(*{json.dumps(case['args'])})")
+    if case["argv"]:
+        parts.append(f"argv {json.dumps(case['argv'])}")
+    if case["stdin"]:
+        parts.append(f"stdin {json.dumps(case['stdin'][:CASE_TEXT_LIMIT])}")
+    return f"{case['name']} ({', '.join(parts) or 'no input'})"
+
+
+def suite_expected_result(suite: Dict) -> str:
+    """
+    The expected result of a suite, as shown to the model.
+    """
+    return (
+        f"All {len(suite['cases'])} test cases pass. Cases pass input as command line "
+        "arguments (sys.argv), standard input, or arguments to main(), whose return "
+        "value is printed. Failing cases are listed with the last program result."
+    )
+
+
+def grade_case(case: Dict, evaluation: Dict) -> Dict:
+    """
+    Grade one case run against its expected result.
+    """
+    if evaluation["returncode"] != 0:
+        output, error, score = None, evaluation["error"], 0.0
+    else:
+        output, error = evaluation["output"].strip(), None
+        score = score_run(output, None, case["expected"])
+
+    return {
+        "name": case["name"],
+        "passed": score >= 1.0,
+        "score": score,
+        "output": output,
+        "error": error,
+        "limit": evaluation.get("limit"),
+        "metrics": evaluation.get("metrics"),
+        "skipped": False,
+    }
+
+
+def run_suite(
+    suite: Dict,
+    run_case: Callable[[Dict, Callable[[int], None]], Dict],
+    workers: int = SUITE_WORKERS,
+    max_failures: int = None,
+) -> Dict:
+    """
+    Run the cases of a suite concurrently and aggregate their grades.
+
+    Once `max_failures` cases have failed, cases that have not started are
+    skipped and running ones are killed. Skipped cases score 0.
+
+    Parameters:
+    suite (Dict): The suite, see `load_suite`.
+    run_case (Callable): Runs the candidate with a case's inputs and an
+        `on_start(pid)` callback, returning the run.
+    workers (int): Maximum number of cases run at once.
+    max_failures (int): Failures after which the suite stops; 0 runs every case.
+        Defaults to the suite's "max_failures".
+
+    Returns:
+    Dict: Per-case results in suite order, the passed, failed and skipped
+    counts, the mean score and whether the suite stopped early.
+    """
+    cases = suite["cases"]
+    if max_failures is None:
+        max_failures = suite.get("max_failures", SUITE_MAX_FAILURES)
+    stop = threading.Event()
+    running: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def attempt(index: int) -> Union[Dict, None]:
+        if stop.is_set():
+            return None
+
+        def on_start(pid: int) -> None:
+            with lock:
+                running[index] = pid
+            if stop.is_set():
+                kill_group(pid)
+
+        try:
+            evaluation = run_case(case_inputs(cases[index]), on_start)
+        finally:
+            with lock:
+                running.pop(index, None)
+        return None if stop.is_set() else grade_case(cases[index], evaluation)
+
+    results: List[Union[Dict, None]] = [None] * len(cases)
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        # Each case runs in a copy of this context, so its run is reported to
+        # the active metrics span
+        futures = {
+            executor.submit(contextvars.copy_context().run, attempt, index): index
+            for index in range(len(cases))
+        }
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            result = future.result()
+            if result is None:
+                continue
+            results[futures[future]] = result
+            if not result["passed"]:
+                failures += 1
+                if max_failures and failures >= max_failures and not stop.is_set():
+                    stop.set()
+                    for pending in futures:
+                        pending.cancel()
+                    with lock:
+                        pids = list(running.values())
+                    for pid in pids:
+                        kill_group(pid)
+
+    for index, case in enumerate(cases):
+        if results[index] is None:
+            results[index] = {
+                "name": case["name"],
+                "passed": False,
+                "score": 0.0,
+                "output": None,
+                "error": None,
+                "limit": None,
+                "metrics": None,
+                "skipped": True,
+            }
+
+    passed = sum(result["passed"] for result in results)
+    skipped = sum(result["skipped"] for result in results)
+    return {
+        "cases": results,
+        "passed": passed,
+        "failed": len(results) - passed - skipped,
+        "skipped": skipped,
+        "score": sum(result["score"] for result in results) / len(results),
+        "stopped_early": stop.is_set(),
+    }
+
+
+def format_failures(suite: Dict, evaluation: Dict, shown: int = SUITE_FAILURES_SHOWN) -> str:
+    """
+    Describe the failing cases of a suite run for the next prompt.
+    Passing and skipped cases are only counted.
+    """
+    by_name = {case["name"]: case for case in suite["cases"]}
+    failing = [
+        result
+        for result in evaluation["cases"]
+        if not result["passed"] and not result["skipped"]
+    ]
+
+    lines = [
+        f"{evaluation['passed']} of {len(evaluation['cases'])} test cases passed, "
+        f"{evaluation['failed']} failed"
+        + (f", {evaluation['skipped']} skipped after too many failures" if evaluation["skipped"] else "")
+        + "."
+    ]
+    for result in failing[:shown]:
+        case = by_name[result["name"]]
+        lines.append(f"\n- Case {describe_case(case)}")
+        lines.append(f"  Expected: {case['expected'][:CASE_TEXT_LIMIT]}")
+        if result["error"] is not None:
+            lines.append(f"  Error: {result['error'][-CASE_TEXT_LIMIT:]}")
+        else:
+            lines.append(f"  Got: {(result['output'] or '')[:CASE_TEXT_LIMIT]}")
+    if len(failing) > shown:
+        lines.append(f"\n...and {len(failing) - shown} more failing cases.")
+    return "\n".join(lines)
+
+
+def grade_suite(
+    suite: Dict, evaluation: Dict
+) -> Tuple[bool, Union[str, None], Union[str, None], float]:
+    """
+    Grade a suite run like a single run, see `code_manager.grade_result`.
+
+    Returns:
+    Tuple containing whether every case passed, the result text, the error
+    text and the mean fitness score. The failing cases are described in the
+    error text when any of them raised an error, otherwise in the result text.
+    """
+    if evaluation["passed"] == len(evaluation["cases"]):
+        return True, f"All {evaluation['passed']} test cases passed.", None, 1.0
+
+    failures = format_failures(suite, evaluation)
+    if any(result["error"] is not None for result in evaluation["cases"]):
+        return False, None, failures, evaluation["score"]
+    return False, failures, None, evaluation["score"]
@@ -1,59 +1,461 @@
 import os
-import tiktoken
-
-from numba.core.errors import NumbaDeprecationWarning, NumbaPendingDeprecationWarning
+import sys
+import time
+import asyncio
 import warnings
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, Tuple, Union
 
-warnings.simplefilter("ignore", category=NumbaDeprecationWarning)
-warnings.simplefilter("ignore", category=NumbaPendingDeprecationWarning)
+from loguru import logger
 
-from taxonomyml.lib.api import get_openai_response_chat
-from utils.file_operations import update_prompt_log
-from utils.constants import MAX_TOKENS, OPENAI_MODEL
+from utils.string_operations import count_tokens, truncate_tokens
+from utils.metrics import get_metrics, add_to_span, current_span
+from utils.interaction_log import InteractionLog, build_interaction_record
+from utils.response_cache import ResponseCache, CacheMissError, make_cache_key
+from utils.rate_limiter import RequestScheduler
+from utils.stream_validation import StreamAbort, FenceStripper, make_stream_validator
+from utils.constants import (
+    MAX_TOKENS,
+    OPENAI_MODEL,
+    STATE_FOLDER,
+    RESPONSE_CACHE,
+    RESPONSE_CACHE_MAX_BYTES,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_IN_FLIGHT,
+    LLM_MAX_RETRIES,
+    LLM_RESPONSE_TOKEN_ESTIMATE,
+    LLM_STREAM,
+    LLM_STREAM_ATTEMPTS,
+    INTERACTION_LOG,
+    INTERACTION_LOG_MAX_BYTES,
+    INTERACTION_LOG_BACKUPS,
+)
 
 # Get OPENAI_API_KEY from environment variables
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
+# Response cache mode: "on" (read and write), "off", or "replay" (serve only
+# from the cache and fail on a miss, for deterministic offline re-runs)
+CACHE_MODE = os.environ.get("GENETICML_CACHE_MODE", "on").lower()
+
+# Stream responses and abort invalid ones early ("on"), or wait for whole responses ("off")
+STREAM = os.environ.get(
+    "GENETICML_STREAM", "on" if LLM_STREAM else "off"
+).lower() != "off"
 
-def count_tokens(text: str, model_name="gpt-4"):
-    """Returns the number of tokens in a text string."""
+_response_cache = None
+_scheduler = None
+_interaction_log = None
 
-    encoding = tiktoken.encoding_for_model(model_name)
-    num_tokens = len(encoding.encode(text))
 
-    return num_tokens
+def get_response_cache() -> ResponseCache:
+    """
+    Return the response cache, opening it on first use.
+    """
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            os.path.join(STATE_FOLDER, RESPONSE_CACHE), RESPONSE_CACHE_MAX_BYTES
+        )
+    return _response_cache
 
 
-def get_code(prompt: str, response_type: str = "code") -> str:
+def response_cache_stats() -> Union[Dict[str, int], None]:
     """
-    Send a prompt to get_openai_response_chat and receive code.
+    Return the hit and miss counts of the response cache, or None if it was
+    not used this run.
+    """
+    if _response_cache is None:
+        return None
+    return _response_cache.stats()
 
-    Parameters:
-    - prompt (str): The prompt to be sent to get_openai_response_chat, should be <= 8k tokens.
 
-    Returns:
-    str: The improved code returned by get_openai_response_chat.
+def get_interaction_log() -> InteractionLog:
+    """
+    Return the interaction log, starting its writer thread on first use.
     """
+    global _interaction_log
+    if _interaction_log is None:
+        _interaction_log = InteractionLog(
+            os.path.join(STATE_FOLDER, INTERACTION_LOG),
+            INTERACTION_LOG_MAX_BYTES,
+            INTERACTION_LOG_BACKUPS,
+            count_tokens=lambda text: count_tokens(text, OPENAI_MODEL),
+        )
+    return _interaction_log
 
-    prompt_len = count_tokens(prompt, OPENAI_MODEL)
 
-    if prompt_len > MAX_TOKENS:
-        raise ValueError(f"The prompt exceeds the {OPENAI_MODEL} token limit.")
+def log_interaction(prompt: str, response: Union[str, None], **fields) -> None:
+    """
+    Queue a record of a model interaction for the interaction log.
+
+    The prompt tokens of a model call are reported to the active metrics span
+    right away. Its response tokens are counted by the log's writer thread,
+    off the calling path, and added to the span once written.
+    """
+    on_written = None
+    if not fields.get("cached"):
+        span = current_span()
+        add_to_span(tokens_in=fields.get("tokens_in") or 0)
+        on_written = lambda record: get_metrics().add_to(
+            span, tokens_out=record.get("tokens_out") or 0
+        )
+    get_interaction_log().log(
+        build_interaction_record(prompt, response, model=OPENAI_MODEL, **fields),
+        on_written,
+    )
+
+
+def flush_interaction_log() -> None:
+    """
+    Wait until the queued interactions are written and their tokens reported,
+    if the interaction log was used this run.
+    """
+    if _interaction_log is not None:
+        _interaction_log.flush()
+
+
+@lru_cache(maxsize=None)
+def load_completion_fn() -> Callable:
+    """
+    Import taxonomyml on first use and return get_openai_response_chat.
+
+    taxonomyml pulls in numba and the OpenAI client, which dominate startup
+    time, so they are only loaded when the first model call is made.
+    """
+    from numba.core.errors import (
+        NumbaDeprecationWarning,
+        NumbaPendingDeprecationWarning,
+    )
 
+    warnings.simplefilter("ignore", category=NumbaDeprecationWarning)
+    warnings.simplefilter("ignore", category=NumbaPendingDeprecationWarning)
+
+    from taxonomyml.lib.api import get_openai_response_chat
+
+    return get_openai_response_chat
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Return the request scheduler shared by all asynchronous calls.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler(
+            LLM_REQUESTS_PER_MINUTE,
+            LLM_TOKENS_PER_MINUTE,
+            LLM_MAX_IN_FLIGHT,
+            max_retries=LLM_MAX_RETRIES,
+        )
+    return _scheduler
+
+
+def get_system_message(response_type: str) -> str:
+    """
+    Return the system message for a response type.
+    """
     if response_type == "code":
         system_message = "You are a world-class expert at Python programming.  You always create production-ready and error free code. Your response MUST be ONLY valid Python code and no other text. Ensure all libraries are well-maintained and production-ready. DO NOT Use any samples or example code. DO NOT use markdown in your response."
     elif response_type == "json":
         system_message = "You are a world-class expert at Python programming.  Your goal is production-ready and error free code. Your response MUST be in valid JSON format according to the instructions. For any suggestions you provide, ensure all libraries are well-maintained and production-ready. Avoid asking for any changes that require API keys or other information that is not provided. DO NOT Use any samples or example code."
+    elif response_type == "patch":
+        system_message = "You are a world-class expert at Python programming.  You always create production-ready and error free code. Your response MUST be ONLY SEARCH/REPLACE blocks in the requested format and no other text. Ensure all libraries are well-maintained and production-ready. DO NOT use markdown in your response."
     else:
         raise ValueError(f"Invalid response_type: {response_type}")
 
-    update_prompt_log(prompt)
+    return system_message
+
+
+def prepare_request(
+    prompt: str, response_type: str, use_cache: bool
+) -> Tuple[str, int, str, Union[str, None], Union[str, None]]:
+    """
+    Fit a prompt into the token limit and look it up in the response cache.
+
+    Prompts are assembled within their section budgets, see `format_prompt`;
+    one that still exceeds the limit keeps its head and tail, so the request
+    goes out instead of failing the iteration.
 
-    new_code = get_openai_response_chat(
+    Returns:
+    Tuple containing the prompt, its token count, the system message, the cache
+    key (None when the cache is not used) and the cached response, if any.
+    """
+    prompt_len = count_tokens(prompt, OPENAI_MODEL)
+
+    if prompt_len > MAX_TOKENS:
+        logger.warning(
+            f"The prompt has {prompt_len} tokens, over the {OPENAI_MODEL} limit of "
+            f"{MAX_TOKENS}. Truncating it."
+        )
+        prompt = truncate_tokens(prompt, MAX_TOKENS, OPENAI_MODEL, keep="ends")
+        prompt_len = count_tokens(prompt, OPENAI_MODEL)
+
+    system_message = get_system_message(response_type)
+
+    cache_key = None
+    cached = None
+    if CACHE_MODE == "replay" or (use_cache and CACHE_MODE == "on"):
+        cache_key = make_cache_key(OPENAI_MODEL, system_message, prompt)
+        cached = get_response_cache().get(cache_key)
+        if cached is None and CACHE_MODE == "replay":
+            raise CacheMissError(f"No recorded response for prompt {cache_key}.")
+
+    return prompt, prompt_len, system_message, cache_key, cached
+
+
+def stream_completion(prompt: str, system_message: str) -> Iterator[str]:
+    """
+    Stream the text of a chat completion as it is generated.
+
+    Closing the generator closes the underlying HTTP stream, which stops the
+    generation early.
+    """
+    import openai
+
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt},
+    ]
+
+    if hasattr(openai, "OpenAI"):
+        response = openai.OpenAI(api_key=OPENAI_API_KEY).chat.completions.create(
+            model=OPENAI_MODEL, messages=messages, stream=True
+        )
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+    else:
+        response = openai.ChatCompletion.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            stream=True,
+            api_key=OPENAI_API_KEY,
+        )
+        try:
+            for chunk in response:
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    yield content
+        finally:
+            response.close()
+
+
+def get_streamed_response(
+    prompt: str, response_type: str, system_message: str
+) -> Union[str, None]:
+    """
+    Stream a response, stripping markdown fences as they arrive and validating
+    the growing buffer. A response that is clearly not Python, or not JSON for
+    `response_type="json"`, is aborted mid-generation and requested again.
+
+    Returns:
+    str: The validated response, or None if every attempt was aborted.
+    """
+    for attempt in range(1, LLM_STREAM_ATTEMPTS + 1):
+        stripper = FenceStripper()
+        validator = make_stream_validator(response_type)
+        chunks = stream_completion(prompt, system_message)
+        try:
+            for chunk in chunks:
+                validator.feed(stripper.feed(chunk))
+            validator.feed(stripper.finish())
+            return validator.finish()
+        except StreamAbort as e:
+            logger.warning(f"Aborted streamed response, attempt {attempt}: {e}")
+        finally:
+            chunks.close()
+
+    return None
+
+
+def get_code(
+    prompt: str,
+    response_type: str = "code",
+    use_cache: bool = True,
+    stream: bool = None,
+) -> str:
+    """
+    Send a prompt to get_openai_response_chat and receive code.
+
+    Parameters:
+    - prompt (str): The prompt to be sent to get_openai_response_chat, should be <= 8k tokens.
+    - response_type (str): "code", "json" or "patch".
+    - use_cache (bool): Whether to serve and store the response through the response cache.
+      Pass False when several distinct responses to the same prompt are wanted.
+    - stream (bool): Stream the response and abort early when it is not valid
+      for the response type, falling back to a regular call if every attempt fails.
+      Defaults to GENETICML_STREAM. Streamed calls run under the request scheduler.
+
+    Returns:
+    str: The improved code returned by get_openai_response_chat.
+    """
+    call_site = sys._getframe(1).f_code.co_name
+    stream = STREAM if stream is None else stream
+    with get_metrics().span("get_code", call_site=call_site):
+        return request_code(prompt, response_type, use_cache, stream, call_site)
+
+
+def request_code(
+    prompt: str, response_type: str, use_cache: bool, stream: bool, call_site: str
+) -> str:
+    started = time.perf_counter()
+
+    prompt, prompt_len, system_message, cache_key, cached = prepare_request(
+        prompt, response_type, use_cache
+    )
+    if cached is not None:
+        add_to_span(cache_hits=1)
+        log_interaction(
+            prompt,
+            cached,
+            response_type=response_type,
+            call_site=call_site,
+            tokens_in=prompt_len,
+            latency=time.perf_counter() - started,
+            cached=True,
+        )
+        return cached
+
+    new_code = None
+    if stream:
+        new_code = asyncio.run(
+            get_scheduler().run(
+                lambda: asyncio.to_thread(
+                    get_streamed_response, prompt, response_type, system_message
+                ),
+                tokens=prompt_len + LLM_RESPONSE_TOKEN_ESTIMATE,
+            )
+        )
+
+    streamed = new_code is not None
+    if new_code is None:
+        get_openai_response_chat = load_completion_fn()
+
+        new_code = get_openai_response_chat(
+            prompt,
+            model=OPENAI_MODEL,
+            system_message=system_message,
+            openai_api_key=OPENAI_API_KEY,
+        )
+
+    log_interaction(
+        prompt,
+        new_code,
+        response_type=response_type,
+        call_site=call_site,
+        tokens_in=prompt_len,
+        latency=time.perf_counter() - started,
+        streamed=streamed,
+    )
+
+    if cache_key and new_code:
+        get_response_cache().put(cache_key, new_code)
+
+    return new_code
+
+
+async def get_code_async(
+    prompt: str,
+    response_type: str = "code",
+    use_cache: bool = True,
+    completion_fn: Callable = None,
+    stream: bool = None,
+) -> str:
+    """
+    Asynchronous version of `get_code` that runs under the shared request scheduler.
+
+    Calls are limited by LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE and
+    LLM_MAX_IN_FLIGHT, and rate-limit or transient errors are retried with
+    jittered backoff, so many of these can be awaited together.
+
+    Parameters:
+    - prompt (str): The prompt to send.
+    - response_type (str): "code", "json" or "patch".
+    - use_cache (bool): Whether to serve and store the response through the response cache.
+    - completion_fn (Callable): Blocking function with the signature of
+      get_openai_response_chat. Defaults to it; pass another to target a local
+      fake server in tests. Responses from a given `completion_fn` are not streamed.
+    - stream (bool): Stream the response, see `get_code`. Defaults to GENETICML_STREAM.
+
+    Returns:
+    str: The model response.
+    """
+    call_site = sys._getframe(1).f_code.co_name
+    stream = STREAM and completion_fn is None if stream is None else stream
+    with get_metrics().span("get_code", call_site=call_site):
+        return await request_code_async(
+            prompt, response_type, use_cache, completion_fn, stream, call_site
+        )
+
+
+async def request_code_async(
+    prompt: str,
+    response_type: str,
+    use_cache: bool,
+    completion_fn: Union[Callable, None],
+    stream: bool,
+    call_site: str,
+) -> str:
+    started = time.perf_counter()
+
+    prompt, prompt_len, system_message, cache_key, cached = prepare_request(
+        prompt, response_type, use_cache
+    )
+    if cached is not None:
+        add_to_span(cache_hits=1)
+        log_interaction(
+            prompt,
+            cached,
+            response_type=response_type,
+            call_site=call_site,
+            tokens_in=prompt_len,
+            latency=time.perf_counter() - started,
+            cached=True,
+        )
+        return cached
+
+    new_code = None
+    if stream:
+        new_code = await get_scheduler().run(
+            lambda: asyncio.to_thread(
+                get_streamed_response, prompt, response_type, system_message
+            ),
+            tokens=prompt_len + LLM_RESPONSE_TOKEN_ESTIMATE,
+        )
+
+    streamed = new_code is not None
+    if new_code is None:
+        completion_fn = completion_fn or load_completion_fn()
+
+        async def call():
+            return await asyncio.to_thread(
+                completion_fn,
+                prompt,
+                model=OPENAI_MODEL,
+                system_message=system_message,
+                openai_api_key=OPENAI_API_KEY,
+            )
+
+        new_code = await get_scheduler().run(
+            call, tokens=prompt_len + LLM_RESPONSE_TOKEN_ESTIMATE
+        )
+
+    log_interaction(
         prompt,
-        model=OPENAI_MODEL,
-        system_message=system_message,
-        openai_api_key=OPENAI_API_KEY,
+        new_code,
+        response_type=response_type,
+        call_site=call_site,
+        tokens_in=prompt_len,
+        latency=time.perf_counter() - started,
+        streamed=streamed,
     )
 
+    if cache_key and new_code:
+        get_response_cache().put(cache_key, new_code)
+
     return new_code
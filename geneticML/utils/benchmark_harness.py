@@ -0,0 +1,111 @@
+"""
+Benchmark harness for a candidate's main(), run in the candidate sandbox.
+
+    python benchmark_harness.py dynamic_main/dynamic_main.py '{"warmup": 1, ...}'
+
+The candidate is loaded without running its __main__ block. main() is called
+`warmup` times, then timed for up to `repeats` runs or `max_time` seconds,
+then run once under tracemalloc for its peak memory and, with `profile`, once
+under cProfile for its hot spots. Everything has to fit in `budget` seconds,
+the wall time the sandbox allows: the timed runs stop early to leave time for
+the tracemalloc and cProfile passes, and a pass that would not fit is skipped.
+The output of main() is discarded. The measurements are printed as JSON on
+the last line, after RESULT_MARKER.
+
+Only the standard library may be used here.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import pstats
+import cProfile
+import contextlib
+import tracemalloc
+
+RESULT_MARKER = "__geneticml_benchmark__"
+# Rough slowdown of main() under tracemalloc and under cProfile
+TRACEMALLOC_SLOWDOWN = 3
+PROFILE_SLOWDOWN = 2
+
+
+def hotspots(profiler, root, count):
+    stats = pstats.Stats(profiler).stats
+    entries = []
+    for (file_name, line, function), (_, calls, own, total, _) in stats.items():
+        if file_name == __file__ or "_lsprof" in function:
+            continue
+        if file_name.startswith(root):
+            file_name = os.path.relpath(file_name, root)
+        entries.append(
+            {
+                "function": function,
+                "file": file_name,
+                "line": line,
+                "calls": calls,
+                "own_time": round(own, 6),
+                "total_time": round(total, 6),
+            }
+        )
+    entries.sort(key=lambda entry: entry["own_time"], reverse=True)
+    return entries[:count]
+
+
+def main():
+    harness_started = time.perf_counter()
+    target, config = sys.argv[1], json.loads(sys.argv[2])
+    budget = config.get("budget") or float("inf")
+    profile = config.get("profile")
+
+    def time_left():
+        return budget - (time.perf_counter() - harness_started)
+    root = os.getcwd()
+    sys.path[0] = os.path.dirname(os.path.abspath(target))
+    sys.argv = [target, *config.get("argv", [])]
+    args = config.get("args") or []
+
+    entry = runpy.run_path(target, run_name="__candidate__")["main"]
+    sink = open(os.devnull, "w")
+
+    def call():
+        with contextlib.redirect_stdout(sink):
+            entry(*args)
+
+    for _ in range(config.get("warmup", 0)):
+        call()
+
+    times = []
+    started = time.perf_counter()
+    for _ in range(config.get("repeats", 5)):
+        run_started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - run_started)
+        slowest = max(times)
+        reserve = slowest * (TRACEMALLOC_SLOWDOWN + (PROFILE_SLOWDOWN if profile else 0))
+        if time_left() < slowest + reserve or (
+            time.perf_counter() - started > config.get("max_time", 30) and len(times) >= 3
+        ):
+            break
+
+    peak_memory = None
+    if time_left() > slowest * TRACEMALLOC_SLOWDOWN:
+        tracemalloc.start()
+        call()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = {"times": times, "peak_memory": peak_memory, "hotspots": []}
+    if profile and time_left() > slowest * PROFILE_SLOWDOWN:
+        profiler = cProfile.Profile()
+        with contextlib.redirect_stdout(sink):
+            profiler.enable()
+            entry(*args)
+            profiler.disable()
+        result["hotspots"] = hotspots(profiler, root, config.get("hotspots", 8))
+
+    print(f"\n{RESULT_MARKER}{json.dumps(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import os
+import json
+import zlib
+import difflib
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Union
+
+
+def content_hash(content: str) -> str:
+    """
+    Return the SHA-256 hex digest of a string.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def make_delta(base: str, content: str) -> List:
+    """
+    Encode `content` as line operations against `base`.
+
+    Returns:
+    List: Operations, either ["c", start, end] to copy base lines or
+    ["i", text] to insert new text.
+    """
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["c", i1, i2])
+        elif j2 > j1:
+            ops.append(["i", "".join(new_lines[j1:j2])])
+    return ops
+
+
+def apply_delta(base: str, ops: List) -> str:
+    """
+    Rebuild content from a base string and the operations from `make_delta`.
+    """
+    base_lines = base.splitlines(keepends=True)
+    parts = []
+    for op in ops:
+        if op[0] == "c":
+            parts.extend(base_lines[op[1] : op[2]])
+        else:
+            parts.append(op[1])
+    return "".join(parts)
+
+
+class BlobStore:
+    """
+    Content-addressed store for code snapshots.
+
+    Each snapshot is stored once under the hash of its content. When a base
+    version is given, the snapshot is stored as a zlib-compressed line delta
+    against it, up to `max_chain` deltas deep, after which a full copy is
+    written. Pinned hashes survive `prune`.
+    """
+
+    def __init__(self, root: str, max_chain: int = 20, cache_size: int = 32) -> None:
+        self.root = root
+        self.max_chain = max_chain
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pins_path = os.path.join(root, "pins.json")
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    def _object_path(self, blob_hash: str) -> str:
+        return os.path.join(self.root, "objects", blob_hash[:2], blob_hash[2:])
+
+    def _read_record(self, blob_hash: str) -> Dict:
+        with open(self._object_path(blob_hash), "rb") as f:
+            return json.loads(zlib.decompress(f.read()).decode("utf-8"))
+
+    def _write_record(self, blob_hash: str, record: Dict) -> None:
+        path = self._object_path(blob_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(zlib.compress(json.dumps(record).encode("utf-8")))
+        os.replace(temp_path, path)
+
+    def _remember(self, blob_hash: str, content: str) -> None:
+        self._cache[blob_hash] = content
+        self._cache.move_to_end(blob_hash)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def exists(self, blob_hash: str) -> bool:
+        return os.path.exists(self._object_path(blob_hash))
+
+    def hashes(self) -> Set[str]:
+        """
+        Return the hashes of every stored object.
+        """
+        objects = os.path.join(self.root, "objects")
+        found = set()
+        for prefix in os.listdir(objects):
+            for name in os.listdir(os.path.join(objects, prefix)):
+                if not name.endswith(".tmp"):
+                    found.add(prefix + name)
+        return found
+
+    def put(self, content: str, base_hash: Union[str, None] = None) -> str:
+        """
+        Store content and return its hash.
+
+        Parameters:
+        content (str): The snapshot to store.
+        base_hash (str): Hash of the previous version of the same file, if any.
+
+        Returns:
+        str: The content hash.
+        """
+        blob_hash = content_hash(content)
+        if self.exists(blob_hash):
+            self._remember(blob_hash, content)
+            return blob_hash
+
+        record = {"base": None, "depth": 0, "ops": [["i", content]]}
+
+        if base_hash and base_hash != blob_hash and self.exists(base_hash):
+            base_record = self._read_record(base_hash)
+            if base_record["depth"] < self.max_chain:
+                ops = make_delta(self.get(base_hash), content)
+                if len(json.dumps(ops)) < len(content):
+                    record = {
+                        "base": base_hash,
+                        "depth": base_record["depth"] + 1,
+                        "ops": ops,
+                    }
+
+        self._write_record(blob_hash, record)
+        self._remember(blob_hash, content)
+        return blob_hash
+
+    def get(self, blob_hash: str) -> Union[str, None]:
+        """
+        Return the content stored under a hash, or None if it is not stored.
+        """
+        if blob_hash in self._cache:
+            self._cache.move_to_end(blob_hash)
+            return self._cache[blob_hash]
+
+        if not self.exists(blob_hash):
+            return None
+
+        # Walk down to the nearest full copy or cached version, then replay
+        chain = []
+        current = blob_hash
+        content = None
+        while current is not None:
+            if current in self._cache:
+                content = self._cache[current]
+                break
+            record = self._read_record(current)
+            chain.append(record)
+            current = record["base"]
+
+        for record in reversed(chain):
+            content = apply_delta(content or "", record["ops"])
+
+        self._remember(blob_hash, content)
+        return content
+
+    def pins(self) -> Dict[str, List[str]]:
+        """
+        Return pinned hashes grouped by label.
+        """
+        if not os.path.exists(self._pins_path):
+            return {}
+        with open(self._pins_path, "r") as f:
+            return json.load(f)
+
+    def pin(self, hashes: Iterable[str], label: str) -> None:
+        """
+        Pin hashes under a label, replacing whatever the label pinned before.
+        """
+        pins = self.pins()
+        pins[label] = sorted(set(hashes))
+        with open(self._pins_path, "w") as f:
+            json.dump(pins, f, indent=4, sort_keys=True)
+
+    def prune(self, keep: Iterable[str]) -> int:
+        """
+        Delete every object that is neither in `keep` nor pinned.
+
+        Objects that are kept but stored as deltas against a deleted object are
+        rewritten as full copies first.
+
+        Returns:
+        int: The number of objects deleted.
+        """
+        keep = set(keep)
+        for hashes in self.pins().values():
+            keep.update(hashes)
+
+        stored = self.hashes()
+        doomed = stored - keep
+
+        for blob_hash in stored & keep:
+            record = self._read_record(blob_hash)
+            base = record["base"]
+            depends_on_doomed = False
+            while base is not None:
+                if base in doomed:
+                    depends_on_doomed = True
+                    break
+                base = self._read_record(base)["base"]
+            if depends_on_doomed:
+                content = self.get(blob_hash)
+                self._write_record(
+                    blob_hash, {"base": None, "depth": 0, "ops": [["i", content]]}
+                )
+
+        for blob_hash in doomed:
+            os.remove(self._object_path(blob_hash))
+            self._cache.pop(blob_hash, None)
+
+        return len(doomed)
@@ -2,4 +2,104 @@ MAX_TOKENS = 8000
 OPENAI_MODEL = "gpt-4"
 DYNAMIC_MAIN = "dynamic_main.py"
 DYNAMIC_FOLDER = "dynamic_main"
-PROMPT_FILE = "prompt.log"
+CONFIG_FILE = "config.json"
+STATE_FOLDER = ".geneticml"
+SESSION_JOURNAL = "session.db"
+SESSION_FLUSH_INTERVAL = 30
+CODE_STORE = "code_store"
+CODE_HISTORY_KEEP = 3
+CODE_HISTORY_COMPACT_EVERY = 50
+# Revert to the best checkpoint after this many iterations without improvement, 0 never
+CHECKPOINT_REVERT_AFTER = 3
+PROMPT_TOKEN_BUDGET = 6000
+# Per-section token budgets for prompt assembly, listed from the lowest to the
+# highest priority. Sections are shrunk in this order when a prompt is too long.
+PROMPT_SECTION_BUDGETS = {
+    "repo_map": 1200,
+    "last_change": 400,
+    "other_result": 400,
+    "result": 800,
+    "performance": 800,
+    "other_error": 800,
+    "error": 1500,
+    "other_code_content": 2500,
+    "code_content": 4000,
+    "functionality": 800,
+    "expected_result": 1000,
+    "objective": 600,
+}
+# Which part of a section survives truncation.
+PROMPT_SECTION_KEEP = {
+    "repo_map": "head",
+    "last_change": "head",
+    "other_result": "ends",
+    "result": "ends",
+    "performance": "head",
+    "other_error": "tail",
+    "error": "tail",
+    "other_code_content": "ends",
+    "code_content": "ends",
+    "functionality": "head",
+    "expected_result": "ends",
+    "objective": "head",
+}
+RESPONSE_CACHE = "response_cache.db"
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+LLM_REQUESTS_PER_MINUTE = 200
+LLM_TOKENS_PER_MINUTE = 40000
+LLM_MAX_IN_FLIGHT = 4
+LLM_MAX_RETRIES = 5
+LLM_RESPONSE_TOKEN_ESTIMATE = 1000
+LLM_STREAM = False
+LLM_STREAM_ATTEMPTS = 3
+INTERACTION_LOG = "interactions.jsonl"
+INTERACTION_LOG_MAX_BYTES = 10 * 1024 * 1024
+INTERACTION_LOG_BACKUPS = 5
+METRICS_LOG = "metrics.jsonl"
+METRICS_FILE = "metrics.prom"
+POPULATION_SIZE = 6
+POPULATION_GENERATIONS = 5
+POPULATION_ELITISM = 1
+POPULATION_WORKERS = 4
+POPULATION_SELECTION = "tournament"
+POPULATION_TOURNAMENT_SIZE = 3
+POPULATION_CROSSOVER_RATE = 0.3
+# How much likelier a file in the error traceback is to be mutated
+POPULATION_TRACEBACK_WEIGHT = 4
+SPECULATIVE_CANDIDATES = 1
+EVALUATION_CACHE = "evaluation_cache.db"
+EVALUATION_CACHE_TTL = 24 * 60 * 60
+FITNESS_NUMERIC_TOLERANCE = 0.0
+FITNESS_NUMERIC_SCALE = 100.0
+FITNESS_RUN_FLOOR = 0.1
+FITNESS_EDIT_DISTANCE_LIMIT = 500
+COMBINED_EDIT_MODE = False
+EDIT_MODE = "full"
+PATCH_FUZZY_THRESHOLD = 0.8
+REPO_MAP = "repo_map.json"
+MODULE_CACHE = "module_cache.json"
+SESSION_ENVIRONMENT = "venv"
+ENVIRONMENT_LOCKFILE = "requirements.lock"
+# Wheels shared by every session, used as a local package index
+WHEEL_CACHE = "~/.cache/geneticml/wheels"
+WARM_WORKER_COUNT = 4
+# Candidate run limits: seconds for the times, bytes for the sizes. 0 disables a limit.
+RUN_LIMITS = {
+    "wall_time": 60,
+    "cpu_time": 60,
+    "memory": 4 * 1024 * 1024 * 1024,
+    "file_size": 100 * 1024 * 1024,
+    "output": 1024 * 1024,
+}
+SUITE_WORKERS = 4
+SUITE_MAX_FAILURES = 3
+SUITE_FAILURES_SHOWN = 5
+BENCHMARK_WARMUP = 1
+BENCHMARK_REPEATS = 10
+BENCHMARK_MAX_TIME = 30
+# Wall time of the whole benchmark run: warmup, timed runs, tracemalloc and cProfile
+BENCHMARK_TIME_BUDGET = 90
+# Added to the budget for starting the interpreter and loading the candidate
+BENCHMARK_WALL_HEADROOM = 15
+BENCHMARK_HOTSPOTS = 8
+BENCHMARK_PROFILE = True
@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, Union
+
+
+class EvaluationCache:
+    """
+    Persistent cache of candidate runs keyed by workspace fingerprint.
+
+    Entries older than `ttl` seconds are ignored, so programs whose output
+    depends on outside state are eventually run again. The connection is
+    shared by the threads evaluating candidates and suite cases, so every
+    query holds a lock.
+    """
+
+    def __init__(self, path: str, ttl: float) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS evaluations (
+                fingerprint TEXT PRIMARY KEY,
+                evaluation TEXT NOT NULL,
+                created REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        self.connection.commit()
+
+    def get(self, fingerprint: str) -> Union[Dict, None]:
+        """
+        Return the cached run for a fingerprint, or None if missing or expired.
+        """
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT evaluation, created FROM evaluations WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+
+            if row is None or time.time() - row[1] > self.ttl:
+                return None
+
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE evaluations SET hits = hits + 1 WHERE fingerprint = ?",
+                    (fingerprint,),
+                )
+        return json.loads(row[0])
+
+    def put(self, fingerprint: str, evaluation: Dict) -> None:
+        """
+        Store the run of a workspace.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO evaluations (fingerprint, evaluation, created, hits) VALUES (?, ?, ?, 0)",
+                (fingerprint, json.dumps(evaluation), time.time()),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM evaluations")
@@ -2,8 +2,10 @@ import os
 import json
 import glob
 import shutil
+import tempfile
+from typing import Dict
 
-from utils.constants import DYNAMIC_FOLDER, DYNAMIC_MAIN
+from utils.constants import DYNAMIC_FOLDER, DYNAMIC_MAIN, CONFIG_FILE
 
 
 def read_file(file_path: str) -> str:
@@ -53,12 +55,46 @@ def delete_file(file_path: str) -> None:
         os.remove(file_path)
 
 
+def read_directory(directory_path: str) -> Dict[str, str]:
+    """
+    Read every file in a directory into a dictionary keyed by file path.
+    """
+    return {
+        file_path: read_file(file_path)
+        for file_path in list_files(directory_path)
+        if os.path.isfile(file_path)
+    }
+
+
+def write_files(root: str, files: Dict[str, str]) -> None:
+    """
+    Write files keyed by relative path under a root directory.
+    """
+    for file_path, content in files.items():
+        target = os.path.join(root, file_path)
+        make_directory(os.path.dirname(target))
+        write_file(target, content)
+
+
+def create_scratch_workspace(files: Dict[str, str]) -> str:
+    """
+    Create a temporary directory holding the given workspace files.
+
+    Returns:
+    str: The path of the temporary directory. Remove it with `delete_directory`.
+    """
+    root = tempfile.mkdtemp(prefix="geneticml-")
+    make_directory(os.path.join(root, DYNAMIC_FOLDER))
+    write_files(root, files)
+    return root
+
+
 def read_config():
     """
     Read the config.json file and return its contents as a Python dictionary.
     """
     try:
-        with open("config.json", "r") as f:
+        with open(CONFIG_FILE, "r") as f:
             return json.load(f)
     except FileNotFoundError:
         create_config()
@@ -75,38 +111,26 @@ def read_config():
 def write_config(data):
     """
     Write a Python dictionary into the config.json file overwriting its contents.
+
+    The data is written to a temporary file first and moved into place, so a
+    crash mid-write never leaves a truncated config.json behind.
     """
-    with open("config.json", "w") as f:
+    temp_path = f"{CONFIG_FILE}.tmp"
+    with open(temp_path, "w") as f:
         json.dump(data, f, indent=4, sort_keys=True)
+    os.replace(temp_path, CONFIG_FILE)
 
 
 def create_config():
     """
     Create a config.json file with the default values.
+
+    The run and change logs live in the session journal, not in config.json.
     """
     data = {
         "last_known_objective": "",
         "last_known_expected_result": "",
         "code_files": [],
-        "change_log": [],
-        "run_log": [],
     }
     write_config(data)
 
-
-def maybe_create_prompt_log():
-    """
-    Create a prompt.log file if it doesn't exist.
-    """
-    if not os.path.exists("prompt.log"):
-        write_file("prompt.log", "")
-
-
-def update_prompt_log(prompt: str):
-    """
-    Append the given prompt to the prompt.log file.
-    """
-    maybe_create_prompt_log()
-
-    with open("prompt.log", "a") as f:
-        f.write(prompt + "\n")
@@ -0,0 +1,62 @@
+import ast
+import hashlib
+from typing import Dict
+
+
+def _strip_docstrings(tree: ast.AST) -> ast.AST:
+    """
+    Remove docstrings from modules, classes and functions in place.
+    """
+    for node in ast.walk(tree):
+        if isinstance(
+            node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+        ):
+            body = node.body
+            if (
+                body
+                and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)
+            ):
+                node.body = body[1:] or [ast.Pass()]
+    return tree
+
+
+def code_fingerprint(code: str) -> str:
+    """
+    Fingerprint Python code by its normalized AST.
+
+    Whitespace, comments, formatting and docstrings do not change the
+    fingerprint. Code that does not parse is fingerprinted by its text with
+    surrounding whitespace removed from every line.
+
+    Returns:
+    str: SHA-256 hex digest.
+    """
+    try:
+        normalized = "ast:" + ast.dump(
+            _strip_docstrings(ast.parse(code)), include_attributes=False
+        )
+    except (SyntaxError, ValueError):
+        normalized = "text:" + "\n".join(
+            line.strip() for line in code.splitlines() if line.strip()
+        )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def workspace_fingerprint(files: Dict[str, str]) -> str:
+    """
+    Fingerprint a whole workspace from its file paths and normalized contents.
+
+    Returns:
+    str: SHA-256 hex digest.
+    """
+    digest = hashlib.sha256()
+    for file_path in sorted(files):
+        content = files[file_path]
+        if file_path.endswith(".py"):
+            file_hash = code_fingerprint(content)
+        else:
+            file_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        digest.update(f"{file_path}\0{file_hash}\0".encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,160 @@
+import os
+import glob
+import gzip
+import json
+import queue
+import shutil
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Union
+
+
+class InteractionLog:
+    """
+    Structured JSONL log of model interactions, written by a background thread.
+
+    Callers only put records on a queue. The writer thread drains the queue in
+    batches, fills in derived fields (such as output token counts) off the hot
+    path, and rotates the file into gzip-compressed backups once it grows past
+    `max_bytes`, keeping the newest `backups` of them. A record may come with
+    an `on_written` callback, called by the writer thread with the completed
+    record, e.g. to report its output tokens.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        backups: int,
+        count_tokens: Callable[[str], int] = None,
+    ) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.count_tokens = count_tokens
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="interaction-log", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(
+        self, record: Dict[str, Any], on_written: Callable[[Dict], None] = None
+    ) -> None:
+        """
+        Queue a record for writing.
+        """
+        if not self._closed:
+            self._queue.put((record, on_written))
+
+    def flush(self) -> None:
+        """
+        Wait until every queued record is written.
+        """
+        if not self._closed:
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        Write any queued records and stop the writer thread.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            done = len(batch)
+            if None in batch:
+                running = False
+                batch = [item for item in batch if item is not None]
+
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in range(done):
+                    self._queue.task_done()
+
+    def _write(self, batch) -> None:
+        with open(self.path, "a") as f:
+            for record, _ in batch:
+                if (
+                    self.count_tokens
+                    and record.get("tokens_out") is None
+                    and record.get("response") is not None
+                ):
+                    try:
+                        record["tokens_out"] = self.count_tokens(record["response"])
+                    except Exception:
+                        pass
+                f.write(json.dumps(record) + "\n")
+
+        for record, on_written in batch:
+            if on_written is not None:
+                try:
+                    on_written(record)
+                except Exception:
+                    pass
+
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base, extension = os.path.splitext(self.path)
+        with open(self.path, "rb") as source, gzip.open(
+            f"{base}.{stamp}{extension}.gz", "wb"
+        ) as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.path)
+
+        rotated = sorted(glob.glob(f"{base}.*{extension}.gz"))
+        for old in rotated[: max(len(rotated) - self.backups, 0)]:
+            os.remove(old)
+
+
+def build_interaction_record(
+    prompt: str,
+    response: Union[str, None],
+    model: str,
+    response_type: str,
+    call_site: str,
+    tokens_in: int,
+    latency: float,
+    cached: bool = False,
+    streamed: bool = False,
+    tokens_out: int = None,
+) -> Dict[str, Any]:
+    """
+    Build an interaction log record. Latency is given in seconds.
+    """
+    return {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
+        "call_site": call_site,
+        "model": model,
+        "response_type": response_type,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "latency_ms": round(latency * 1000, 1),
+        "cached": cached,
+        "streamed": streamed,
+        "prompt": prompt,
+        "response": response,
+    }
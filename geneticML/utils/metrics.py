@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import math
+import asyncio
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from utils.constants import STATE_FOLDER, METRICS_LOG
+
+# Fields summed into a span; max_rss keeps the maximum instead
+SPAN_COUNTERS = ("tokens_in", "tokens_out", "cache_hits", "subprocesses", "cpu_time")
+
+# Name, type, help text and per-phase field of each exported metric. The
+# phase wall time is exported as a summary with its p50 and p95.
+PROMETHEUS_METRICS = [
+    ("geneticml_phase_seconds", "summary", "Wall time of each phase.", None),
+    ("geneticml_phase_errors_total", "counter", "Phase calls that raised.", "errors"),
+    ("geneticml_tokens_in_total", "counter", "Prompt tokens sent.", "tokens_in"),
+    ("geneticml_tokens_out_total", "counter", "Response tokens received.", "tokens_out"),
+    (
+        "geneticml_cache_hits_total",
+        "counter",
+        "Model responses and evaluations served from a cache.",
+        "cache_hits",
+    ),
+    ("geneticml_subprocesses_total", "counter", "Candidate runs.", "subprocesses"),
+    (
+        "geneticml_subprocess_cpu_seconds_total",
+        "counter",
+        "CPU time of candidate runs.",
+        "cpu_time",
+    ),
+    (
+        "geneticml_subprocess_max_rss_bytes",
+        "gauge",
+        "Peak memory of a candidate run.",
+        "max_rss",
+    ),
+]
+
+_active = contextvars.ContextVar("geneticml_span", default=None)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+class Metrics:
+    """
+    Collects timed spans of the phases of an iteration.
+
+    A span records its wall time and whatever the code inside it reports with
+    `add`: tokens in and out, cache hits and the resource usage of candidate
+    subprocesses. Reports go to the innermost active span of the current
+    context, so they follow asyncio tasks and `asyncio.to_thread`; thread
+    pools must run their work in a copy of the submitting context.
+
+    Finished spans are appended to a JSONL file as they end. `write_prometheus`
+    writes per-phase summaries in the Prometheus text format. Both files
+    describe the current run only. Spans of a phase with a `call_site` label,
+    such as the model calls of "get_code", are summarized per call site.
+    """
+
+    def __init__(self, log_path: str = None) -> None:
+        self.log_path = log_path
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+        self._log = None
+
+    @contextmanager
+    def span(self, phase: str, **labels) -> Iterator[Dict]:
+        parent = _active.get()
+        record = {
+            "phase": phase,
+            "parent": parent["phase"] if parent else None,
+            "timestamp": time.time(),
+            **labels,
+            **{counter: 0 for counter in SPAN_COUNTERS},
+            "max_rss": None,
+            "error": None,
+        }
+        token = _active.set(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["wall_time"] = time.perf_counter() - started
+            _active.reset(token)
+            self._finish(record)
+
+    def add(self, **fields) -> None:
+        """
+        Add counters to the innermost active span, if any.
+        """
+        self.add_to(_active.get(), **fields)
+
+    def add_to(self, record: Union[Dict, None], **fields) -> None:
+        """
+        Add counters to a span, also after it finished, e.g. from a background
+        thread. Counters added late are in the summaries but not in the span log.
+        """
+        if record is None:
+            return
+        with self._lock:
+            for key, value in fields.items():
+                if value is None:
+                    continue
+                if key == "max_rss":
+                    record["max_rss"] = max(record["max_rss"] or 0, value)
+                else:
+                    record[key] = record.get(key, 0) + value
+
+    def _finish(self, record: Dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+            if self.log_path is None:
+                return
+            if self._log is None:
+                directory = os.path.dirname(self.log_path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                self._log = open(self.log_path, "w")
+            self._log.write(json.dumps(record) + "\n")
+            self._log.flush()
+
+    def phases(self) -> Dict[Tuple[str, Union[str, None]], Dict]:
+        """
+        Aggregate the spans by phase and call site: count, p50, p95 and total
+        wall time, and the summed counters.
+
+        Returns:
+        Dict: Summaries keyed by (phase, call site), with a call site of None
+        for spans without one.
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        grouped: Dict[Tuple[str, Union[str, None]], List[Dict]] = {}
+        for record in spans:
+            key = (record["phase"], record.get("call_site"))
+            grouped.setdefault(key, []).append(record)
+
+        phases = {}
+        for key, records in grouped.items():
+            times = [record["wall_time"] for record in records]
+            rss = [record["max_rss"] for record in records if record["max_rss"]]
+            phases[key] = {
+                "count": len(records),
+                "errors": sum(record["error"] is not None for record in records),
+                "p50": percentile(times, 0.5),
+                "p95": percentile(times, 0.95),
+                "total": sum(times),
+                **{
+                    counter: sum(record[counter] for record in records)
+                    for counter in SPAN_COUNTERS
+                },
+                "max_rss": max(rss) if rss else None,
+            }
+        return phases
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Write the per-phase summaries in the Prometheus text exposition format.
+        """
+        phases = self.phases()
+        lines = []
+        for name, kind, description, field in PROMETHEUS_METRICS:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for phase, call_site in sorted(phases, key=lambda key: (key[0], key[1] or "")):
+                stats = phases[(phase, call_site)]
+                label = f'phase="{phase}"'
+                if call_site:
+                    label += f',call_site="{call_site}"'
+                if field is None:
+                    lines.append(f'{name}{{{label},quantile="0.5"}} {stats["p50"]:.6f}')
+                    lines.append(f'{name}{{{label},quantile="0.95"}} {stats["p95"]:.6f}')
+                    lines.append(f"{name}_sum{{{label}}} {stats['total']:.6f}")
+                    lines.append(f"{name}_count{{{label}}} {stats['count']}")
+                elif stats[field] is not None:
+                    lines.append(f"{name}{{{label}}} {stats[field]}")
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+    def format_summary(self) -> str:
+        """
+        Describe each phase in a table: calls, p50, p95 and total wall time,
+        tokens in and out, cache hits and candidate CPU time.
+        """
+        phases = self.phases()
+        if not phases:
+            return "No phases were recorded."
+
+        header = (
+            f"{'phase':45} {'calls':>6} {'p50 s':>9} {'p95 s':>9} {'total s':>9} "
+            f"{'tokens in':>10} {'tokens out':>10} {'cached':>6} {'cpu s':>8}"
+        )
+        lines = [header, "-" * len(header)]
+        for (phase, call_site), stats in sorted(
+            phases.items(), key=lambda item: item[1]["total"], reverse=True
+        ):
+            name = f"{phase} ({call_site})" if call_site else phase
+            lines.append(
+                f"{name:45} {stats['count']:>6} {stats['p50']:>9.3f} {stats['p95']:>9.3f} "
+                f"{stats['total']:>9.3f} {stats['tokens_in']:>10} {stats['tokens_out']:>10} "
+                f"{stats['cache_hits']:>6} {stats['cpu_time']:>8.3f}"
+            )
+        return "\n".join(lines)
+
+
+_metrics = None
+
+
+def get_metrics() -> Metrics:
+    """
+    Return the metrics of this run, starting its span log on first use.
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(os.path.join(STATE_FOLDER, METRICS_LOG))
+    return _metrics
+
+
+def add_to_span(**fields) -> None:
+    get_metrics().add(**fields)
+
+
+def current_span() -> Union[Dict, None]:
+    """
+    Return the innermost active span of the current context, if any.
+    """
+    return _active.get()
+
+
+def instrument(phase: str) -> Callable:
+    """
+    Decorator timing every call of a function, or coroutine function, as a span.
+    """
+
+    def decorate(function: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with get_metrics().span(phase):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_metrics().span(phase):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,172 @@
+import re
+import difflib
+from typing import List, Tuple
+
+SEARCH_MARKER = re.compile(r"^<{5,}\s*SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,}\s*REPLACE\s*$")
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+
+class PatchError(ValueError):
+    """
+    Raised when a patch cannot be parsed or applied.
+    """
+
+
+def parse_search_replace_blocks(text: str) -> List[Tuple[str, str]]:
+    """
+    Parse SEARCH/REPLACE blocks of the form:
+
+        <<<<<<< SEARCH
+        old lines
+        =======
+        new lines
+        >>>>>>> REPLACE
+
+    Returns:
+    List[Tuple[str, str]]: (search, replace) pairs.
+    """
+    blocks = []
+    state = None
+    search, replace = [], []
+
+    for line in text.splitlines(keepends=True):
+        stripped = line.rstrip("\r\n")
+        if state is None and SEARCH_MARKER.match(stripped):
+            state, search, replace = "search", [], []
+        elif state == "search" and DIVIDER_MARKER.match(stripped):
+            state = "replace"
+        elif state == "replace" and REPLACE_MARKER.match(stripped):
+            blocks.append(("".join(search), "".join(replace)))
+            state = None
+        elif state == "search":
+            search.append(line)
+        elif state == "replace":
+            replace.append(line)
+
+    if state is not None:
+        raise PatchError("Unterminated SEARCH/REPLACE block.")
+    return blocks
+
+
+def parse_unified_diff(text: str) -> List[Tuple[str, str]]:
+    """
+    Convert the hunks of a unified diff into (search, replace) pairs, so they can
+    be applied by content rather than by line number.
+    """
+    blocks = []
+    search, replace = None, None
+
+    for line in text.splitlines(keepends=True):
+        if HUNK_HEADER.match(line):
+            if search is not None:
+                blocks.append(("".join(search), "".join(replace)))
+            search, replace = [], []
+        elif search is None or line.startswith(("---", "+++", "\\")):
+            continue
+        elif line.startswith("-"):
+            search.append(line[1:])
+        elif line.startswith("+"):
+            replace.append(line[1:])
+        else:
+            context = line[1:] if line.startswith(" ") else line
+            search.append(context)
+            replace.append(context)
+
+    if search is not None:
+        blocks.append(("".join(search), "".join(replace)))
+    return blocks
+
+
+def parse_patch(text: str) -> List[Tuple[str, str]]:
+    """
+    Parse SEARCH/REPLACE blocks or a unified diff.
+    """
+    blocks = parse_search_replace_blocks(text)
+    if not blocks:
+        blocks = parse_unified_diff(text)
+    if not blocks:
+        raise PatchError("No SEARCH/REPLACE blocks or diff hunks found.")
+    return blocks
+
+
+def _ensure_newline(text: str) -> str:
+    return text if not text or text.endswith("\n") else text + "\n"
+
+
+def find_block(
+    lines: List[str], search_lines: List[str], threshold: float
+) -> Tuple[int, int]:
+    """
+    Locate the lines to replace, trying an exact match, then a match ignoring
+    whitespace, then the most similar window of the same length.
+
+    Returns:
+    Tuple[int, int]: Start and end line indexes.
+    """
+    size = len(search_lines)
+    windows = range(len(lines) - size + 1)
+
+    for normalize in (lambda line: line.rstrip(), lambda line: "".join(line.split())):
+        target = [normalize(line) for line in search_lines]
+        for start in windows:
+            if [normalize(line) for line in lines[start : start + size]] == target:
+                return start, start + size
+
+    best_ratio, best_start = 0.0, None
+    target = "".join(search_lines)
+    for start in windows:
+        ratio = difflib.SequenceMatcher(
+            None, "".join(lines[start : start + size]), target
+        ).ratio()
+        if ratio > best_ratio:
+            best_ratio, best_start = ratio, start
+
+    if best_start is None or best_ratio < threshold:
+        raise PatchError(
+            f"Could not find the lines to replace (best match {best_ratio:.2f}):\n{target}"
+        )
+    return best_start, best_start + size
+
+
+def apply_patch(source: str, patch: str, threshold: float = 0.8) -> str:
+    """
+    Apply SEARCH/REPLACE blocks or a unified diff to source code.
+
+    Parameters:
+    source (str): The current file contents.
+    patch (str): The patch text.
+    threshold (float): Minimum similarity for a fuzzy match.
+
+    Returns:
+    str: The patched file contents.
+    """
+    lines = _ensure_newline(source).splitlines(keepends=True)
+
+    for search, replace in parse_patch(patch):
+        replace_lines = _ensure_newline(replace).splitlines(keepends=True)
+        search_lines = _ensure_newline(search).splitlines(keepends=True)
+
+        if not "".join(search_lines).strip():
+            lines.extend(replace_lines)
+            continue
+
+        start, end = find_block(lines, search_lines, threshold)
+        lines[start:end] = replace_lines
+
+    return "".join(lines)
+
+
+def make_diff(old: str, new: str, file_path: str) -> str:
+    """
+    Return a unified diff between two versions of a file.
+    """
+    return "".join(
+        difflib.unified_diff(
+            _ensure_newline(old).splitlines(keepends=True),
+            _ensure_newline(new).splitlines(keepends=True),
+            fromfile=f"a/{file_path}",
+            tofile=f"b/{file_path}",
+        )
+    )
@@ -1,8 +1,22 @@
 import os
-
-from utils.constants import DYNAMIC_FOLDER, DYNAMIC_MAIN
-from utils.file_operations import read_file, list_files
-
+from typing import Dict
+
+from utils.constants import (
+    DYNAMIC_FOLDER,
+    DYNAMIC_MAIN,
+    OPENAI_MODEL,
+    PROMPT_TOKEN_BUDGET,
+    PROMPT_SECTION_BUDGETS,
+    PROMPT_SECTION_KEEP,
+    STATE_FOLDER,
+    REPO_MAP,
+)
+from utils.workspace import get_workspace
+from utils.string_operations import count_tokens, truncate_tokens
+from utils.repo_map import RepoMap
+
+# Approximate token count of the fixed instructions in the action selection prompt
+ACTION_SELECTION_OVERHEAD_TOKENS = 400
 
 OUTLINE_PROMPT = """Outline the files and functionalities needed to achieve the objective: `{objective}`.
     The main file should be named `{DYNAMIC_MAIN}`. The main function should be named `main()`. `main()` will be called to test your code.
@@ -24,14 +38,20 @@ IMPROVE_PROMPT = """Improve the following Python code to that is part of a progr
         - Last program result: 
         {result}
 
+        - Last program fitness score (0 = failed, 1 = expected result): 
+        {score}
+
         - Last program error: 
         {error}
 
+        - Last program performance (if benchmarked): 
+        {performance}
+
         - Functionality changes required (if any): 
         {functionality}
 
-        - All program filenames:
-        {all_files}
+        - Program map (files, imports, classes and functions):
+        {repo_map}
 
         - The filename for this code: 
         {file_path}
@@ -43,6 +63,48 @@ IMPROVE_PROMPT = """Improve the following Python code to that is part of a progr
         """
 
 
+PATCH_PROMPT = """Improve the following Python code that is part of a program designed to achieve the objective: '{objective}'.
+
+        - Expected program result: 
+        {expected_result}
+
+        - Last program result: 
+        {result}
+
+        - Last program fitness score (0 = failed, 1 = expected result): 
+        {score}
+
+        - Last program error: 
+        {error}
+
+        - Last program performance (if benchmarked): 
+        {performance}
+
+        - Functionality changes required (if any): 
+        {functionality}
+
+        - Program map (files, imports, classes and functions):
+        {repo_map}
+
+        - The filename for this code: 
+        {file_path}
+
+        - Code to improve:
+        {code_content}
+
+        Respond ONLY with one or more SEARCH/REPLACE blocks that change the code, in this format:
+        <<<<<<< SEARCH
+        exact lines copied from the current code
+        =======
+        the lines that replace them
+        >>>>>>> REPLACE
+
+        Copy the SEARCH lines exactly, including indentation, and keep each block as small as possible.
+        
+        - SEARCH/REPLACE blocks:
+        """
+
+
 CREATE_PROMPT = """Create the following Python code to that is part of a program designed to achieve the objective: '{objective}'.
         - Expected program result: 
         {expected_result}
@@ -50,14 +112,17 @@ CREATE_PROMPT = """Create the following Python code to that is part of a program
         - Last program result:
         {result}
 
+        - Last program fitness score (0 = failed, 1 = expected result): 
+        {score}
+
         Last program error:
         {error}
 
         - Functionality required: 
         {functionality}
 
-        - All program filenames:
-        {all_files}
+        - Program map (files, imports, classes and functions):
+        {repo_map}
 
         - The filename for this code: 
         {file_path}
@@ -65,71 +130,296 @@ CREATE_PROMPT = """Create the following Python code to that is part of a program
         Code for file:"""
 
 
+CROSSOVER_PROMPT = """Combine two versions of the same Python file from a program designed to achieve the objective: '{objective}'.
+        Keep the parts of each version that bring the program closer to the expected result.
+
+        - Expected program result: 
+        {expected_result}
+
+        - The filename for this code: 
+        {file_path}
+
+        - First version result: 
+        {result}
+
+        - First version fitness score: 
+        {score}
+
+        - First version error: 
+        {error}
+
+        - First version code:
+        {code_content}
+
+        - Second version result: 
+        {other_result}
+
+        - Second version fitness score: 
+        {other_score}
+
+        - Second version error: 
+        {other_error}
+
+        - Second version code:
+        {other_code_content}
+
+        - Combined code for file:
+        """
+
+
+ACTION_SELECTION_INSTRUCTIONS = """Please select a new file to take action on to meet the objective
+        Actions include: create, edit, or delete.
+        The output should be a valid JSON object with:
+                - The key `file` and the value as the file path (string).
+                - The key `action` and the value as the action to take on the file (string).
+                - The key `functionality` and the value as the functionality instructions to create or edit in the file (string)."""
+
+
+SELECT_AND_EDIT_INSTRUCTIONS = (
+    ACTION_SELECTION_INSTRUCTIONS
+    + """
+                - The key `code` and the value as the complete new Python code for the file when the action is create or edit, or an empty string when the action is delete (string). The code must be valid Python with no markdown."""
+)
+
+
+_repo_map = None
+
+
+def get_repo_map() -> RepoMap:
+    """
+    Return the symbol index of the dynamic workspace, loading it on first use.
+    """
+    global _repo_map
+    if _repo_map is None:
+        _repo_map = RepoMap(
+            DYNAMIC_FOLDER,
+            main_file=os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN),
+            path=os.path.join(STATE_FOLDER, REPO_MAP),
+        )
+    return _repo_map
+
+
+def render_repo_map(
+    focus: str = None, files: Dict[str, str] = None, model_name: str = OPENAI_MODEL
+) -> str:
+    """
+    Render the repo map for a prompt, within the "repo_map" section budget.
+
+    Parameters:
+    focus (str): The file the prompt is about, listed first with the files it imports.
+    files (Dict[str, str]): Files to map instead of the dynamic folder.
+    model_name (str): The model whose tokenizer is used.
+
+    Returns:
+    str: The map.
+    """
+    repo_map = get_repo_map()
+    if files is None:
+        repo_map.update(get_workspace().contents())
+    return repo_map.render(
+        PROMPT_SECTION_BUDGETS["repo_map"],
+        lambda text: count_tokens(text, model_name),
+        focus=focus,
+        files=files,
+    )
+
+
+def format_score(score: float = None) -> str:
+    """
+    Format a fitness score for a prompt.
+    """
+    return "unknown" if score is None else f"{score:.3f}"
+
+
+def fit_sections(
+    sections: Dict[str, str],
+    overhead_tokens: int = 0,
+    budget: int = PROMPT_TOKEN_BUDGET,
+    model_name: str = OPENAI_MODEL,
+) -> Dict[str, str]:
+    """
+    Fit prompt sections into a token budget.
+
+    Each section is first capped at its own budget from PROMPT_SECTION_BUDGETS.
+    If the sections plus `overhead_tokens` still exceed `budget`, sections are
+    shrunk token-accurately from the lowest priority upwards until they fit.
+
+    Parameters:
+    sections (Dict[str, str]): Section name to text.
+    overhead_tokens (int): Tokens used by the rest of the prompt.
+    budget (int): Total token budget for the prompt.
+    model_name (str): The model whose tokenizer is used.
+
+    Returns:
+    Dict[str, str]: The fitted sections.
+    """
+    fitted = {}
+    sizes = {}
+    for name, text in sections.items():
+        text = "" if text is None else str(text)
+        if name in PROMPT_SECTION_BUDGETS:
+            text = truncate_tokens(
+                text,
+                PROMPT_SECTION_BUDGETS[name],
+                model_name,
+                keep=PROMPT_SECTION_KEEP.get(name, "head"),
+            )
+        fitted[name] = text
+        sizes[name] = count_tokens(text, model_name)
+
+    overflow = overhead_tokens + sum(sizes.values()) - budget
+
+    for name in PROMPT_SECTION_BUDGETS:
+        if overflow <= 0:
+            break
+        if not sizes.get(name):
+            continue
+        target = max(sizes[name] - overflow, 0)
+        fitted[name] = truncate_tokens(
+            fitted[name],
+            target,
+            model_name,
+            keep=PROMPT_SECTION_KEEP.get(name, "head"),
+        )
+        new_size = count_tokens(fitted[name], model_name)
+        overflow -= sizes[name] - new_size
+        sizes[name] = new_size
+
+    return fitted
+
+
+def format_prompt(
+    template: str,
+    budget: int = PROMPT_TOKEN_BUDGET,
+    model_name: str = OPENAI_MODEL,
+    **fields,
+) -> str:
+    """
+    Format a prompt template, fitting its budgeted sections into `budget` tokens.
+
+    Fields named in PROMPT_SECTION_BUDGETS may be shrunk; all other fields are
+    inserted unchanged.
+    """
+    sections = {
+        name: value for name, value in fields.items() if name in PROMPT_SECTION_BUDGETS
+    }
+    overhead = count_tokens(
+        template.format(**{**fields, **{name: "" for name in sections}}), model_name
+    )
+    fitted = fit_sections(sections, overhead, budget, model_name)
+    return template.format(**{**fields, **fitted})
+
+
 def build_action_selection_prompt(
     objective: str,
     error: str = None,
     result: str = None,
     expected_result: str = None,
     last_change: dict = None,
+    score: float = None,
+    instructions: str = ACTION_SELECTION_INSTRUCTIONS,
+    include_all_code: bool = False,
+    performance: str = None,
 ) -> str:
     """
     Build a prompt to ask the language model to select a file and an action to take on it.
+
+    With `include_all_code`, the code of every program file is included instead
+    of only the main file, so `instructions` can ask for the new code as well.
+    `performance` describes the last benchmark, when the objective has
+    performance targets.
     """
 
-    # Get all files in the dynamic folder
-    all_files = list_files(DYNAMIC_FOLDER)
+    # Index the dynamic folder; only files that changed are parsed again
+    all_files = get_workspace().contents()
+    repo_map = render_repo_map()
 
     last_changed_file = last_change.get("file_path", None)
     last_changed_action = last_change.get("action", None)
     last_changed_functionality = last_change.get("functionality", None)
 
+    last_change_text = ""
+    if last_changed_file:
+        last_change_text = f"""{last_changed_action} {last_changed_file}
+
+                - The functionality you requested for the file:
+                {last_changed_functionality}"""
+
+    if include_all_code:
+        code_label = "All program files and their code"
+        code_content = "\n\n".join(
+            f"# File: {file_path}\n{code}" for file_path, code in all_files.items()
+        )
+    else:
+        code_label = "The main file's code"
+        code_content = get_workspace().read(os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN))
+
+    # Shrink the variable sections so the whole prompt fits the token budget
+    sections = fit_sections(
+        {
+            "code_content": code_content,
+            "repo_map": repo_map,
+            "error": error or "",
+            "result": result or "",
+            "performance": performance or "",
+            "last_change": last_change_text,
+            "objective": objective,
+            "expected_result": expected_result or "",
+        },
+        overhead_tokens=ACTION_SELECTION_OVERHEAD_TOKENS,
+    )
+
     # Generate a prompt to ask the language model to generate code for each file
     file_prompt = f"""I am developing a Python program with the following objective: 
-        {objective}.
+        {sections["objective"]}.
 
         - The main file of the program (entrypoint): 
         {DYNAMIC_MAIN}.
 
-        - The main file's code: 
-        {read_file(os.path.join(DYNAMIC_FOLDER, DYNAMIC_MAIN))}.
+        - {code_label}: 
+        {sections["code_content"]}.
 
-        - All program filenames:
-        {all_files}
+        - Program map (files, imports, classes and functions):
+        {sections["repo_map"]}
         """
 
     if error:
         file_prompt += f"""
                 - Last program error:
-                {error}
+                {sections["error"]}
 
                 """
 
     if result:
         file_prompt += f"""
                 - Expected program result: 
-                {expected_result}
+                {sections["expected_result"]}
                 
                 - Last program result:
-                {result}
+                {sections["result"]}
+                """
+
+    if score is not None:
+        file_prompt += f"""
+                - Last program fitness score (0 = failed, 1 = expected result):
+                {score:.3f}
+                """
+
+    if performance:
+        file_prompt += f"""
+                - Last program performance:
+                {sections["performance"]}
                 """
 
     if last_changed_file:
         file_prompt += f"""
                 - Here is the last file change you requested: 
-                {last_changed_action} {last_changed_file}
-
-                - The functionality you requested for the file:
-                {last_changed_functionality}
+                {sections["last_change"]}
 
                 These changes were already implemented.
                 
                 """
 
-    file_prompt += f"""Please select a new file to take action on to meet the objective
-        Actions include: create, edit, or delete.
-        The output should be a valid JSON object with:
-                - The key `file` and the value as the file path (string).
-                - The key `action` and the value as the action to take on the file (string).
-                - The key `functionality` and the value as the functionality instructions to create or edit in the file (string)."""
+    file_prompt += instructions
 
     return file_prompt
@@ -0,0 +1,135 @@
+import time
+import random
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable
+
+
+def loop_local(primitives: weakref.WeakKeyDictionary, factory: Callable[[], Any]) -> Any:
+    """
+    Return the asyncio primitive of the running event loop, creating it on
+    first use. Locks and semaphores are bound to the loop they are first
+    contended in, while the limiters outlive each `asyncio.run`.
+    """
+    loop = asyncio.get_running_loop()
+    primitive = primitives.get(loop)
+    if primitive is None:
+        primitive = primitives[loop] = factory()
+    return primitive
+
+
+class TokenBucket:
+    """
+    Asynchronous token bucket refilled continuously at `rate_per_minute`.
+
+    The tokens are shared by every event loop the bucket is used from; each
+    loop waits on a lock of its own.
+    """
+
+    def __init__(self, rate_per_minute: float) -> None:
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._locks = weakref.WeakKeyDictionary()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Wait until `amount` tokens are available and take them. Requests larger
+        than the bucket are clamped to its capacity so they can still proceed.
+        """
+        amount = min(amount, self.capacity)
+        async with loop_local(self._locks, asyncio.Lock):
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Return True for rate-limit and transient API or network errors.
+    """
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status in (408, 409, 429, 500, 502, 503, 504):
+        return True
+
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        marker in name
+        for marker in (
+            "RateLimit",
+            "Timeout",
+            "APIConnection",
+            "ServiceUnavailable",
+            "TryAgain",
+        )
+    )
+
+
+class RequestScheduler:
+    """
+    Schedules language model calls under requests-per-minute, tokens-per-minute
+    and in-flight limits, retrying transient failures with jittered backoff.
+
+    One scheduler serves every `asyncio.run` of the process. The rate limits
+    are shared across event loops and the in-flight limit applies per loop.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_in_flight: int,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+    ) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return the delay before retry `attempt`, using full jitter.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: int) -> Any:
+        """
+        Run `call` once the limits allow it.
+
+        Parameters:
+        call (Callable): Zero-argument coroutine function making the request.
+        tokens (int): Estimated tokens the request will consume.
+
+        Returns:
+        Any: The result of `call`.
+        """
+        semaphore = loop_local(
+            self._semaphores, lambda: asyncio.Semaphore(self.max_in_flight)
+        )
+
+        attempt = 0
+        while True:
+            await self.requests.acquire(1)
+            await self.tokens.acquire(tokens)
+            async with semaphore:
+                try:
+                    return await call()
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+            await asyncio.sleep(self.backoff(attempt))
+            attempt += 1
@@ -0,0 +1,286 @@
+import os
+import ast
+import json
+import hashlib
+from typing import Callable, Dict, List, Union
+
+DOCSTRING_MAX_CHARS = 120
+
+
+def _docstring_summary(node: ast.AST) -> Union[str, None]:
+    docstring = ast.get_docstring(node)
+    if not docstring:
+        return None
+    summary = docstring.strip().splitlines()[0].strip()
+    if len(summary) > DOCSTRING_MAX_CHARS:
+        summary = summary[: DOCSTRING_MAX_CHARS - 3] + "..."
+    return summary
+
+
+def _signature(node: Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _class_signature(node: ast.ClassDef) -> str:
+    bases = [ast.unparse(base) for base in node.bases]
+    bases += [ast.unparse(keyword) for keyword in node.keywords]
+    return f"class {node.name}({', '.join(bases)})" if bases else f"class {node.name}"
+
+
+def index_module(source: str) -> Dict:
+    """
+    Extract the top-level functions and classes of a module, with their
+    signatures and docstring summaries, and the modules it imports.
+
+    Returns:
+    Dict: {"symbols": [...], "imports": [...], "error": str or None}
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return {"symbols": [], "imports": [], "error": f"{e.msg} (line {e.lineno})"}
+
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append(
+                {
+                    "name": node.name,
+                    "signature": _signature(node),
+                    "doc": _docstring_summary(node),
+                    "line": node.lineno,
+                }
+            )
+        elif isinstance(node, ast.ClassDef):
+            methods = [
+                {
+                    "name": child.name,
+                    "signature": _signature(child),
+                    "doc": _docstring_summary(child),
+                    "line": child.lineno,
+                }
+                for child in node.body
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+            ]
+            symbols.append(
+                {
+                    "name": node.name,
+                    "signature": _class_signature(node),
+                    "doc": _docstring_summary(node),
+                    "line": node.lineno,
+                    "methods": methods,
+                }
+            )
+
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            # Keep the imported names too: "from a import b" may import module a.b
+            imports.update(
+                f"{node.module}.{alias.name}" if node.module else alias.name
+                for alias in node.names
+            )
+
+    return {"symbols": symbols, "imports": sorted(imports), "error": None}
+
+
+def module_name(file_path: str, root: str) -> str:
+    """
+    Return the dotted module name of a file relative to the workspace root.
+    """
+    relative = os.path.splitext(os.path.relpath(file_path, root))[0]
+    parts = relative.split(os.sep)
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+class RepoMap:
+    """
+    Incrementally maintained symbol index of the dynamic workspace.
+
+    Modules are indexed by content hash, so only files whose contents changed
+    are parsed again. The index is saved to `path` and reloaded on start.
+    Other files, such as CSV, JSON or text data, are listed by name only.
+    """
+
+    def __init__(self, root: str, main_file: str = None, path: str = None) -> None:
+        self.root = root
+        self.main_file = main_file
+        self.path = path
+        self.modules: Dict[str, Dict] = {}
+        self.files: Dict[str, str] = {}
+        self.data_files: List[str] = []
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.modules = data["modules"]
+            self.files = data["files"]
+        except (OSError, ValueError, KeyError):
+            self.modules, self.files = {}, {}
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"modules": self.modules, "files": self.files}, f)
+        os.replace(temp_path, self.path)
+
+    def _index(self, content: str) -> str:
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        if digest not in self.modules:
+            self.modules[digest] = index_module(content)
+        return digest
+
+    def update(self, files: Dict[str, str]) -> List[str]:
+        """
+        Bring the index in line with the workspace files.
+
+        Parameters:
+        files (Dict[str, str]): File path to contents of every workspace file.
+
+        Returns:
+        List[str]: Paths that were added, changed or removed.
+        """
+        python_files = {
+            file_path: content
+            for file_path, content in files.items()
+            if file_path.endswith(".py")
+        }
+        hashes = {
+            file_path: self._index(content)
+            for file_path, content in python_files.items()
+        }
+        data_files = sorted(set(files) - set(python_files))
+
+        changed = sorted(
+            {
+                file_path
+                for file_path in set(hashes) | set(self.files)
+                if hashes.get(file_path) != self.files.get(file_path)
+            }
+            | set(data_files).symmetric_difference(self.data_files)
+        )
+        self.data_files = data_files
+        if changed or len(self.modules) != len(set(hashes.values())):
+            self.files = hashes
+            live = set(hashes.values())
+            self.modules = {
+                digest: module
+                for digest, module in self.modules.items()
+                if digest in live
+            }
+            self._save()
+        return changed
+
+    def local_imports(self, file_path: str, files: Dict[str, str] = None) -> List[str]:
+        """
+        Return the workspace files a module imports.
+        """
+        files = self.files if files is None else files
+        by_module = {module_name(path, self.root): path for path in files}
+        module = self.modules.get(files.get(file_path), {})
+
+        imported = []
+        for name in module.get("imports", []):
+            parts = name.split(".")
+            # "from a import b" may name the module a.b or the symbol b of module a
+            for end in range(len(parts), 0, -1):
+                target = by_module.get(".".join(parts[:end]))
+                if target and target != file_path:
+                    imported.append(target)
+                    break
+        return sorted(set(imported))
+
+    def render_file(self, file_path: str, files: Dict[str, str] = None) -> str:
+        """
+        Render the map entry of one file.
+        """
+        files = self.files if files is None else files
+        module = self.modules.get(files.get(file_path), {})
+
+        lines = [f"{file_path}:"]
+        local = self.local_imports(file_path, files)
+        if local:
+            lines.append(f"  imports: {', '.join(local)}")
+        if module.get("error"):
+            lines.append(f"  (does not parse: {module['error']})")
+
+        for symbol in module.get("symbols", []):
+            doc = f"  # {symbol['doc']}" if symbol.get("doc") else ""
+            lines.append(f"  {symbol['signature']}{doc}")
+            for method in symbol.get("methods", []):
+                doc = f"  # {method['doc']}" if method.get("doc") else ""
+                lines.append(f"    {method['signature']}{doc}")
+        return "\n".join(lines)
+
+    def render(
+        self,
+        budget: int,
+        count_tokens: Callable[[str], int],
+        focus: str = None,
+        files: Dict[str, str] = None,
+    ) -> str:
+        """
+        Render a token-budgeted map of the workspace.
+
+        Files are listed in order of relevance: the focus file, the files it
+        imports, the main file, then the rest. Files that no longer fit the
+        budget, and files that are not Python, are listed by name only.
+
+        Parameters:
+        budget (int): Maximum tokens for the map.
+        count_tokens (Callable[[str], int]): Token counter.
+        focus (str): The file the prompt is about, if any.
+        files (Dict[str, str]): Render these files instead of the indexed workspace,
+            e.g. a population candidate. They are indexed by hash without being saved.
+
+        Returns:
+        str: The map.
+        """
+        if files is not None:
+            data_files = sorted(path for path in files if not path.endswith(".py"))
+            files = {
+                file_path: self._index(content)
+                for file_path, content in files.items()
+                if file_path.endswith(".py")
+            }
+        else:
+            data_files = self.data_files
+            files = self.files
+
+        order = []
+        if focus in files:
+            order.append(focus)
+            order.extend(self.local_imports(focus, files))
+        order.extend(sorted(files, key=lambda path: (path != self.main_file, path)))
+        order = list(dict.fromkeys(order))
+
+        entries, used, omitted = [], 0, []
+        for file_path in order:
+            entry = self.render_file(file_path, files)
+            size = count_tokens(entry)
+            if omitted or used + size > budget:
+                omitted.append(file_path)
+                continue
+            entries.append(entry)
+            used += size
+
+        if omitted:
+            entries.append(f"Other files: {', '.join(omitted)}")
+        if data_files:
+            entries.append(f"Data files: {', '.join(data_files)}")
+        return "\n".join(entries)
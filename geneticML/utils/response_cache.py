@@ -0,0 +1,129 @@
+import os
+import time
+import sqlite3
+import hashlib
+from typing import Dict, Union
+
+
+class CacheMissError(KeyError):
+    """
+    Raised in replay mode when a prompt has no recorded response.
+    """
+
+
+def make_cache_key(model: str, system_message: str, prompt: str) -> str:
+    """
+    Return the cache key for a model, system message and prompt.
+    """
+    digest = hashlib.sha256()
+    for part in (model, system_message, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk cache of language model responses with size-based LRU eviction.
+
+    Responses are keyed on the model, system message and prompt. When the
+    stored responses exceed `max_bytes`, the least recently used ones are
+    evicted. Hit and miss counts are kept for the life of the object.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self.connection.commit()
+
+    def get(self, key: str) -> Union[str, None]:
+        """
+        Return the cached response for a key, or None, updating the counters.
+        """
+        row = self.connection.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self.connection:
+            self.connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Store a response and evict least recently used entries over the size limit.
+        """
+        size = len(response.encode("utf-8"))
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+        self.evict()
+
+    def total_bytes(self) -> int:
+        return self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def evict(self) -> int:
+        """
+        Delete least recently used responses until the cache fits `max_bytes`.
+
+        Returns:
+        int: The number of responses evicted.
+        """
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return 0
+
+        evicted = []
+        for key, size in self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall():
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        return len(evicted)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return hit and miss counts, entry count and stored size.
+        """
+        entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "bytes": self.total_bytes(),
+        }
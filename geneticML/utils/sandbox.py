@@ -0,0 +1,331 @@
+"""
+Resource limits and supervision for candidate runs.
+
+Shared by the cold subprocess path and the warm worker forks, so this module
+only uses the standard library.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import tempfile
+import threading
+import subprocess
+from typing import IO, Callable, Dict, List, Set, Union
+
+# Imported here rather than in `apply_limits`, which runs in a child forked
+# from a threaded parent, where taking the import lock can deadlock
+if os.name == "posix":
+    import resource
+else:
+    resource = None
+
+# Limits: wall_time and cpu_time in seconds, memory, file_size and output in bytes.
+# A limit of None or 0 is not enforced.
+LIMIT_NAMES = ("wall_time", "cpu_time", "memory", "file_size", "output")
+
+POLL_MIN_INTERVAL = 0.001
+POLL_MAX_INTERVAL = 0.02
+
+# Loads a script without running its __main__ block, then calls main(*args)
+# and prints what it returns. Used for test cases given as function arguments.
+CALL_MAIN = """
+import os, sys, json, runpy
+path, args = sys.argv[1], json.loads(sys.argv[2])
+sys.argv = [path]
+sys.path[0] = os.path.dirname(os.path.abspath(path))
+result = runpy.run_path(path, run_name="__candidate__")["main"](*args)
+if result is not None:
+    print(result)
+"""
+
+
+def candidate_command(python: str, script: str, inputs: Dict = None) -> List[str]:
+    """
+    Build the command that runs a script with a test case's argv or main() arguments.
+    """
+    inputs = inputs or {}
+    if inputs.get("args") is not None:
+        return [python, "-c", CALL_MAIN, script, json.dumps(inputs["args"])]
+    return [python, script, *inputs.get("argv", [])]
+
+
+def apply_limits(limits: Dict) -> None:
+    """
+    Apply CPU, memory and file-size rlimits to the current process.
+    Called in the child, before the candidate starts.
+    """
+    if resource is None:
+        return
+
+    def set_limit(kind: int, soft: int, hard: int) -> None:
+        try:
+            resource.setrlimit(kind, (soft, hard))
+        except (ValueError, OSError):
+            pass
+
+    if limits.get("cpu_time"):
+        cpu = max(int(limits["cpu_time"]), 1)
+        set_limit(resource.RLIMIT_CPU, cpu, cpu + 1)
+    if limits.get("memory"):
+        set_limit(resource.RLIMIT_AS, limits["memory"], limits["memory"])
+    if limits.get("file_size"):
+        set_limit(resource.RLIMIT_FSIZE, limits["file_size"], limits["file_size"])
+
+
+def kill_group(pid: int) -> None:
+    """
+    Kill a run and every process it started.
+    """
+    kill = getattr(signal, "SIGKILL", signal.SIGTERM)
+    try:
+        os.killpg(pid, kill)
+    except (AttributeError, OSError):
+        try:
+            os.kill(pid, kill)
+        except OSError:
+            pass
+
+
+class RunGroup:
+    """
+    The runs started for one evaluation, killed together by `cancel`.
+
+    Pass `track()` as the `on_start` callback of each run. A run that starts
+    after the group was cancelled is killed as soon as it starts.
+    """
+
+    def __init__(self) -> None:
+        self.cancelled = threading.Event()
+        self.pids: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def track(self, on_start: Callable[[int], None] = None) -> Callable[[int], None]:
+        def started(pid: int) -> None:
+            with self._lock:
+                self.pids.add(pid)
+            if on_start is not None:
+                on_start(pid)
+            if self.cancelled.is_set():
+                kill_group(pid)
+
+        return started
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            pids = list(self.pids)
+        for pid in pids:
+            kill_group(pid)
+
+
+def _size(file: IO) -> int:
+    return os.fstat(file.fileno()).st_size
+
+
+def supervise(
+    pid: int,
+    outputs: List[IO],
+    limits: Dict,
+    started: float,
+    process: subprocess.Popen = None,
+) -> Dict:
+    """
+    Wait for a run while enforcing the wall-clock and output limits.
+
+    The run's process group is killed when it runs too long or when its
+    captured output grows past the output limit. CPU, memory and file-size
+    limits are enforced by the kernel through `apply_limits`.
+
+    Parameters:
+    pid (int): The run's process id, also its process group id.
+    outputs (List[IO]): Files capturing the run's stdout and stderr.
+    limits (Dict): The run limits.
+    started (float): `time.perf_counter()` when the run started.
+    process (subprocess.Popen): The Popen object, if any, updated with the return code.
+
+    Returns:
+    Dict: The return code, the limit that stopped the run, if any, and the
+    run metrics: wall_time, cpu_time, max_rss in bytes and exit signal.
+    """
+    wall_limit = limits.get("wall_time")
+    output_limit = limits.get("output")
+    interval = POLL_MIN_INTERVAL
+    limit = None
+    rusage = None
+
+    while True:
+        if hasattr(os, "wait4"):
+            waited, status, rusage = os.wait4(pid, os.WNOHANG)
+            returncode = os.waitstatus_to_exitcode(status) if waited else None
+        else:
+            returncode = process.poll()
+
+        if returncode is not None:
+            break
+
+        if limit is None:
+            if wall_limit and time.perf_counter() - started > wall_limit:
+                limit = "wall_time"
+            elif output_limit and sum(_size(file) for file in outputs) > output_limit:
+                limit = "output"
+            if limit is not None:
+                kill_group(pid)
+
+        time.sleep(interval)
+        interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+    # Clean up anything the run left behind in its process group
+    kill_group(pid)
+    if process is not None:
+        process.returncode = returncode
+
+    exit_signal = None
+    if returncode < 0:
+        try:
+            exit_signal = signal.Signals(-returncode).name
+        except ValueError:
+            exit_signal = str(-returncode)
+    if limit is None and exit_signal == "SIGXCPU":
+        limit = "cpu_time"
+    # Past the soft CPU limit, the kernel kills with SIGKILL at the hard limit
+    if limit is None and exit_signal == "SIGKILL" and limits.get("cpu_time") and rusage:
+        if rusage.ru_utime + rusage.ru_stime >= limits["cpu_time"]:
+            limit = "cpu_time"
+    if limit is None and exit_signal == "SIGXFSZ":
+        limit = "file_size"
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = None
+    if rusage:
+        max_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+    return {
+        "returncode": returncode,
+        "limit": limit,
+        "metrics": {
+            "wall_time": round(time.perf_counter() - started, 4),
+            "cpu_time": round(rusage.ru_utime + rusage.ru_stime, 4) if rusage else None,
+            "max_rss": max_rss,
+            "signal": exit_signal,
+        },
+    }
+
+
+def read_capped(file: IO, limit: int = None) -> str:
+    """
+    Read a capture file from the start, keeping at most `limit` bytes.
+    """
+    file.seek(0)
+    data = file.read(limit + 1) if limit else file.read()
+    text = data[:limit].decode(errors="replace") if limit else data.decode(errors="replace")
+    if limit and len(data) > limit:
+        text += f"\n[output truncated at {limit} bytes]"
+    return text
+
+
+def detect_limit(limit: Union[str, None], error: str, limits: Dict) -> Union[str, None]:
+    """
+    Recognize memory and file-size limits from the error a Python run printed.
+    """
+    if limit is not None:
+        return limit
+    tail = error[-2000:]
+    if limits.get("memory") and "MemoryError" in tail:
+        return "memory"
+    if limits.get("file_size") and "File too large" in tail:
+        return "file_size"
+    return None
+
+
+def format_bytes(size: Union[int, None]) -> str:
+    if size is None:
+        return "unknown"
+    return f"{size / (1024 * 1024):.0f} MB"
+
+
+def describe_limit(limit: str, limits: Dict, metrics: Dict) -> str:
+    """
+    Explain which limit stopped a run, with its resource usage, for the next prompt.
+    """
+    reasons = {
+        "wall_time": f"it ran longer than the wall-clock limit of {limits.get('wall_time')} seconds",
+        "cpu_time": f"it used more than the CPU time limit of {limits.get('cpu_time')} seconds",
+        "memory": f"it ran out of the memory limit of {format_bytes(limits.get('memory'))}",
+        "file_size": f"it wrote a file larger than the limit of {format_bytes(limits.get('file_size'))}",
+        "output": f"it printed more than the output limit of {limits.get('output')} bytes",
+    }
+    cpu_time = metrics.get("cpu_time")
+    return (
+        f"The program was stopped because {reasons.get(limit, limit)}. "
+        f"Wall time: {metrics.get('wall_time')}s, "
+        f"CPU time: {'unknown' if cpu_time is None else f'{cpu_time}s'}, "
+        f"peak memory: {format_bytes(metrics.get('max_rss'))}. "
+        "Make the program finish quickly within these limits, e.g. avoid infinite "
+        "loops, unbounded data and excessive printing."
+    )
+
+
+def finish_run(
+    stdout_file: IO, stderr_file: IO, supervised: Dict, limits: Dict
+) -> Dict:
+    """
+    Build the result of a supervised run from its capture files.
+    """
+    output = read_capped(stdout_file, limits.get("output"))
+    error = read_capped(stderr_file, limits.get("output"))
+    limit = detect_limit(supervised["limit"], error, limits)
+    if limit is not None:
+        error = f"{error.rstrip()}\n\n{describe_limit(limit, limits, supervised['metrics'])}".lstrip()
+
+    return {
+        "output": output,
+        "error": error,
+        "returncode": supervised["returncode"],
+        "limit": limit,
+        "metrics": supervised["metrics"],
+    }
+
+
+def run_sandboxed(
+    args: List[str],
+    cwd: str,
+    limits: Dict,
+    on_start: Callable[[int], None] = None,
+    stdin: str = None,
+) -> Dict:
+    """
+    Run a command in its own process group under the given limits.
+
+    Parameters:
+    args (List[str]): The command.
+    cwd (str): The working directory.
+    limits (Dict): The run limits.
+    on_start (Callable[[int], None]): Called with the run's pid, e.g. to kill it.
+    stdin (str): Text fed to the command's standard input, which is otherwise empty.
+
+    Returns:
+    Dict: The output, error trace, return code, the limit that stopped the
+    run, if any, and the run metrics.
+    """
+    posix = os.name == "posix"
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file, tempfile.TemporaryFile() as stdin_file:
+        stdin_file.write((stdin or "").encode())
+        stdin_file.seek(0)
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            args,
+            cwd=cwd,
+            stdin=stdin_file,
+            stdout=stdout_file,
+            stderr=stderr_file,
+            start_new_session=posix,
+            preexec_fn=(lambda: apply_limits(limits)) if posix else None,
+        )
+        if on_start:
+            on_start(process.pid)
+        supervised = supervise(
+            process.pid, [stdout_file, stderr_file], limits, started, process
+        )
+        return finish_run(stdout_file, stderr_file, supervised, limits)
@@ -0,0 +1,118 @@
+import os
+import json
+import sqlite3
+from typing import Dict, List
+
+
+class SessionJournal:
+    """
+    Append-only journal for the session run and change logs.
+
+    Entries are stored as rows in a SQLite database so appending is O(1) and
+    reading the last entry, or the entries after a known id, is an indexed
+    lookup instead of a full parse of the session file.
+    """
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                log TEXT NOT NULL,
+                entry TEXT NOT NULL
+            )"""
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_log_id ON entries (log, id)"
+        )
+        self.connection.commit()
+
+    def append(self, log: str, entry: Dict) -> int:
+        """
+        Append an entry to a log.
+
+        Parameters:
+        log (str): Name of the log, e.g. "run_log" or "change_log".
+        entry (Dict): JSON serializable entry.
+
+        Returns:
+        int: The id of the new entry.
+        """
+        return self.extend(log, [entry])
+
+    def extend(self, log: str, entries: List[Dict]) -> int:
+        """
+        Append several entries to a log in a single transaction.
+
+        Returns:
+        int: The id of the last entry written, or 0 if nothing was written.
+        """
+        last_id = 0
+        with self.connection:
+            for entry in entries:
+                cursor = self.connection.execute(
+                    "INSERT INTO entries (log, entry) VALUES (?, ?)",
+                    (log, json.dumps(entry)),
+                )
+                last_id = cursor.lastrowid
+        return last_id
+
+    def last(self, log: str) -> Dict:
+        """
+        Return the most recent entry of a log, or an empty dict.
+        """
+        row = self.connection.execute(
+            "SELECT id, entry FROM entries WHERE log = ? ORDER BY id DESC LIMIT 1",
+            (log,),
+        ).fetchone()
+        return self._to_entry(row) if row else {}
+
+    def get(self, log: str, entry_id: int) -> Dict:
+        """
+        Return the entry of a log with the given id, or an empty dict.
+        """
+        row = self.connection.execute(
+            "SELECT id, entry FROM entries WHERE log = ? AND id = ?", (log, entry_id)
+        ).fetchone()
+        return self._to_entry(row) if row else {}
+
+    def since(self, log: str, entry_id: int = 0) -> List[Dict]:
+        """
+        Return all entries of a log with an id greater than `entry_id`.
+        """
+        rows = self.connection.execute(
+            "SELECT id, entry FROM entries WHERE log = ? AND id > ? ORDER BY id",
+            (log, entry_id),
+        ).fetchall()
+        return [self._to_entry(row) for row in rows]
+
+    def count(self, log: str) -> int:
+        """
+        Return the number of entries in a log.
+        """
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM entries WHERE log = ?", (log,)
+        ).fetchone()[0]
+
+    def clear(self) -> None:
+        """
+        Remove every entry from the journal.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM entries")
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @staticmethod
+    def _to_entry(row) -> Dict:
+        entry = json.loads(row[1])
+        entry["id"] = row[0]
+        return entry
@@ -0,0 +1,181 @@
+import ast
+import json
+from typing import List
+
+# SyntaxError messages that only mean the code seen so far is unfinished
+INCOMPLETE_SYNTAX_MARKERS = (
+    "was never closed",
+    "unexpected EOF",
+    "unterminated triple-quoted string",
+    "expected an indented block",
+    "EOF while scanning",
+)
+
+# Top-level lines that continue the previous statement rather than start a new one
+CONTINUATION_PREFIXES = (")", "]", "}", "else", "elif", "except", "finally", "#", "@")
+
+
+class StreamAbort(Exception):
+    """
+    Raised when a streamed response is clearly not in the requested format.
+    """
+
+
+class FenceStripper:
+    """
+    Removes markdown code fence lines from a stream of text chunks.
+    """
+
+    def __init__(self) -> None:
+        self._partial = ""
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consume a chunk and return the complete, non-fence lines it finished.
+        """
+        self._partial += chunk
+        *lines, self._partial = self._partial.split("\n")
+        return "".join(line + "\n" for line in lines if not self._is_fence(line))
+
+    def finish(self) -> str:
+        """
+        Return whatever is left of the last line.
+        """
+        rest, self._partial = self._partial, ""
+        return "" if self._is_fence(rest) else rest
+
+    @staticmethod
+    def _is_fence(line: str) -> bool:
+        return line.strip().startswith("```")
+
+
+class PythonStreamValidator:
+    """
+    Checks a growing Python source buffer for code that can never parse.
+
+    Each time a new top-level statement starts, everything before it must
+    already be valid Python. Errors that only mean the code is unfinished are
+    ignored until the stream ends.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self._checked_lines = 0
+
+    def feed(self, text: str) -> None:
+        self.buffer += text
+        lines = self.buffer.split("\n")[:-1]
+
+        for index in range(max(self._checked_lines, 1), len(lines)):
+            line = lines[index]
+            if not line.strip() or line[0] in " \t" or line.startswith(CONTINUATION_PREFIXES):
+                continue
+            self._check("\n".join(lines[:index]) + "\n", final=False)
+        self._checked_lines = len(lines)
+
+    def finish(self) -> str:
+        self._check(self.buffer, final=True)
+        return self.buffer
+
+    @staticmethod
+    def _check(source: str, final: bool) -> None:
+        try:
+            ast.parse(source)
+        except SyntaxError as e:
+            message = str(e.msg)
+            if not final and any(marker in message for marker in INCOMPLETE_SYNTAX_MARKERS):
+                return
+            raise StreamAbort(f"Response is not valid Python: {message} (line {e.lineno})")
+
+
+class JsonStreamValidator:
+    """
+    Tracks the bracket and string structure of a growing JSON buffer and fails
+    as soon as it can no longer become a single valid JSON object or array.
+    """
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._started = False
+        self._closed = False
+
+    def feed(self, text: str) -> None:
+        for char in text:
+            self._consume(char)
+        self.buffer += text
+
+    def _consume(self, char: str) -> None:
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+            return
+
+        if char.isspace():
+            return
+
+        if self._closed:
+            raise StreamAbort("Response has text after the JSON value.")
+
+        if not self._started:
+            if char not in "{[":
+                raise StreamAbort("Response does not start with a JSON object or array.")
+            self._started = True
+
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not self._stack or self._stack.pop() != char:
+                raise StreamAbort("Response has mismatched JSON brackets.")
+            if not self._stack:
+                self._closed = True
+
+    def finish(self) -> str:
+        try:
+            json.loads(self.buffer)
+        except json.JSONDecodeError as e:
+            raise StreamAbort(f"Response is not valid JSON: {e}")
+        return self.buffer
+
+
+class PatchStreamValidator:
+    """
+    Checks that a streamed patch starts with a SEARCH/REPLACE block or a diff.
+    """
+
+    PATCH_STARTS = ("<<<<<<<", "---", "+++", "@@", "diff ")
+
+    def __init__(self) -> None:
+        self.buffer = ""
+
+    def feed(self, text: str) -> None:
+        self.buffer += text
+        stripped = self.buffer.lstrip()
+        if "\n" in stripped and not stripped.startswith(self.PATCH_STARTS):
+            raise StreamAbort("Response does not start with a patch.")
+
+    def finish(self) -> str:
+        if not self.buffer.lstrip().startswith(self.PATCH_STARTS):
+            raise StreamAbort("Response does not start with a patch.")
+        return self.buffer
+
+
+def make_stream_validator(response_type: str):
+    """
+    Return the incremental validator for a response type.
+    """
+    if response_type == "code":
+        return PythonStreamValidator()
+    if response_type == "json":
+        return JsonStreamValidator()
+    if response_type == "patch":
+        return PatchStreamValidator()
+    raise ValueError(f"Invalid response_type: {response_type}")
@@ -1,2 +1,66 @@
-def truncate_string(s: str, length: int) -> str:
-    return s[:length]
+from functools import lru_cache
+
+from utils.constants import OPENAI_MODEL
+
+TRUNCATION_MARKER = "\n...[truncated]...\n"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = OPENAI_MODEL):
+    """
+    Return the tiktoken encoding for a model, cached per model name.
+
+    tiktoken is imported here rather than at module level to keep startup fast.
+    """
+    import tiktoken
+
+    return tiktoken.encoding_for_model(model_name)
+
+
+def count_tokens(text: str, model_name: str = OPENAI_MODEL) -> int:
+    """
+    Returns the number of tokens in a text string.
+    """
+    return len(get_encoding(model_name).encode(text))
+
+
+def truncate_tokens(
+    s: str, max_tokens: int, model_name: str = OPENAI_MODEL, keep: str = "head"
+) -> str:
+    """
+    Truncate a string to at most `max_tokens` tokens.
+
+    Parameters:
+    s (str): The string to truncate.
+    max_tokens (int): The token limit, including the truncation marker.
+    model_name (str): The model whose tokenizer is used.
+    keep (str): Which part to keep: "head", "tail" or "ends" (head and tail).
+
+    Returns:
+    str: The string unchanged if it fits, otherwise the kept part joined with a
+    truncation marker.
+    """
+    encoding = get_encoding(model_name)
+    tokens = encoding.encode(s)
+
+    if len(tokens) <= max_tokens:
+        return s
+
+    available = max_tokens - len(encoding.encode(TRUNCATION_MARKER))
+    if available <= 0:
+        return ""
+
+    if keep == "head":
+        return encoding.decode(tokens[:available]) + TRUNCATION_MARKER
+    if keep == "tail":
+        return TRUNCATION_MARKER + encoding.decode(tokens[-available:])
+    if keep == "ends":
+        head = available // 2
+        tail = available - head
+        return (
+            encoding.decode(tokens[:head])
+            + TRUNCATION_MARKER
+            + encoding.decode(tokens[-tail:] if tail else [])
+        )
+
+    raise ValueError(f"Invalid keep: {keep}")
@@ -0,0 +1,173 @@
+"""
+Warm interpreter worker, started by `utils.worker_pool.WorkerPool`.
+
+The worker reads one JSON request per line on stdin and writes one JSON reply
+per line on stdout. It imports dependencies once, then forks a fresh child for
+every run so each candidate starts from the same warm, clean interpreter.
+
+Requests:
+    {"preload": ["pandas", ...]}            -> {"loaded": [...]}
+    {"run": "dynamic_main/dynamic_main.py", "cwd": ".", "limits": {...},
+     "inputs": {"argv": [...], "stdin": "...", "args": [...]}}
+                                            -> {"pid": 123}, then
+                                               {"output": ..., "error": ..., "returncode": 0,
+                                                "limit": None, "metrics": {...}}
+
+Each run is its own process group, limited and supervised by `sandbox.py`.
+Only the standard library may be used here.
+"""
+import os
+import sys
+import json
+import time
+import runpy
+import atexit
+import tempfile
+import importlib
+import traceback
+import importlib.util
+
+
+def _load_sandbox():
+    # Loaded under a private name, so a candidate module called "sandbox" is not shadowed
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox.py")
+    spec = importlib.util.spec_from_file_location("_geneticml_sandbox", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+sandbox = _load_sandbox()
+
+
+def preload(names):
+    importlib.invalidate_caches()
+    loaded = []
+    for name in names:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except BaseException:
+            pass
+    return loaded
+
+
+def _candidate_traceback(error, script):
+    # Drop the worker and runpy frames so the trace matches `python script`
+    tb = error.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != script:
+        tb = tb.tb_next
+    return tb or error.__traceback__
+
+
+def run_child(script, cwd, inputs, stdin_fd, stdout_fd, stderr_fd):
+    """
+    Run a script in the forked child and exit with its return code.
+
+    The script runs as __main__ with `inputs["argv"]`, or, when `inputs["args"]`
+    is given, is loaded as a module whose main(*args) is called and its
+    return value printed.
+    """
+    returncode = 0
+    try:
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.chdir(cwd)
+
+        sys.argv = [script, *inputs.get("argv", [])]
+        script = os.path.abspath(script)
+        sys.path.insert(0, os.path.dirname(script))
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+
+        try:
+            if inputs.get("args") is not None:
+                sys.argv = sys.argv[:1]
+                namespace = runpy.run_path(script, run_name="__candidate__")
+                result = namespace["main"](*inputs["args"])
+                if result is not None:
+                    print(result)
+            else:
+                runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            if e.code is None:
+                returncode = 0
+            elif isinstance(e.code, int):
+                returncode = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException as e:
+            traceback.print_exception(type(e), e, _candidate_traceback(e, script))
+            returncode = 1
+
+        atexit._run_exitfuncs()
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except BaseException:
+                pass
+        os._exit(returncode & 0xFF)
+
+
+def run(script, cwd, limits, inputs, reply):
+    with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file, tempfile.TemporaryFile() as stdin_file:
+        stdin_file.write((inputs.get("stdin") or "").encode())
+        stdin_file.seek(0)
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.setsid()
+            sandbox.apply_limits(limits)
+            run_child(
+                script,
+                cwd,
+                inputs,
+                stdin_file.fileno(),
+                stdout_file.fileno(),
+                stderr_file.fileno(),
+            )
+
+        reply({"pid": pid})
+        supervised = sandbox.supervise(pid, [stdout_file, stderr_file], limits, started)
+        return sandbox.finish_run(stdout_file, stderr_file, supervised, limits)
+
+
+def serve():
+    # Keep a private copy of stdout for replies; stray prints from imports go nowhere
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # Imports resolve like in a fresh interpreter, not from this script's folder
+    sys.path.pop(0)
+
+    def reply(message):
+        protocol.write(json.dumps(message) + "\n")
+
+    preload(sys.argv[1:])
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        if "preload" in request:
+            reply({"loaded": preload(request["preload"])})
+        elif "run" in request:
+            reply(
+                run(
+                    request["run"],
+                    request.get("cwd", "."),
+                    request.get("limits", {}),
+                    request.get("inputs", {}),
+                    reply,
+                )
+            )
+
+
+if __name__ == "__main__":
+    serve()
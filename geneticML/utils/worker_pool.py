@@ -0,0 +1,206 @@
+import os
+import json
+import queue
+import atexit
+import threading
+import subprocess
+from typing import Callable, Dict, Iterable, List
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_worker.py")
+
+
+class WorkerError(RuntimeError):
+    """
+    Raised when a warm worker dies or answers out of protocol.
+    """
+
+
+def fork_supported() -> bool:
+    """
+    Warm workers fork a child per run, which needs os.fork and os.wait4.
+    """
+    return hasattr(os, "fork") and hasattr(os, "wait4")
+
+
+class WarmWorker:
+    """
+    One warm interpreter process running `warm_worker.py`.
+    """
+
+    def __init__(self, python: str, preload: Iterable[str] = ()) -> None:
+        self.loaded = set(preload)
+        try:
+            self.process = subprocess.Popen(
+                [python, WORKER_SCRIPT, *sorted(self.loaded)],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1,
+            )
+        except OSError as e:
+            raise WorkerError(f"Could not start a warm worker: {e}")
+        self._receive("ready")
+
+    def _send(self, message: Dict) -> None:
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerError(f"Warm worker is not running: {e}")
+
+    def _receive(self, key: str) -> Dict:
+        line = self.process.stdout.readline()
+        if not line:
+            raise WorkerError("Warm worker exited unexpectedly.")
+        message = json.loads(line)
+        if key not in message:
+            raise WorkerError(f"Unexpected warm worker reply: {message}")
+        return message
+
+    def preload(self, names: Iterable[str]) -> None:
+        names = sorted(set(names) - self.loaded)
+        if names:
+            self._send({"preload": names})
+            self._receive("loaded")
+            self.loaded.update(names)
+
+    def run(
+        self,
+        script: str,
+        cwd: str,
+        limits: Dict,
+        on_start: Callable[[int], None] = None,
+        inputs: Dict = None,
+    ) -> Dict:
+        self._send(
+            {
+                "run": script,
+                "cwd": os.path.abspath(cwd),
+                "limits": limits,
+                "inputs": inputs or {},
+            }
+        )
+        pid = self._receive("pid")["pid"]
+        if on_start:
+            on_start(pid)
+        return self._receive("returncode")
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        if self.alive():
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class WorkerPool:
+    """
+    Pool of pre-warmed interpreters that run scripts in fresh forks.
+
+    Each worker imports the requested dependencies once. Every run forks a
+    child of the warm worker, so a candidate starts without interpreter
+    startup or import cost, but in a clean `__main__` namespace of its own.
+    Output, errors and the return code match running `python script` in `cwd`.
+
+    Workers are started lazily, up to `size` of them, and each runs one
+    script at a time. A worker that dies is replaced on the next run.
+    """
+
+    def __init__(self, size: int, python: str = "python") -> None:
+        self.size = size
+        self.python = python
+        self.preloaded = set()
+        self._idle = queue.Queue()
+        self._started = 0
+        self._workers: List[WarmWorker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        atexit.register(self.close)
+
+    def preload(self, names: Iterable[str]) -> None:
+        """
+        Add dependencies for the workers to import before their next run.
+        """
+        self.preloaded.update(names)
+
+    def _acquire(self) -> WarmWorker:
+        with self._lock:
+            if self._closed:
+                raise WorkerError("Worker pool is closed.")
+            if self._idle.empty() and self._started < self.size:
+                self._started += 1
+                start = True
+            else:
+                start = False
+
+        if not start:
+            return self._idle.get()
+
+        try:
+            worker = WarmWorker(self.python, self.preloaded)
+        except BaseException:
+            with self._lock:
+                self._started -= 1
+            raise
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _release(self, worker: WarmWorker) -> None:
+        if worker.alive() and not self._closed:
+            self._idle.put(worker)
+            return
+        worker.close()
+        with self._lock:
+            self._started -= 1
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def run(
+        self,
+        script: str,
+        cwd: str = ".",
+        limits: Dict = None,
+        on_start: Callable[[int], None] = None,
+        inputs: Dict = None,
+    ) -> Dict:
+        """
+        Run a script in a fresh fork of a warm worker.
+
+        Parameters:
+        script (str): The script path, relative to `cwd`.
+        cwd (str): The working directory of the run.
+        limits (Dict): Resource limits for the run, see `utils.sandbox`.
+        on_start (Callable[[int], None]): Called with the pid of the forked run,
+            e.g. to kill it.
+        inputs (Dict): Test case inputs: argv, stdin, or args for main().
+
+        Returns:
+        Dict: The output, error trace, return code, limit hit and metrics of the run.
+        """
+        worker = self._acquire()
+        try:
+            worker.preload(self.preloaded)
+            return worker.run(script, cwd, limits or {}, on_start, inputs)
+        except WorkerError:
+            worker.process.kill()
+            raise
+        finally:
+            self._release(worker)
+
+    def close(self) -> None:
+        """
+        Stop every worker.
+        """
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.close()
+
@@ -0,0 +1,224 @@
+import os
+import atexit
+import hashlib
+import threading
+from typing import Dict, List, NamedTuple, Union
+
+from utils.constants import DYNAMIC_FOLDER
+from utils.file_operations import make_directory, delete_directory
+
+
+class WorkspaceFile(NamedTuple):
+    # None for a file that is not UTF-8 text, e.g. an image or a pickle
+    content: Union[str, None]
+    hash: str
+    size: int
+    # Modification time on disk in nanoseconds, None until the file is written out
+    mtime: Union[int, None]
+
+
+def _entry(content: str, stat: os.stat_result = None) -> WorkspaceFile:
+    data = content.encode("utf-8")
+    if stat is None:
+        return WorkspaceFile(content, hashlib.sha256(data).hexdigest(), len(data), None)
+    # Sizes and mtimes of files on disk come from disk, to compare with later scans
+    return WorkspaceFile(
+        content, hashlib.sha256(data).hexdigest(), stat.st_size, stat.st_mtime_ns
+    )
+
+
+def _read_entry(file_path: str, stat: os.stat_result) -> WorkspaceFile:
+    with open(file_path, "rb") as f:
+        data = f.read()
+    try:
+        # Translate newlines like reading in text mode
+        content = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    except UnicodeDecodeError:
+        return WorkspaceFile(
+            None, hashlib.sha256(data).hexdigest(), stat.st_size, stat.st_mtime_ns
+        )
+    return _entry(content, stat)
+
+
+class Workspace:
+    """
+    In-memory index of the files in a directory, with their content, hash,
+    size and modification time.
+
+    Reads are served from the index. Writes and deletes only change the
+    index and are written to disk by `materialize`, which is called before a
+    candidate runs in the directory. `refresh` rescans the directory once and
+    re-reads only the files whose size or mtime changed, e.g. edited by hand.
+
+    Like `list_files`, only the files directly in the directory are indexed,
+    keyed by paths that include the directory, e.g. "dynamic_main/utils.py".
+    Files that are not UTF-8 text, such as images or pickles the program
+    writes, are indexed by hash, size and mtime only. They are left out of
+    `paths` and `contents`, so they never reach prompts or the repo map, and
+    are not removed by `replace`.
+    """
+
+    def __init__(self, root: str = DYNAMIC_FOLDER) -> None:
+        self.root = root
+        self.files: Dict[str, WorkspaceFile] = {}
+        # Paths written or deleted in memory but not yet on disk
+        self.dirty = set()
+        self._lock = threading.RLock()
+        self._scanned = False
+
+    def _path(self, file_path: str) -> str:
+        return os.path.normpath(file_path)
+
+    def refresh(self) -> None:
+        """
+        Sync the index with the directory, keeping unwritten changes.
+        """
+        with self._lock:
+            seen = set()
+            if os.path.isdir(self.root):
+                with os.scandir(self.root) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                        file_path = self._path(os.path.join(self.root, entry.name))
+                        seen.add(file_path)
+                        if file_path in self.dirty:
+                            continue
+                        stat = entry.stat()
+                        known = self.files.get(file_path)
+                        if (
+                            known
+                            and known.mtime == stat.st_mtime_ns
+                            and known.size == stat.st_size
+                        ):
+                            continue
+                        self.files[file_path] = _read_entry(file_path, stat)
+
+            for file_path in list(self.files):
+                if file_path not in seen and file_path not in self.dirty:
+                    del self.files[file_path]
+            self._scanned = True
+
+    def _ensure_scanned(self) -> None:
+        if not self._scanned:
+            self.refresh()
+
+    def _text_paths(self) -> List[str]:
+        return sorted(
+            file_path
+            for file_path, entry in self.files.items()
+            if entry.content is not None
+        )
+
+    def paths(self) -> List[str]:
+        """
+        Return the paths of the text files.
+        """
+        with self._lock:
+            self._ensure_scanned()
+            return self._text_paths()
+
+    def exists(self, file_path: str) -> bool:
+        with self._lock:
+            self._ensure_scanned()
+            return self._path(file_path) in self.files
+
+    def read(self, file_path: str) -> str:
+        with self._lock:
+            self._ensure_scanned()
+            entry = self.files.get(self._path(file_path))
+            if entry is None:
+                raise FileNotFoundError(f"No such file in the workspace: '{file_path}'")
+            if entry.content is None:
+                raise ValueError(f"Not a text file: '{file_path}'")
+            return entry.content
+
+    def get(self, file_path: str) -> Union[WorkspaceFile, None]:
+        with self._lock:
+            self._ensure_scanned()
+            return self.files.get(self._path(file_path))
+
+    def contents(self) -> Dict[str, str]:
+        """
+        Return every text file's content keyed by path, like `read_directory`.
+        """
+        with self._lock:
+            self._ensure_scanned()
+            return {
+                file_path: self.files[file_path].content for file_path in self._text_paths()
+            }
+
+    def write(self, file_path: str, content: str) -> None:
+        with self._lock:
+            self._ensure_scanned()
+            file_path = self._path(file_path)
+            known = self.files.get(file_path)
+            if known and known.content == content:
+                return
+            self.files[file_path] = _entry(content)
+            self.dirty.add(file_path)
+
+    def delete(self, file_path: str) -> None:
+        with self._lock:
+            self._ensure_scanned()
+            file_path = self._path(file_path)
+            if self.files.pop(file_path, None) is not None:
+                self.dirty.add(file_path)
+
+    def replace(self, files: Dict[str, str]) -> None:
+        """
+        Make the workspace hold exactly the given files.
+        """
+        with self._lock:
+            for file_path in set(self.paths()) - {self._path(path) for path in files}:
+                self.delete(file_path)
+            for file_path, content in files.items():
+                self.write(file_path, content)
+
+    def materialize(self) -> None:
+        """
+        Write the changes made in memory to disk.
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            make_directory(self.root)
+            for file_path in sorted(self.dirty):
+                entry = self.files.get(file_path)
+                if entry is None:
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                    continue
+                make_directory(os.path.dirname(file_path))
+                with open(file_path, "w") as f:
+                    f.write(entry.content)
+                stat = os.stat(file_path)
+                self.files[file_path] = entry._replace(
+                    size=stat.st_size, mtime=stat.st_mtime_ns
+                )
+            self.dirty.clear()
+
+    def clear(self) -> None:
+        """
+        Delete the directory and empty the index.
+        """
+        with self._lock:
+            delete_directory(self.root)
+            self.files.clear()
+            self.dirty.clear()
+            self._scanned = False
+
+
+_workspace = None
+
+
+def get_workspace() -> Workspace:
+    """
+    Return the workspace of the dynamic folder. Unwritten changes are written
+    to disk at exit.
+    """
+    global _workspace
+    if _workspace is None:
+        _workspace = Workspace(DYNAMIC_FOLDER)
+        atexit.register(_workspace.materialize)
+    return _workspace
@@ -0,0 +1,60 @@
+"""
+Tests for the language model rate limiter.
+
+Usage:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "geneticML")
+)
+
+from utils.rate_limiter import RequestScheduler, TokenBucket
+
+
+class RateLimiterAcrossEventLoopsTest(unittest.TestCase):
+    """
+    The scheduler is a process-wide singleton, while every speculative
+    iteration runs its own `asyncio.run`.
+    """
+
+    def test_contended_scheduler_in_two_loops(self):
+        scheduler = RequestScheduler(
+            requests_per_minute=6000, tokens_per_minute=60000, max_in_flight=1
+        )
+        in_flight = 0
+        peak = 0
+
+        async def call():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return "done"
+
+        async def race():
+            return await asyncio.gather(*(scheduler.run(call, 10) for _ in range(3)))
+
+        for _ in range(2):
+            self.assertEqual(asyncio.run(race()), ["done"] * 3)
+        self.assertEqual(peak, 1)
+
+    def test_throttled_bucket_in_two_loops(self):
+        bucket = TokenBucket(120)
+
+        async def drain(amounts):
+            await asyncio.gather(*(bucket.acquire(amount) for amount in amounts))
+
+        asyncio.run(drain([120, 1, 1]))
+        # The second loop waits on the tokens the first one used up
+        asyncio.run(drain([1, 1]))
+        self.assertLess(bucket.tokens, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()